@@ -0,0 +1,74 @@
+# Benchmark ==========================================================
+#
+# Compares the full-tree parse of request_and_parse with the targeted,
+# partial parse of an extraction spec, for each installed parser
+# backend. Every mode runs in its own process so that the reported
+# peak resident set size belongs to that mode alone.
+#
+# Usage: python -m benchmarks.bench_extraction [--pages N] [--padding-bytes B]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+# Third-party Libraries
+from bs4 import BeautifulSoup
+
+# Local Application Libraries
+from pricepal.common.extraction import ExtractionSpec, available_parser, extract
+from pricepal.testing.stand_ins import make_product_page
+
+# Constants ===========================================================
+
+SPEC = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                                            "stock": {"tag": "span", "attrs": {"class": "stock"}}}})
+
+# =====================================================================
+
+def run_mode(mode: str, pages: int, padding_bytes: int) -> dict:
+    """Parses the fixture pages in a single mode, returning pages/s and peak RSS in MiB."""
+
+    kind, parser = mode.split(":")
+    page = make_product_page(padding_bytes=padding_bytes)
+    start = time.perf_counter()
+    for _ in range(pages):
+        if kind == "full":
+            soup = BeautifulSoup(page, parser)
+            values = {"price": soup.find("span", class_="price").get_text(strip=True),
+                      "stock": soup.find("span", class_="stock").get_text(strip=True)}
+        else:
+            values = extract(page, SPEC, parser)
+    elapsed = time.perf_counter() - start
+    assert values["price"] == "$19.99"
+    return {"mode": mode, "pages_per_second": pages / elapsed,
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def main():
+    arguments = argparse.ArgumentParser(description="Full-tree versus targeted extraction parse.")
+    arguments.add_argument("--pages", type=int, default=100)
+    arguments.add_argument("--padding-bytes", type=int, default=500000)
+    arguments.add_argument("--mode", help=argparse.SUPPRESS)
+    options = arguments.parse_args()
+
+    if options.mode:
+        print(json.dumps(run_mode(options.mode, options.pages, options.padding_bytes)))
+        return
+
+    parsers = sorted({"html.parser", available_parser()})
+    modes = [f"{kind}:{parser}" for parser in parsers for kind in ("full", "targeted")]
+    print(f"pages={options.pages} page_size~{options.padding_bytes} bytes")
+    for mode in modes:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_extraction", "--mode", mode,
+                                 "--pages", str(options.pages), "--padding-bytes", str(options.padding_bytes)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print(f"{mode:<22} {result['pages_per_second']:8.1f} pages/s  peak RSS {result['peak_rss_mib']:7.1f} MiB")
+
+if __name__ == '__main__':
+    main()
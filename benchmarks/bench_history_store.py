@@ -0,0 +1,86 @@
+# Benchmark ==========================================================
+#
+# Measures insert throughput and query latency of the HistoryStore.
+# The store is filled with one segment per simulated sweep, then
+# queried for the history of single products over a time range, and
+# for the latest price of all products, before and after compaction.
+#
+# Usage: python -m benchmarks.bench_history_store [--products N] [--sweeps N]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import statistics
+import tempfile
+import time
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore
+
+# =====================================================================
+
+def time_queries(store: HistoryStore, products: int, sweeps: int, repeats: int = 200) -> dict:
+    """Returns the median latency in milliseconds of each query type."""
+
+    start = pd.Timestamp("2026-01-01", tz="UTC")
+    rng = np.random.default_rng(1)
+    product_latency, range_latency = [], []
+    for product_id in rng.integers(0, products, repeats):
+        began = time.perf_counter()
+        store.history(int(product_id))
+        product_latency.append(time.perf_counter() - began)
+
+        began = time.perf_counter()
+        store.history(int(product_id), start + pd.Timedelta(hours=sweeps - 90), start + pd.Timedelta(hours=sweeps))
+        range_latency.append(time.perf_counter() - began)
+
+    latest_latency = []
+    for _ in range(5):
+        began = time.perf_counter()
+        store.latest()
+        latest_latency.append(time.perf_counter() - began)
+
+    return {"product": statistics.median(product_latency) * 1000,
+            "product_range": statistics.median(range_latency) * 1000,
+            "latest_all": statistics.median(latest_latency) * 1000}
+
+def main():
+    arguments = argparse.ArgumentParser(description="HistoryStore insert throughput and query latency.")
+    arguments.add_argument("--products", type=int, default=100000)
+    arguments.add_argument("--sweeps", type=int, default=100)
+    options = arguments.parse_args()
+
+    rows = options.products * options.sweeps
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(directory)
+        product_ids = np.random.default_rng(0).permutation(options.products)
+        start = pd.Timestamp("2026-01-01", tz="UTC")
+
+        elapsed = 0.0
+        for sweep in range(options.sweeps):
+            batch = pd.DataFrame({"product_id": product_ids,
+                                  "ts": np.full(options.products, (start + pd.Timedelta(hours=sweep)).value),
+                                  "price_cents": np.random.default_rng(sweep).integers(100, 100000, options.products),
+                                  "stock": np.int32(sweep % 7)})
+            began = time.perf_counter()
+            store.append(batch)
+            elapsed += time.perf_counter() - began
+
+        print(f"rows={rows:,} products={options.products:,} segments={len(store.segments)}")
+        print(f"insert           : {rows / elapsed:,.0f} rows/s ({elapsed:.1f}s)")
+        for label in ("segmented", "compacted"):
+            if label == "compacted":
+                began = time.perf_counter()
+                store.compact()
+                print(f"compact          : {time.perf_counter() - began:.1f}s to {len(store.segments)} segments")
+            latency = time_queries(HistoryStore(directory), options.products, options.sweeps)
+            print(f"{label:<10} product history {latency['product']:7.2f} ms  "
+                  f"last-90 range {latency['product_range']:7.2f} ms  latest(all) {latency['latest_all']:7.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Benchmark ==========================================================
+#
+# Measures the throughput of the normalization stage over a sweep of
+# raw price and stock strings, against parsing each value on its own
+# with the same expressions. Sweeps are drawn from a limited number of
+# distinct strings, as real sweeps are, and from all distinct strings.
+#
+# Usage: python -m benchmarks.bench_normalize [--rows N] [--distinct N]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import time
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.normalize import normalize_prices, normalize_stock
+
+# =====================================================================
+
+FORMATS = ("${:,.2f}", "{:,.2f} €", "CAD {:.2f}", "£{:.2f}")
+STOCK = ("1", "5+", "-", "In Stock", "Only 3 left", "Sold out", "", "ask")
+
+def make_prices(count: int, rng: np.random.Generator) -> list:
+    amounts = rng.integers(100, 500000, count) / 100
+    formats = rng.integers(0, len(FORMATS), count)
+    prices = [FORMATS[style].format(amount) for amount, style in zip(amounts, formats)]
+    # Euro prices use the continental separators
+    return [price.replace(",", " ").replace(".", ",") if price.endswith("€") else price for price in prices]
+
+def one_at_a_time(prices: list, stock: list):
+    """Normalizes every value on its own, as a per-row loop over the sweep would."""
+    for price in prices:
+        normalize_prices([price])
+    for value in stock:
+        normalize_stock([value])
+
+def main():
+    arguments = argparse.ArgumentParser(description="Normalization throughput over a sweep of raw strings.")
+    arguments.add_argument("--rows", type=int, default=1000000)
+    arguments.add_argument("--distinct", type=int, default=20000)
+    arguments.add_argument("--loop-rows", type=int, default=2000)
+    options = arguments.parse_args()
+
+    rng = np.random.default_rng(0)
+    stock = list(rng.choice(STOCK, options.rows))
+    sweeps = {"repeated": list(rng.choice(make_prices(options.distinct, rng), options.rows)),
+              "distinct": make_prices(options.rows, rng)}
+
+    for label, prices in sweeps.items():
+        began = time.perf_counter()
+        normalized, rejects = normalize_prices(pd.Series(prices))
+        normalize_stock(pd.Series(stock))
+        elapsed = time.perf_counter() - began
+        print(f"{label:<9} vectorized : {options.rows / elapsed:>12,.0f} rows/s  "
+              f"({elapsed:.2f}s, {normalized['price_cents'].notna().sum():,} prices, {len(rejects):,} rejects)")
+
+    began = time.perf_counter()
+    one_at_a_time(sweeps["distinct"][:options.loop_rows], stock[:options.loop_rows])
+    elapsed = time.perf_counter() - began
+    print(f"one value at a time : {options.loop_rows / elapsed:>12,.0f} rows/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Benchmark ==========================================================
+#
+# Measures extraction throughput of the ParsePool as the number of
+# worker processes grows from 1 to N, along with the single-process
+# in-line extraction it replaces. Pages are generated in memory so
+# that the figures reflect the parse stage alone.
+#
+# Usage: python -m benchmarks.bench_parse_pool [--pages N] [--max-workers N]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import os
+import time
+
+# Local Application Libraries
+from pricepal.common.extraction import ExtractionSpec, extract
+from pricepal.common.parse_pool import ParsePool
+from pricepal.testing.stand_ins import make_product_page
+
+# Constants ===========================================================
+
+SPEC = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                                            "stock": {"tag": "span", "attrs": {"class": "stock"}}}})
+
+# =====================================================================
+
+def main():
+    arguments = argparse.ArgumentParser(description="ParsePool throughput by worker count.")
+    arguments.add_argument("--pages", type=int, default=400)
+    arguments.add_argument("--padding-bytes", type=int, default=100000)
+    arguments.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    options = arguments.parse_args()
+
+    page = make_product_page(padding_bytes=options.padding_bytes)
+    pages = [(f"page-{i}", page) for i in range(options.pages)]
+
+    start = time.perf_counter()
+    for _, content in pages:
+        extract(content, SPEC)
+    inline = options.pages / (time.perf_counter() - start)
+
+    print(f"pages={options.pages} page_size~{options.padding_bytes} bytes cores={os.cpu_count()}")
+    print(f"in-line    : {inline:8.1f} pages/s")
+    for workers in range(1, options.max_workers + 1):
+        with ParsePool(SPEC, workers=workers) as pool:
+            start = time.perf_counter()
+            for _ in pool.extract_many(pages):
+                pass
+            rate = options.pages / (time.perf_counter() - start)
+        print(f"workers={workers:<3}: {rate:8.1f} pages/s  scaling {rate / inline:4.2f}x")
+
+if __name__ == '__main__':
+    main()
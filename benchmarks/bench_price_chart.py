@@ -0,0 +1,81 @@
+# Benchmark ==========================================================
+#
+# Measures the redraw time of a price chart holding a long series,
+# against plotting the full series on a plain matplotlib line. The
+# chart is timed for a full redraw, for appending a point by blitting,
+# and for a zoom which requeries and downsamples the visible range.
+# Figures are drawn with the Agg backend, so no display is required.
+#
+# Usage: python -m benchmarks.bench_price_chart [--points N] [--repeat N]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import time
+
+# Third-party Libraries
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Local Application Libraries
+from pricepal.gui.price_chart import PriceChart
+
+# =====================================================================
+
+def make_series(points: int) -> tuple:
+    # A random walk of prices, one point a minute
+    rng = np.random.default_rng(0)
+    x = 18000 + np.arange(points) / 1440
+    y = 100 + np.cumsum(rng.normal(0, 0.05, points))
+    return x, y
+
+def make_axes():
+    figure = Figure(figsize=(12, 4), dpi=100)
+    FigureCanvasAgg(figure)
+    return figure.add_subplot(111)
+
+def timed(function, repeat: int) -> float:
+    # Returns the median milliseconds of a call
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the redraw time of the price chart.")
+    parser.add_argument("--points", type=int, default=1000000, help="points in the series")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats of each measurement")
+    args = parser.parse_args()
+    x, y = make_series(args.points)
+
+    axes = make_axes()
+    axes.plot(x, y)
+    plain = timed(axes.figure.canvas.draw, args.repeat)
+
+    axes = make_axes()
+    chart = PriceChart(axes)
+    chart.set_series("product", x, y)
+    axes.figure.canvas.draw()
+    redraw = timed(axes.figure.canvas.draw, args.repeat)
+    drawn = len(chart.series["product"].line.get_xdata())
+
+    step = iter(range(1, args.repeat + 1))
+    last = float(y[-1])
+    extend = timed(lambda: chart.append("product", [x[-1] + next(step) / 1e6], [last]), args.repeat)
+
+    # Zoom to alternating halves, requerying and downsampling each view
+    halves = iter([(x[0], x[len(x) // 2]), (x[len(x) // 2], x[-1])] * args.repeat)
+    zoom = timed(lambda: (axes.set_xlim(*next(halves)), axes.figure.canvas.draw()), args.repeat)
+
+    print(f"points: {args.points:,}, drawn after downsampling: {drawn:,}")
+    print(f"plain line full draw:      {plain:9.1f} ms")
+    print(f"chart full draw:           {redraw:9.1f} ms")
+    print(f"chart append (blit):       {extend:9.1f} ms")
+    print(f"chart zoom (requery+draw): {zoom:9.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Benchmark ==========================================================
+#
+# Compares a serial sweep of request_and_parse against the concurrent
+# request_and_parse_many batch entry point. Both sweeps run against a
+# local fixture server which injects a fixed latency per response, so
+# the result reflects round-trip bound behaviour without the internet.
+#
+# Usage: python -m benchmarks.bench_request_and_parse_many [--pages N] [--latency S]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import time
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# =====================================================================
+
+def run(pages: int, latency: float, padding_bytes: int, max_workers: int, max_per_host: int, hosts: int) -> dict:
+    """Runs both sweeps and returns the elapsed time of each in seconds."""
+
+    fixture_pages = {f"/p/{i}": make_product_page(padding_bytes=padding_bytes) for i in range(pages)}
+    servers = [FixtureHTTPServer(fixture_pages, latency=latency).start() for _ in range(hosts)]
+    try:
+        urls = [servers[i % hosts].url(f"/p/{i}") for i in range(pages)]
+
+        start = time.perf_counter()
+        for url in urls:
+            scraper.request_and_parse(url)
+        serial = time.perf_counter() - start
+        serial_connections = sum(server.connections for server in servers)
+
+        start = time.perf_counter()
+        for _ in scraper.request_and_parse_many(urls, max_workers=max_workers, max_per_host=max_per_host):
+            pass
+        batch = time.perf_counter() - start
+    finally:
+        for server in servers:
+            server.stop()
+
+    return {"serial": serial, "batch": batch, "serial_connections": serial_connections,
+            "batch_connections": sum(server.connections for server in servers) - serial_connections}
+
+def main():
+    arguments = argparse.ArgumentParser(description="Serial versus batch request_and_parse sweep.")
+    arguments.add_argument("--pages", type=int, default=200)
+    arguments.add_argument("--latency", type=float, default=0.05)
+    arguments.add_argument("--padding-bytes", type=int, default=5000)
+    arguments.add_argument("--max-workers", type=int, default=scraper.DEFAULT_MAX_WORKERS)
+    arguments.add_argument("--max-per-host", type=int, default=scraper.DEFAULT_MAX_PER_HOST)
+    arguments.add_argument("--hosts", type=int, default=4)
+    options = arguments.parse_args()
+
+    result = run(options.pages, options.latency, options.padding_bytes,
+                 options.max_workers, options.max_per_host, options.hosts)
+
+    print(f"pages={options.pages} latency={options.latency}s hosts={options.hosts}")
+    print(f"serial  : {result['serial']:.2f}s  {options.pages / result['serial']:.1f} pages/s  "
+          f"{result['serial_connections']} connections")
+    print(f"batch   : {result['batch']:.2f}s  {options.pages / result['batch']:.1f} pages/s  "
+          f"{result['batch_connections']} connections")
+    print(f"speedup : {result['serial'] / result['batch']:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Benchmark ==========================================================
+#
+# Measures the time the RuleEngine takes to evaluate a sweep. A table
+# of rules of every kind is spread over the products, and a sweep of
+# every product is evaluated in full, then incrementally, with only a
+# fraction of the products changed since the previous sweep.
+#
+# Usage: python -m benchmarks.bench_rules [--rules N] [--products N] [--changed F]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import statistics
+import time
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.notification.rules import RULE_KINDS, RuleEngine
+
+# =====================================================================
+
+def make_rules(rules: int, products: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Returns a table of rules of every kind spread uniformly over the products."""
+    kinds = rng.choice(RULE_KINDS, rules)
+    threshold = np.where(kinds == "drop_pct", rng.uniform(5, 50, rules), rng.integers(500, 50000, rules))
+    return pd.DataFrame({"rule_id": np.arange(rules), "product_id": rng.integers(0, products, rules),
+                         "kind": kinds, "threshold": threshold,
+                         "receiver_email": rng.choice([f"user{index}@localhost" for index in range(1000)], rules)})
+
+def make_sweep(prices: np.ndarray, stock: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({"product_id": np.arange(len(prices)), "price_cents": prices, "stock": stock})
+
+def main():
+    arguments = argparse.ArgumentParser(description="RuleEngine evaluation time over full and incremental sweeps.")
+    arguments.add_argument("--rules", type=int, default=1000000)
+    arguments.add_argument("--products", type=int, default=250000)
+    arguments.add_argument("--changed", type=float, default=0.02)
+    arguments.add_argument("--sweeps", type=int, default=10)
+    options = arguments.parse_args()
+
+    rng = np.random.default_rng(0)
+    began = time.perf_counter()
+    engine = RuleEngine(make_rules(options.rules, options.products, rng))
+    print(f"rules={len(engine):,} products={options.products:,} load {time.perf_counter() - began:.2f}s")
+
+    prices = rng.integers(500, 50000, options.products)
+    stock = rng.integers(0, 5, options.products).astype(np.int32)
+    engine.evaluate(make_sweep(prices, stock))
+
+    for label, changed_only in (("full", False), ("incremental", True)):
+        latency, alerts = [], 0
+        for _ in range(options.sweeps):
+            changed = rng.random(options.products) < options.changed
+            prices = np.where(changed, (prices * rng.uniform(0.6, 1.2, options.products)).astype(np.int64), prices)
+            stock = np.where(changed, rng.integers(0, 5, options.products), stock).astype(np.int32)
+            sweep = make_sweep(prices, stock)
+            began = time.perf_counter()
+            alerts += len(engine.evaluate(sweep, changed_only=changed_only))
+            latency.append(time.perf_counter() - began)
+        median = statistics.median(latency)
+        print(f"{label:<12}: {median * 1000:8.1f} ms/sweep  {options.rules / median:>14,.0f} rules/s  "
+              f"alerts/sweep {alerts / options.sweeps:,.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Benchmark ==========================================================
+#
+# Runs the offline benchmark suite. Each case drives a public function
+# of the scrape engine or notification module at scale, against a local
+# fixture HTTP server, with configurable latency, page size and share
+# of error responses, or a local SMTP sink, so that runs are repeatable
+# and need neither the internet nor a mailbox.
+#
+# Each case reports its throughput, p50 and p99 latency per call and
+# the peak memory allocated by Python during its calls, as JSON. A run
+# can be saved as a baseline, and a later run compared against it; any
+# case which has regressed beyond the tolerance fails the run. A run
+# with a different workload, such as another --pages or --latency, is
+# not compared against the baseline, as its results are not comparable.
+#
+# Usage: python -m benchmarks.bench_suite [--calls N] [--output FILE]
+#            [--save-baseline FILE | --baseline FILE [--tolerance F]]
+#
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+import pricepal.notification.notification as notification
+from pricepal.testing.stand_ins import FixtureHTTPServer, SMTPSink, make_product_page
+
+# Constants ===========================================================
+
+DEFAULT_TOLERANCE = 0.25
+# Fraction by which a case may be slower, or use more memory, than its baseline before it is a regression.
+
+P99_FLOOR_MS = 1.0
+# Increase in p99 latency below which a case is not a regression, as sub-millisecond tails are mostly noise.
+
+MEMORY_CALLS = 20
+# Calls of each case made under tracemalloc, separately from the timed calls it would slow down.
+
+WORKLOAD_OPTIONS = ("calls", "pages", "page_bytes", "latency", "error_every", "smtp_latency", "table_rows")
+# Options shaping the workload of the cases, which must match those of the baseline for a run to be compared.
+
+# =====================================================================
+
+def measure(operation, calls: int) -> dict:
+    """Times each of a number of calls of an operation, then measures the peak memory
+    allocated over a few further calls. The operation is given the index of the call."""
+    operation(0)
+    latencies = np.empty(calls)
+    started = time.perf_counter()
+    for index in range(calls):
+        began = time.perf_counter()
+        operation(index)
+        latencies[index] = time.perf_counter() - began
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for index in range(min(calls, MEMORY_CALLS)):
+            operation(index)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"calls": calls, "seconds": round(seconds, 6), "throughput": round(calls / seconds, 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 4),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 4),
+            "peak_kib": round(peak / 1024, 1)}
+
+def make_table(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"product": [f"Product {i}" for i in range(rows)],
+                         "price": [f"${price:,.2f}" for price in rng.integers(100, 500000, rows) / 100],
+                         "stock": rng.choice(["In Stock", "5+", "-"], rows)})
+
+def run_suite(options) -> dict:
+    """Runs every case of the suite and returns the results of each by name."""
+    results = {}
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.99", padding_bytes=options.page_bytes)
+             for i in range(options.pages)}
+    with FixtureHTTPServer(pages, latency=options.latency) as server:
+        # Every error_every-th page responds with an error instead
+        if options.error_every:
+            for i in range(0, options.pages, options.error_every):
+                server.set_status(f"/p/{i}", 503)
+        urls = [server.url(f"/p/{i}") for i in range(options.pages)]
+        session = scraper.get_session()
+        results["request_and_parse"] = measure(
+            lambda index: scraper.request_and_parse(urls[index % len(urls)], session=session), options.calls)
+
+    table = make_table(options.table_rows)
+    results["tabulate_dataframe"] = measure(lambda index: scraper.tabulate_dataframe(table), options.calls)
+    results["tabulate_dataframe_html"] = measure(lambda index: scraper.tabulate_dataframe(table, "html"), options.calls)
+
+    with SMTPSink(latency=options.smtp_latency) as sink, notification.Mailer(sink.credentials()) as mailer:
+        results["send_unformatted_email"] = measure(
+            lambda index: notification.send_unformatted_email(f"Alert {index}", "Price dropped.", "user@localhost",
+                                                              mailer=mailer), options.calls)
+        results["send_formatted_table_email"] = measure(
+            lambda index: notification.send_formatted_table_email(f"Alert {index}", "Price dropped.", "user@localhost",
+                                                                  table, mailer=mailer), options.calls)
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """Compares the results of a run against a baseline run.
+
+    Arguments:
+        results {dict} -- the results of each case by name
+        baseline {dict} -- the baseline results of each case by name
+        tolerance {float} -- optional, fraction by which a case may be worse, defaults to DEFAULT_TOLERANCE
+
+    Returns:
+        {list} -- a description of each regression, empty if there are none
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f}/s, baseline {base['throughput']:.1f}/s")
+        if result["p99_ms"] > max(base["p99_ms"] * (1 + tolerance), base["p99_ms"] + P99_FLOOR_MS):
+            regressions.append(f"{name}: p99 {result['p99_ms']} ms, baseline {base['p99_ms']} ms")
+        if result["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: peak {result['peak_kib']} KiB, baseline {base['peak_kib']} KiB")
+    return regressions
+
+def workload_differences(options: dict, baseline_options: dict) -> list:
+    """Lists the workload options of a run which differ from those of a baseline run.
+
+    Arguments:
+        options {dict} -- the options of the run
+        baseline_options {dict} -- the options of the baseline run
+
+    Returns:
+        {list} -- a description of each differing option, empty if the workloads match
+    """
+    return [f"--{name.replace('_', '-')} {options.get(name)}, baseline {baseline_options.get(name)}"
+            for name in WORKLOAD_OPTIONS if options.get(name) != baseline_options.get(name)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite against local HTTP and SMTP stand-ins.")
+    parser.add_argument("--calls", type=int, default=500, help="timed calls of each case")
+    parser.add_argument("--pages", type=int, default=50, help="distinct pages served by the fixture server")
+    parser.add_argument("--page-bytes", type=int, default=50000, help="approximate size of each page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of latency added to each response")
+    parser.add_argument("--error-every", type=int, default=10, help="every Nth page responds 503, 0 for none")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="seconds of latency added to each smtp reply")
+    parser.add_argument("--table-rows", type=int, default=50, help="rows of the tabulated and emailed table")
+    parser.add_argument("--output", help="write the results as json to a file, as well as to stdout")
+    parser.add_argument("--save-baseline", help="write the results as the baseline to compare later runs against")
+    parser.add_argument("--baseline", help="compare the results against a baseline, failing on any regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="fraction a case may regress by")
+    options = parser.parse_args()
+
+    # The error pages are expected, and their warnings would only slow the run
+    logging.disable(logging.WARNING)
+    run = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "options": vars(options)},
+           "results": run_suite(options)}
+    for name, result in run["results"].items():
+        print(f"{name:28} {result['throughput']:10.1f}/s  p50 {result['p50_ms']:8.3f} ms  "
+              f"p99 {result['p99_ms']:8.3f} ms  peak {result['peak_kib']:9.1f} KiB", file=sys.stderr)
+
+    document = json.dumps(run, indent=2)
+    print(document)
+    for filename in (options.output, options.save_baseline):
+        if filename:
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write(document)
+
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        differences = workload_differences(run["meta"]["options"], baseline.get("meta", {}).get("options", {}))
+        for difference in differences:
+            print(f"WORKLOAD DIFFERS {difference}", file=sys.stderr)
+        if differences:
+            print("Not comparing against a baseline run with a different workload.", file=sys.stderr)
+            sys.exit(2)
+        regressions = compare(run["results"], baseline["results"], options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
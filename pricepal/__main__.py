@@ -0,0 +1,12 @@
+# Imports =============================================================
+
+# Standard Libraries
+import sys
+
+# Local Application Libraries
+from pricepal.cli import main
+
+# =====================================================================
+
+if __name__ == '__main__':
+    sys.exit(main())
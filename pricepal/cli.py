@@ -0,0 +1,227 @@
+"""
+Summary:
+
+This module contains the headless command line entry point of PricePal,
+run as `python -m pricepal`, for workers started by cron or systemd in
+containers without a display:
+    python -m pricepal sweep products.csv --spec store.json [--interval SECONDS] [--processes N] [--metrics] [--profile]
+    python -m pricepal extract URL [URL ...] --spec store.json
+
+Nothing of the GUI is imported, and heavy libraries are imported only by
+the commands which need them: extract requests and parses pages without
+importing pandas, and pandas is first imported when a sweep begins. The
+import time of each entry point is held to a budget by the test suite,
+see IMPORT_BUDGETS.
+
+Functions:
+    build_parser() : creates the argument parser of the command line.
+    main() : parses the command line and runs the command, returning the exit status.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import argparse
+import contextlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+# Local Application Libraries
+# Commands import their dependencies when run, so that starting the process stays cheap
+
+# Constants ===========================================================
+
+IMPORT_BUDGETS = {"pricepal.cli": 0.1, "pricepal.common.scrape_engine": 0.5}
+# Cumulative import time in seconds allowed for each module, as measured by -X importtime.
+
+HEAVY_MODULES = ("pandas", "numpy", "tabulate", "matplotlib", "PyQt5")
+# Modules which the cli and the extract command must not import.
+
+# =====================================================================
+
+def _load_spec(filename: str):
+    from pricepal.common.extraction import ExtractionSpec # pylint: disable=import-outside-toplevel
+    with open(filename, "r", encoding="utf-8") as file:
+        return ExtractionSpec.from_dict(json.load(file))
+
+def _start_logging(args):
+    if args.log_file:
+        from pricepal.common.log_pipeline import init_logging # pylint: disable=import-outside-toplevel
+        init_logging(args.log_file, json_lines=args.json_logs)
+    else:
+        logging.basicConfig(level=logging.WARNING, format="%(asctime)s | %(levelname)s | %(module)s | %(message)s")
+
+def _extract(args) -> int:
+    import pricepal.common.scrape_engine as scraper # pylint: disable=import-outside-toplevel
+    spec = _load_spec(args.spec)
+    failed = 0
+    for url, result in scraper.request_and_extract_many(args.urls, spec, max_workers=args.max_workers,
+                                                        max_per_host=args.max_per_host, timeout=args.timeout):
+        if not isinstance(result, dict):
+            failed += 1
+            result = None if result is None else repr(result)
+        print(json.dumps({"url": url, "result": result}), flush=True)
+    return 1 if failed else 0
+
+def _sweep(args) -> int:
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+    import pricepal.common.metrics as metrics
+    from pricepal.common.history_store import DEFAULT_HISTORY_DIR, HistoryStore
+    from pricepal.common.response_cache import DEFAULT_CACHE_PATH, ResponseCache
+    from pricepal.common.sweep import run_sweep
+
+    spec = _load_spec(args.spec)
+    products = pd.read_csv(args.products, usecols=["product_id", "url"])
+    store = HistoryStore(args.history or DEFAULT_HISTORY_DIR)
+    # A sharded sweep keeps a cache per shard, opened by the shard's worker process
+    cache = None if args.no_cache or args.processes > 1 else ResponseCache(args.cache or DEFAULT_CACHE_PATH)
+
+    engine = dispatcher = archive = None
+    if args.rules:
+        from pricepal.notification.rules import RuleEngine
+        engine = RuleEngine(pd.read_csv(args.rules))
+        engine.prime(store.latest(engine.rules["product_id"].unique()))
+        if args.notify:
+            from pricepal.notification.dispatcher import NotificationDispatcher
+            dispatcher = NotificationDispatcher()
+    if args.archive:
+        from pricepal.common.snapshot_archive import SnapshotArchive
+        archive = SnapshotArchive(args.archive)
+
+    coordinator = None
+    if args.processes > 1:
+        from pricepal.common.sharded_sweep import DEFAULT_SHARD_CACHE_DIR, SweepCoordinator
+        from pricepal.common.work_queue import DEFAULT_QUEUE_PATH
+        cache_dir = None
+        if not args.no_cache:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.cache)), "shards") if args.cache \
+                else DEFAULT_SHARD_CACHE_DIR
+        coordinator = SweepCoordinator(spec, store, workers=args.processes, queue_path=args.queue or DEFAULT_QUEUE_PATH,
+                                       cache_dir=cache_dir, engine=engine, dispatcher=dispatcher,
+                                       max_workers=args.max_workers, max_per_host=args.max_per_host,
+                                       timeout=args.timeout)
+
+    # A daemon finishes its current sweep on SIGTERM or SIGINT, then exits
+    stopping = threading.Event()
+    handlers = {}
+    if args.interval:
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            handlers[signal_number] = signal.signal(signal_number, lambda *_: stopping.set())
+
+    metrics_dir = args.metrics_dir or metrics.DEFAULT_METRICS_DIR
+    if args.metrics:
+        metrics.enable()
+    profiler = None
+    if args.profile:
+        extension = ".prof" if args.profile == "cprofile" else ".collapsed"
+        path = os.path.join(metrics_dir, time.strftime(f"{args.profile}-%Y%m%d-%H%M%S{extension}"))
+        profiler = metrics.profile(path) if args.profile == "cprofile" else metrics.sample(path)
+
+    failed = False
+    try:
+        if coordinator is not None:
+            # Sweeps left in the queue by a coordinator which was stopped are finished first, and are
+            # recorded against the time they were submitted rather than the time they are resumed
+            for sweep in coordinator.unfinished():
+                report = coordinator.resume(sweep)
+                print(json.dumps(report), flush=True)
+        while True:
+            started = time.monotonic()
+            # Only the first sweep is profiled, later sweeps of a daemon run at full speed
+            with profiler or contextlib.nullcontext():
+                if coordinator is not None:
+                    report = coordinator.run(products)
+                else:
+                    report = run_sweep(products, spec, store, cache, engine, dispatcher, archive=archive,
+                                       max_workers=args.max_workers, max_per_host=args.max_per_host,
+                                       timeout=args.timeout)
+            profiler = None
+            if args.metrics:
+                metrics.write_prometheus(os.path.join(metrics_dir, "pricepal.prom"))
+                metrics.write_json(os.path.join(metrics_dir, "pricepal.json"))
+            print(json.dumps(report), flush=True)
+            failed = report["failed"] > 0
+            if not args.interval or stopping.wait(max(args.interval - (time.monotonic() - started), 0)):
+                break
+    finally:
+        for signal_number, handler in handlers.items():
+            signal.signal(signal_number, handler)
+        for resource in (coordinator, dispatcher, archive, cache):
+            if resource is not None:
+                resource.close()
+        if args.metrics:
+            metrics.disable()
+    return 1 if failed else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    """Creates the argument parser of the command line, with a sub-command for each command.
+
+    Returns:
+        {argparse.ArgumentParser} -- the parser
+    """
+    parser = argparse.ArgumentParser(prog="python -m pricepal", description="Headless PricePal price tracking.")
+    parser.add_argument("--log-file", help="write logs to a rotating log file, written off the calling threads")
+    parser.add_argument("--json-logs", action="store_true", help="write the log file as JSON lines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # The defaults match those of scrape_engine, which is not imported to build the parser
+    def add_request_arguments(command):
+        command.add_argument("--spec", required=True, help="json file of the extraction spec")
+        command.add_argument("--max-workers", type=int, default=16, help="total number of concurrent requests")
+        command.add_argument("--max-per-host", type=int, default=4, help="number of concurrent requests per host")
+        command.add_argument("--timeout", type=float, default=30, help="seconds to wait on the connection and each read")
+
+    sweep = commands.add_parser("sweep", help="sweep a csv of products into the history store, raising alerts")
+    sweep.add_argument("products", help="csv file of the products, with the columns product_id and url")
+    add_request_arguments(sweep)
+    sweep.add_argument("--history", help="directory of the history store, defaults to data/history")
+    sweep.add_argument("--cache", help="path of the response cache, defaults to data/cache/responses.sqlite3")
+    sweep.add_argument("--no-cache", action="store_true", help="request every page in full and extract every field")
+    sweep.add_argument("--rules", help="csv file of alert rules, with the columns of RuleEngine")
+    sweep.add_argument("--notify", action="store_true", help="email the alerts raised, requires --rules")
+    sweep.add_argument("--archive", help="directory of a snapshot archive to keep the raw pages in, not kept by a sharded sweep")
+    sweep.add_argument("--interval", type=float, default=0,
+                       help="run as a daemon, sweeping every INTERVAL seconds until terminated")
+    sweep.add_argument("--processes", type=int, default=1,
+                       help="shard the sweep by host over N worker processes, through a durable queue")
+    sweep.add_argument("--queue", help="path of the queue of a sharded sweep, defaults to data/queue/sweeps.sqlite3, "
+                                       "any sweeps left unfinished in the queue are resumed at startup")
+    sweep.add_argument("--metrics", action="store_true",
+                       help="record per-stage metrics, written as prometheus text and json after each sweep")
+    sweep.add_argument("--metrics-dir",
+                       help="directory the metrics and profiles are written to, defaults to data/metrics")
+    sweep.add_argument("--profile", choices=("cprofile", "sample"),
+                       help="profile the first sweep with cProfile or the sampling profiler")
+    sweep.set_defaults(run=_sweep)
+
+    extract = commands.add_parser("extract", help="print the fields extracted from pages as json lines")
+    extract.add_argument("urls", nargs="+", help="the complete urls of the pages")
+    add_request_arguments(extract)
+    extract.set_defaults(run=_extract)
+    return parser
+
+def main(argv: list = None) -> int:
+    """Parses the command line and runs the command.
+
+    Arguments:
+        argv {list} -- optional, the arguments, defaults to None for sys.argv
+
+    Returns:
+        {int} -- the exit status, 0 on success, 1 if any page failed
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "notify", False) and not args.rules:
+        parser.error("--notify requires --rules")
+    _start_logging(args)
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
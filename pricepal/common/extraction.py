@@ -0,0 +1,397 @@
+"""
+Summary:
+
+This module contains the declarative extraction specs used to pull
+individual values, such as a price or stock level, out of a page.
+A spec describes each field by the element that holds it, so that only
+the matching parts of a page need to be parsed rather than the whole
+document tree, and the values are returned as plain strings.
+
+A spec is typically defined once per store, for example loaded from a
+json configuration file using ExtractionSpec.from_dict().
+
+Classes:
+    FieldRule : describes how to locate and read a single field of a page.
+    ExtractionSpec : a named set of field rules, typically one per store.
+    StreamingExtractor : incremental parser which extracts the fields of a spec from a page fed in chunks.
+
+Functions:
+    available_parser() : returns the fastest installed parser backend.
+    extract() : parses only the parts of a page required by a spec and returns its field values.
+    region_fingerprint() : hashes the raw regions of a page holding the fields of a spec, without parsing it.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import hashlib
+import importlib.util
+import json
+import re
+from html.parser import HTMLParser
+
+# Third-party Libraries
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Constants ===========================================================
+
+PARSER_PREFERENCE = ("lxml", "html.parser")
+# Parser backends for Beautiful soup, fastest first. Each entry is used only if its module is installed.
+
+_PARSER_MODULES = {"lxml": "lxml", "html5lib": "html5lib", "html.parser": "html.parser"}
+
+REGION_BYTES = 4096
+# Longest region of a page taken for a single element when fingerprinting.
+
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+                       "track", "wbr"))
+# Elements which never have an end tag.
+
+_BLOCK_TAGS = frozenset(("address", "article", "aside", "blockquote", "details", "div", "dl", "fieldset", "figure",
+                         "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol",
+                         "p", "pre", "section", "table", "ul"))
+OPTIONAL_END_TAGS = {"li": frozenset(("li",)), "dt": frozenset(("dt", "dd")), "dd": frozenset(("dt", "dd")),
+                     "td": frozenset(("td", "th", "tr")), "th": frozenset(("td", "th", "tr")), "tr": frozenset(("tr",)),
+                     "option": frozenset(("option", "optgroup")), "p": _BLOCK_TAGS}
+# Elements whose end tag may be omitted, with the start tags which end them. They are also ended by the end of
+# an enclosing element.
+
+# =====================================================================
+
+def available_parser(preference: tuple = PARSER_PREFERENCE) -> str:
+    """Returns the first parser backend of the preference which is installed.
+
+    Arguments:
+        preference {tuple} -- optional, parser names ordered by preference, defaults to PARSER_PREFERENCE
+
+    Returns:
+        {str} -- the name of the parser, "html.parser" if none of the preferred parsers are installed
+    """
+    for parser in preference:
+        if importlib.util.find_spec(_PARSER_MODULES.get(parser, parser)) is not None:
+            return parser
+    return "html.parser"
+
+class FieldRule:
+    """Describes how to locate a single field within a page, and how to read it.
+
+    The element holding the field is located by its tag name and attribute
+    filters, by a CSS selector, or by both, in which case the selector is
+    evaluated within the element found by tag name. Rules with a tag name
+    allow the page to be parsed partially, rules with only a CSS selector
+    require a full parse of the page.
+    """
+
+    __slots__ = ("tag", "attrs", "select", "attribute")
+
+    def __init__(self, tag: str = None, attrs: dict = None, select: str = None, attribute: str = None):
+        """Initializes a rule, at least one of tag or select must be given.
+
+        Arguments:
+            tag {str} -- optional, the name of the element holding the field, defaults to None
+            attrs {dict} -- optional, attribute values the element must have, for example {"class": "price"}, defaults to None
+            select {str} -- optional, CSS selector of the element holding the field, defaults to None
+            attribute {str} -- optional, read this attribute of the element rather than its text, defaults to None
+        """
+        if tag is None and select is None:
+            raise ValueError("A field rule requires a tag, a CSS selector, or both.")
+        self.tag = tag
+        self.attrs = dict(attrs or {})
+        self.select = select
+        self.attribute = attribute
+
+    def matches(self, name: str, attrs: dict) -> bool:
+        """Checks whether an element, described by its name and attributes, is located by this rule.
+        Only the tag name and attribute filters are considered, not the CSS selector.
+
+        Arguments:
+            name {str} -- the name of the element
+            attrs {dict} -- the attributes of the element, with string values
+
+        Returns:
+            {bool} -- True if the element satisfies the tag name and attribute filters
+        """
+        if self.tag is not None and name != self.tag:
+            return False
+        for key, expected in self.attrs.items():
+            value = attrs.get(key)
+            if value is None:
+                return False
+            # Class attributes hold several space separated values, any of which may match
+            if key == "class":
+                if expected not in value.split():
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    def read(self, soup):
+        """Locates the field within a parsed page and reads its value.
+
+        Arguments:
+            soup {bs4.BeautifulSoup} -- the parsed page, either whole or strained to the required elements
+
+        Returns:
+            {str} -- the stripped text, or attribute value, of the field, None if the field was not found
+        """
+        element = soup
+        if self.tag is not None:
+            element = soup.find(self.tag, attrs=self.attrs)
+        if element is not None and self.select is not None:
+            element = element.select_one(self.select)
+        if element is None:
+            return None
+        if self.attribute is not None:
+            value = element.get(self.attribute)
+            return " ".join(value) if isinstance(value, list) else value
+        return element.get_text(strip=True)
+
+    def to_dict(self) -> dict:
+        """Returns the declarative form of this rule, the inverse of ExtractionSpec.from_dict()."""
+        return {key: getattr(self, key) for key in self.__slots__ if getattr(self, key)}
+
+    def region_pattern(self):
+        """Returns a pattern matching the raw start tag of every element this rule may locate.
+        The pattern is looser than matches(), attribute values are compared without
+        case for example, so that it never misses an element the rule would locate.
+
+        Returns:
+            {re.Pattern} -- bytes pattern of the start tag, None if the rule has no tag name
+        """
+        if self.tag is None:
+            return None
+        pattern = b"<" + re.escape(self.tag.encode("utf-8")) + rb"(?=[\s/>])"
+        for key, expected in self.attrs.items():
+            key, expected = re.escape(key.encode("utf-8")), re.escape(expected.encode("utf-8"))
+            if key == b"class":
+                # Any one of the space separated classes may match
+                pattern += rb"(?=[^>]*?\sclass\s*=\s*[\"']?[^\"'>]*?(?<![\w-])" + expected + rb"(?![\w-]))"
+            else:
+                pattern += rb"(?=[^>]*?\s" + key + rb"\s*=\s*[\"']?" + expected + rb"(?=[\"'\s/>]))"
+        return re.compile(pattern + rb"[^>]*>", re.IGNORECASE)
+
+class ExtractionSpec:
+    """A named set of field rules which together describe the values to extract
+    from the pages of a store.
+
+    Specs are declared as a mapping of field name to rule, for example:
+        {"name": "example-store",
+         "fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                    "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"}}}
+    """
+
+    def __init__(self, fields: dict, name: str = ""):
+        """Initializes a spec from a mapping of field name to FieldRule.
+
+        Arguments:
+            fields {dict} -- mapping of field name to the FieldRule locating it
+            name {str} -- optional, name of the store this spec describes, defaults to ""
+        """
+        self.name = name
+        self.fields = dict(fields)
+        self.key = hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+        self._regions = None
+
+    @classmethod
+    def from_dict(cls, config: dict):
+        """Creates a spec from its declarative form, as loaded from a json file.
+
+        Arguments:
+            config {dict} -- mapping with a "fields" mapping of field name to rule arguments, and an optional "name"
+
+        Returns:
+            {ExtractionSpec} -- the spec described by the mapping
+        """
+        return cls({field: FieldRule(**rule) for field, rule in config["fields"].items()}, config.get("name", ""))
+
+    def to_dict(self) -> dict:
+        """Returns the declarative form of this spec."""
+        return {"name": self.name, "fields": {field: rule.to_dict() for field, rule in self.fields.items()}}
+
+    @property
+    def streamable(self) -> bool:
+        """{bool} -- True if every rule can be matched by a StreamingExtractor, which does not support CSS selectors"""
+        return all(rule.tag is not None and rule.select is None for rule in self.fields.values())
+
+    def strainer(self):
+        """Returns a SoupStrainer which limits a parse to the elements required by this spec.
+        The strainer matches the union of all rules, using the tag names of every rule and
+        the attribute filters common to every rule, so it may keep a few more elements
+        than strictly required but never fewer.
+
+        Returns:
+            {bs4.SoupStrainer} -- strainer for the elements of all rules, None if any rule requires a full parse
+        """
+        rules = list(self.fields.values())
+        tags = {rule.tag for rule in rules}
+        if not rules or None in tags:
+            return None
+        shared_keys = set.intersection(*(set(rule.attrs) for rule in rules))
+        attrs = {key: sorted({rule.attrs[key] for rule in rules}) for key in shared_keys}
+        return SoupStrainer(sorted(tags), attrs=attrs)
+
+    def regions(self) -> list:
+        """Returns the patterns locating the raw regions of a page which hold the fields of this spec,
+        as used by region_fingerprint().
+
+        Returns:
+            {list} -- triples of (start tag pattern, end tag pattern, whole element), None if any rule has no tag name
+        """
+        if self._regions is None:
+            regions = []
+            for rule in self.fields.values():
+                start = rule.region_pattern()
+                if start is None or rule.select is not None:
+                    return None
+                # Fields read from an attribute are held within the start tag alone
+                tags = re.compile(rb"<(/?)" + re.escape(rule.tag.encode("utf-8")) + rb"(?=[\s/>])", re.IGNORECASE)
+                regions.append((start, tags, rule.attribute is None))
+            self._regions = regions
+        return self._regions
+
+def extract(content: bytes, spec: ExtractionSpec, parser: str = None) -> dict:
+    """Parses the parts of a page required by a spec and reads the value of each of its fields.
+
+    Arguments:
+        content {bytes} -- the raw body of the page
+        spec {ExtractionSpec} -- the spec describing the fields to extract
+        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to available_parser()
+
+    Returns:
+        {dict} -- mapping of each field name to its string value, None for fields not found in the page
+    """
+    soup = BeautifulSoup(content, parser or available_parser(), parse_only=spec.strainer())
+    return {field: rule.read(soup) for field, rule in spec.fields.items()}
+
+def region_fingerprint(content: bytes, spec: ExtractionSpec) -> str:
+    """Hashes the raw regions of a page which hold the fields of a spec, without parsing the page.
+    Each region is an element, start tag to matching end tag, which a rule of the spec may
+    locate; every such element is included, not only the first. Two pages with the same
+    fingerprint therefore hold the same values for every field, however the rest of the
+    pages differ, for example in adverts, tokens or timestamps.
+
+    Arguments:
+        content {bytes} -- the raw body of the page
+        spec {ExtractionSpec} -- the spec describing the fields of the page
+
+    Returns:
+        {str} -- hex digest of the regions, None if a rule uses only a CSS selector, or if a region of
+                 some rule is not found, or does not end within REGION_BYTES, so the page must be extracted
+    """
+    regions = spec.regions()
+    if regions is None:
+        return None
+
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for start, tags, whole_element in regions:
+        found = False
+        for match in start.finditer(content):
+            end = match.end()
+            if whole_element:
+                end = _element_end(content, tags, match.end(), match.start() + REGION_BYTES)
+                if end is None:
+                    return None
+            fingerprint.update(content[match.start():end])
+            fingerprint.update(b"\0")
+            found = True
+        if not found:
+            return None
+        fingerprint.update(b"\1")
+    return fingerprint.hexdigest()
+
+def _element_end(content: bytes, tags, position: int, limit: int) -> int:
+    # Follows nested elements of the same name to the end tag matching the start tag
+    depth = 1
+    for tag in tags.finditer(content, position, limit):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return tag.end()
+    return None
+
+class StreamingExtractor(HTMLParser):
+    """An incremental parser which extracts the fields of a spec from a page
+    supplied in chunks, without building a document tree.
+
+    Each field is taken from the first element matching its rule, as with
+    extract(). Once every field has been found, done becomes True and the
+    remainder of the page need not be read. The spec must be streamable,
+    as CSS selectors cannot be evaluated without the full tree.
+
+    Elements whose end tag is omitted, such as <td> or <li>, end where the
+    next sibling or the enclosing element begins or ends, as in a browser,
+    and any element still open when the whole page has been fed is ended
+    by close().
+    """
+
+    def __init__(self, spec: ExtractionSpec):
+        """Initializes the extractor for a spec, with every field yet to be found.
+
+        Arguments:
+            spec {ExtractionSpec} -- the spec describing the fields to extract, which must be streamable
+        """
+        if not spec.streamable:
+            raise ValueError(f"Extraction spec '{spec.name}' uses CSS selectors and cannot be streamed.")
+        super().__init__(convert_charrefs=True)
+        self.values = dict.fromkeys(spec.fields)
+        self._pending = dict(spec.fields)
+        self._captures = []
+
+    @property
+    def done(self) -> bool:
+        """{bool} -- True once every field of the spec has been found"""
+        return not self._pending and not self._captures
+
+    def close(self):
+        """Parses any data still buffered, then ends every element still open, at the end of the page."""
+        super().close()
+        for capture in list(self._captures):
+            self._end_text(capture)
+            self._finish(capture)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        for capture in list(self._captures):
+            self._end_text(capture)
+            if tag in OPTIONAL_END_TAGS.get(capture[1], ()):
+                self._finish(capture)
+            elif tag not in VOID_TAGS:
+                capture[2].append(tag)
+        for field, rule in list(self._pending.items()):
+            if not rule.matches(tag, attrs):
+                continue
+            del self._pending[field]
+            if rule.attribute is not None:
+                self.values[field] = attrs.get(rule.attribute)
+            else:
+                # Capture the text of the element until its end, keeping the stack of elements open within it
+                self._captures.append([field, tag, [], [], []])
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        for capture in list(self._captures):
+            self._end_text(capture)
+            inner = capture[2]
+            if tag in inner:
+                del inner[len(inner) - 1 - inner[::-1].index(tag):]
+            elif tag == capture[1] or capture[1] in OPTIONAL_END_TAGS:
+                # An element without its end tag is ended by the end of the element enclosing it
+                self._finish(capture)
+
+    def _finish(self, capture: list):
+        self._captures.remove(capture)
+        self.values[capture[0]] = "".join(capture[3])
+
+    def handle_data(self, data):
+        # Text may arrive in pieces, so it is only stripped once the next tag ends it
+        for capture in self._captures:
+            capture[4].append(data)
+
+    @staticmethod
+    def _end_text(capture: list):
+        # Strip each run of text between tags, as Beautiful soup's get_text(strip=True) does
+        text = "".join(capture[4]).strip()
+        if text:
+            capture[3].append(text)
+        capture[4].clear()
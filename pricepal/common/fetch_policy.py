@@ -0,0 +1,324 @@
+"""
+Summary:
+
+This module contains the policies which govern how scrape_engine treats
+each host it requests pages from. A FetchPolicy combines:
+    - a per-host token bucket rate limit, so no retailer is requested faster than it allows,
+    - bounded retries with jittered exponential backoff, honouring any Retry-After header,
+    - a per-host circuit breaker, which sheds requests to a failing host for a cooldown window.
+Each policy keeps per-host metrics of the requests it has governed.
+
+A policy is passed to the request functions of scrape_engine, and may be
+shared by all of the threads of a batch request.
+
+Classes:
+    RetryPolicy : decides whether, and after what delay, a failed request is retried.
+    CircuitBreaker : per-host breaker which opens after consecutive failures.
+    FetchPolicy : per-host rate limit, retry and circuit breaker applied to each request.
+    CircuitOpenError : raised when a request is shed because the breaker of its host is open.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+# Local Application Libraries
+from pricepal.common.rate_limit import TokenBucket
+
+# Constants ===========================================================
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# Response codes which indicate a transient failure worth retrying.
+
+DEFAULT_RATE_PER_HOST = 2.0
+DEFAULT_BURST_PER_HOST = 4
+# Requests per second, and burst size, allowed against each host.
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_MAX_RETRY_AFTER = 120.0
+# Delays are in seconds. Retry-After values beyond the maximum are not waited on.
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 60.0
+# Consecutive failures which open a breaker, and seconds it stays open.
+
+# =====================================================================
+
+class CircuitOpenError(Exception):
+    """Raised when a request is shed because the circuit breaker of its host is open."""
+
+class RetryPolicy:
+    """Decides whether a failed request is retried, and how long to wait first.
+    Delays grow exponentially with each attempt and are drawn uniformly from
+    zero up to that bound ("full jitter"), so that many workers retrying the
+    same host do not retry in lockstep. A Retry-After header takes precedence.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, max_retry_after: float = DEFAULT_MAX_RETRY_AFTER,
+                 statuses: frozenset = RETRY_STATUSES):
+        """Initializes the retry policy.
+
+        Arguments:
+            max_retries {int} -- optional, retries after the first attempt, defaults to DEFAULT_MAX_RETRIES
+            backoff_base {float} -- optional, bound on the first delay, defaults to DEFAULT_BACKOFF_BASE
+            backoff_max {float} -- optional, bound on any delay, defaults to DEFAULT_BACKOFF_MAX
+            max_retry_after {float} -- optional, longest Retry-After honoured, defaults to DEFAULT_MAX_RETRY_AFTER
+            statuses {frozenset} -- optional, response codes which are retried, defaults to RETRY_STATUSES
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+
+    def delay(self, attempt: int, retry_after: str = None) -> float:
+        """Returns the delay before a retry.
+
+        Arguments:
+            attempt {int} -- the number of the attempt which failed, starting at 0
+            retry_after {str} -- optional, the Retry-After header of the failed response, defaults to None
+
+        Returns:
+            {float} -- seconds to wait, None if the Retry-After is too long to be worth waiting on
+        """
+        if retry_after:
+            wait = self._parse_retry_after(retry_after)
+            if wait is not None:
+                return wait if wait <= self.max_retry_after else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _parse_retry_after(value: str):
+        # Retry-After is either a number of seconds or an http date
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+class CircuitBreaker:
+    """A circuit breaker for each host. A host's breaker opens after a number of
+    consecutive failures, and requests to it are shed until a cooldown has passed.
+    The breaker then lets a single probe request through: success closes it,
+    failure opens it for another cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, cooldown: float = DEFAULT_COOLDOWN,
+                 clock=time.monotonic):
+        """Initializes the breaker with every host closed.
+
+        Arguments:
+            failure_threshold {int} -- optional, consecutive failures which open a host, defaults to DEFAULT_FAILURE_THRESHOLD
+            cooldown {float} -- optional, seconds a host stays open, defaults to DEFAULT_COOLDOWN
+            clock {callable} -- optional, returns the current time in seconds, defaults to time.monotonic
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._failures = defaultdict(int)
+        self._opened = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def state(self, host: str) -> str:
+        """Returns the state of a host's breaker, one of CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            if host not in self._opened:
+                return self.CLOSED
+            if self._clock() - self._opened[host] < self.cooldown:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def allow(self, host: str) -> bool:
+        """Checks whether a request to a host may be made, claiming the probe of a half-open host.
+
+        Arguments:
+            host {str} -- the host of the request
+
+        Returns:
+            {bool} -- True if the request may be made, False if it should be shed
+        """
+        with self._lock:
+            opened = self._opened.get(host)
+            if opened is None:
+                return True
+            if self._clock() - opened < self.cooldown or host in self._probing:
+                return False
+            self._probing.add(host)
+            return True
+
+    def release(self, host: str):
+        """Releases the probe of a half-open host whose request ended without an outcome being
+        recorded, such as on an unexpected exception, so that another probe may be made."""
+        with self._lock:
+            self._probing.discard(host)
+
+    def record_success(self, host: str):
+        """Records a successful request to a host, closing its breaker."""
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+            self._probing.discard(host)
+
+    def record_failure(self, host: str) -> bool:
+        """Records a failed request to a host, opening its breaker at the threshold.
+
+        Returns:
+            {bool} -- True if this failure opened the breaker
+        """
+        with self._lock:
+            self._failures[host] += 1
+            reopen = host in self._probing
+            self._probing.discard(host)
+            if reopen or (host not in self._opened and self._failures[host] >= self.failure_threshold):
+                self._opened[host] = self._clock()
+                return True
+            return False
+
+class FetchPolicy:
+    """The per-host rate limit, retry policy and circuit breaker applied to each request
+    made by scrape_engine, along with per-host metrics of their effect.
+    """
+
+    def __init__(self, rate_per_host: float = DEFAULT_RATE_PER_HOST, burst_per_host: float = DEFAULT_BURST_PER_HOST,
+                 retry: RetryPolicy = None, breaker: CircuitBreaker = None, host_rates: dict = None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """Initializes the policy.
+
+        Arguments:
+            rate_per_host {float} -- optional, requests per second allowed per host, defaults to DEFAULT_RATE_PER_HOST
+            burst_per_host {float} -- optional, burst of requests allowed per host, defaults to DEFAULT_BURST_PER_HOST
+            retry {RetryPolicy} -- optional, the retry policy, defaults to RetryPolicy()
+            breaker {CircuitBreaker} -- optional, the circuit breaker, defaults to CircuitBreaker()
+            host_rates {dict} -- optional, mapping of host to its own requests per second, defaults to None
+            clock {callable} -- optional, returns the current time in seconds, defaults to time.monotonic
+            sleep {callable} -- optional, sleeps for a number of seconds, defaults to time.sleep
+        """
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.host_rates = dict(host_rates or {})
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._metrics = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def metrics(self) -> dict:
+        """Returns a snapshot of the metrics of each host.
+
+        Returns:
+            {dict} -- mapping of host to its counters: requests, successes, failures, retries,
+                      throttled (requests delayed by the rate limit), throttle_seconds, shed,
+                      breaker_opens, along with the current breaker state
+        """
+        with self._lock:
+            snapshot = {host: dict(counters) for host, counters in self._metrics.items()}
+        for host, counters in snapshot.items():
+            counters["breaker"] = self.breaker.state(host)
+        return snapshot
+
+    def before_request(self, host: str):
+        """Sheds the request if the breaker of its host is open, otherwise waits for the host's rate limit.
+
+        Arguments:
+            host {str} -- the host of the request
+
+        Raises:
+            CircuitOpenError -- if the breaker of the host is open
+        """
+        if not self.breaker.allow(host):
+            self._count(host, "shed")
+            raise CircuitOpenError(f"Circuit breaker for host '{host}' is open.")
+
+        bucket = self._bucket(host)
+        throttled = 0.0
+        while not bucket.try_acquire():
+            # Other threads may take the next token first, so the delay is re-checked after each sleep
+            wait = max(bucket.delay(), 0.001)
+            throttled += wait
+            self._sleep(wait)
+        if throttled:
+            self._count(host, "throttled")
+            self._count(host, "throttle_seconds", throttled)
+        self._count(host, "requests")
+
+    def after_response(self, host: str, status_code: int, attempt: int, retry_after: str = None):
+        """Records the outcome of a response, and decides whether it should be retried.
+
+        Arguments:
+            host {str} -- the host of the request
+            status_code {int} -- the response code
+            attempt {int} -- the number of the attempt, starting at 0
+            retry_after {str} -- optional, the Retry-After header of the response, defaults to None
+
+        Returns:
+            {float} -- seconds to wait before retrying, None if the response should not be retried
+        """
+        if status_code not in self.retry.statuses:
+            self.breaker.record_success(host)
+            self._count(host, "successes")
+            return None
+        return self._failed(host, attempt, retry_after)
+
+    def after_error(self, host: str, attempt: int):
+        """Records a request which failed without a response, and decides whether it should be retried.
+
+        Arguments:
+            host {str} -- the host of the request
+            attempt {int} -- the number of the attempt, starting at 0
+
+        Returns:
+            {float} -- seconds to wait before retrying, None if the request should not be retried
+        """
+        return self._failed(host, attempt)
+
+    def release(self, host: str):
+        """Releases any probe of the host's breaker claimed by a request, called once the request has ended."""
+        self.breaker.release(host)
+
+    def wait(self, host: str, delay: float):
+        """Sleeps for a retry delay, recording the retry."""
+        self._count(host, "retries")
+        self._sleep(delay)
+
+    def _failed(self, host: str, attempt: int, retry_after: str = None):
+        self._count(host, "failures")
+        if self.breaker.record_failure(host):
+            self._count(host, "breaker_opens")
+            logging.warning("Opened circuit breaker of 'host:%s' after repeated failures.", host)
+            return None
+        if attempt >= self.retry.max_retries or self.breaker.state(host) != CircuitBreaker.CLOSED:
+            return None
+        return self.retry.delay(attempt, retry_after)
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate = self.host_rates.get(host, self.rate_per_host)
+                bucket = TokenBucket(rate, capacity=max(1.0, self.burst_per_host), clock=self._clock)
+                self._buckets[host] = bucket
+            return bucket
+
+    def _count(self, host: str, name: str, amount: float = 1):
+        with self._lock:
+            self._metrics[host][name] += amount
@@ -0,0 +1,403 @@
+"""
+Summary:
+
+This module contains the persistent store of scraped price history.
+The store is append-only and columnar: each batch of rows, typically one
+sweep, is written as a segment holding one numpy array per column, with
+its rows sorted by product id and then time. A manifest records the time
+and product id bounds of every segment, so that queries only open the
+segments which can hold matching rows, and within a segment the rows of
+a product are found by binary search rather than by a scan.
+The latest row of every product is also kept as a separate snapshot,
+so that the current price of all products is a single read.
+
+Segment columns are memory mapped when read, and small segments can be
+merged by compact() to keep the number of segments per query low.
+
+Classes:
+    HistoryStore : append-only columnar store of price history, indexed by product id and time.
+    HistoryWriter : buffers rows added one at a time and appends them to a HistoryStore in batches.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_HISTORY_DIR = os.path.join(DATA_DIR, "history")
+
+COLUMNS = {"product_id": np.int64, "ts": np.int64, "price_cents": np.int64, "stock": np.int32}
+# Stored columns and their dtypes. The ts column holds nanoseconds since the epoch, UTC.
+
+MISSING_PRICE = np.iinfo(np.int64).min
+# Stored in price_cents for rows without a price, returned as <NA>.
+
+UNKNOWN_STOCK = -1
+# Stored in stock for rows without a stock level.
+
+DEFAULT_COMPACT_ROWS = 8 * 1024 * 1024
+# Target number of rows for a segment produced by compact().
+
+# =====================================================================
+
+def _to_epoch_ns(values):
+    # Accepts datetimes, strings or integer nanoseconds, naive datetimes are taken to be UTC
+    if not isinstance(values, str) and np.ndim(values) > 0:
+        array = np.asarray(values)
+        if np.issubdtype(array.dtype, np.integer):
+            return array.astype(np.int64, copy=False)
+    stamps = pd.to_datetime(values, utc=True)
+    if isinstance(stamps, pd.Timestamp):
+        return np.int64(stamps.value)
+    naive = pd.DatetimeIndex(stamps).tz_convert("UTC").tz_localize(None)
+    return np.asarray(naive, dtype="datetime64[ns]").view(np.int64)
+
+class HistoryStore:
+    """An append-only, columnar store of price history under a directory.
+
+    Rows hold a product id, a timestamp, a price in integer cents and a stock
+    level. Writes are made in batches by append(), each of which becomes a new
+    segment. Queries return pandas DataFrames with the columns product_id,
+    ts (UTC datetimes), price_cents (nullable integer) and stock.
+
+    Note: the store supports a single writer, readers in the same process
+    may query while it writes.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DIR):
+        """Opens, or creates, the store at the given directory.
+
+        Arguments:
+            path {str} -- optional, directory holding the store, defaults to DEFAULT_HISTORY_DIR
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._open_segments = {}
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+
+        manifest_path = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                self._manifest = json.load(manifest_file)
+        else:
+            self._manifest = {"segments": [], "latest": None}
+
+    @property
+    def segments(self) -> list:
+        """{list} -- the manifest entry of each segment, oldest first"""
+        return list(self._manifest["segments"])
+
+    def __len__(self) -> int:
+        return sum(segment["rows"] for segment in self._manifest["segments"])
+
+    def append(self, rows: pd.DataFrame) -> int:
+        """Appends a batch of rows to the store as a new segment, and updates the latest
+        row of each product in the batch.
+
+        Arguments:
+            rows {pandas.DataFrame} -- rows with columns product_id and ts, and optionally price_cents and stock.
+                                       ts may hold datetimes or integer nanoseconds since the epoch.
+
+        Returns:
+            {int} -- the number of rows appended
+        """
+        if len(rows) == 0:
+            return 0
+        columns = self._normalize(rows)
+
+        # Sort by product then time, so that each product's rows are contiguous and ordered
+        order = np.lexsort((columns["ts"], columns["product_id"]))
+        columns = {name: values[order] for name, values in columns.items()}
+
+        with self._lock:
+            entry = self._write_segment(columns)
+            previous_latest = self._manifest["latest"]
+            self._manifest["segments"].append(entry)
+            self._manifest["latest"] = self._write_latest(columns)
+            self._save_manifest()
+
+            # The previous snapshot is removed once the manifest no longer refers to it
+            if previous_latest is not None:
+                self._open_segments.pop(previous_latest, None)
+                shutil.rmtree(os.path.join(self.path, previous_latest), ignore_errors=True)
+
+        logging.debug("Appended 'rows:%s' to price history as 'segment:%s'.", entry["rows"], entry["id"])
+        return entry["rows"]
+
+    def history(self, product_id: int, start=None, end=None) -> pd.DataFrame:
+        """Returns the rows of a single product, optionally limited to a time range.
+
+        Arguments:
+            product_id {int} -- the id of the product
+            start {datetime, str} -- optional, earliest time to include, defaults to None for no lower bound
+            end {datetime, str} -- optional, latest time to include, defaults to None for no upper bound
+
+        Returns:
+            {pandas.DataFrame} -- the rows of the product ordered by time
+        """
+        start_ns = _to_epoch_ns(start) if start is not None else np.iinfo(np.int64).min
+        end_ns = _to_epoch_ns(end) if end is not None else np.iinfo(np.int64).max
+
+        parts = []
+        for entry in self._candidate_segments(start_ns, end_ns):
+            if not entry["min_product"] <= product_id <= entry["max_product"]:
+                continue
+            columns = self._segment_columns(entry)
+            low = np.searchsorted(columns["product_id"], product_id, side="left")
+            high = np.searchsorted(columns["product_id"], product_id, side="right")
+            if low == high:
+                continue
+            ts = columns["ts"][low:high]
+            first = low + np.searchsorted(ts, start_ns, side="left")
+            last = low + np.searchsorted(ts, end_ns, side="right")
+            if first < last:
+                parts.append({name: np.array(values[first:last]) for name, values in columns.items()})
+        return self._frame(parts, sort_by_time=True)
+
+    def between(self, start, end) -> pd.DataFrame:
+        """Returns the rows of every product within a time range.
+
+        Arguments:
+            start {datetime, str} -- earliest time to include
+            end {datetime, str} -- latest time to include
+
+        Returns:
+            {pandas.DataFrame} -- the matching rows ordered by product id and then time
+        """
+        start_ns, end_ns = _to_epoch_ns(start), _to_epoch_ns(end)
+        parts = []
+        for entry in self._candidate_segments(start_ns, end_ns):
+            columns = self._segment_columns(entry)
+            mask = (columns["ts"] >= start_ns) & (columns["ts"] <= end_ns)
+            parts.append({name: values[mask] for name, values in columns.items()})
+        frame = self._frame(parts)
+        return frame.sort_values(["product_id", "ts"], kind="stable", ignore_index=True)
+
+    def latest(self, product_ids=None) -> pd.DataFrame:
+        """Returns the most recent row of every product, or of the given products.
+
+        Arguments:
+            product_ids {iterable} -- optional, ids of the products to include, defaults to None for all products
+
+        Returns:
+            {pandas.DataFrame} -- one row per product ordered by product id
+        """
+        with self._lock:
+            columns = self._latest_columns()
+        if columns is None:
+            return self._frame([])
+        if product_ids is not None:
+            ids = columns["product_id"]
+            wanted = np.unique(np.asarray(list(product_ids), dtype=np.int64))
+            positions = np.clip(np.searchsorted(ids, wanted), 0, max(len(ids) - 1, 0))
+            positions = positions[ids[positions] == wanted] if len(ids) else positions[:0]
+            columns = {name: values[positions] for name, values in columns.items()}
+        return self._frame([columns])
+
+    def compact(self, target_rows: int = DEFAULT_COMPACT_ROWS) -> int:
+        """Merges consecutive small segments into segments of up to target_rows rows,
+        reducing the number of segments a query must visit.
+
+        Arguments:
+            target_rows {int} -- optional, the largest number of rows in a merged segment, defaults to DEFAULT_COMPACT_ROWS
+
+        Returns:
+            {int} -- the number of segments after compaction
+        """
+        with self._lock:
+            groups, group, group_rows = [], [], 0
+            for entry in self._manifest["segments"]:
+                if group and group_rows + entry["rows"] > target_rows:
+                    groups.append(group)
+                    group, group_rows = [], 0
+                group.append(entry)
+                group_rows += entry["rows"]
+            if group:
+                groups.append(group)
+
+            merged = []
+            for group in groups:
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                parts = [self._segment_columns(entry) for entry in group]
+                columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+                order = np.lexsort((columns["ts"], columns["product_id"]))
+                merged.append(self._write_segment({name: values[order] for name, values in columns.items()}))
+
+            retired = [entry for entry in self._manifest["segments"] if entry not in merged]
+            self._manifest["segments"] = merged
+            self._save_manifest()
+            for entry in retired:
+                self._open_segments.pop(entry["id"], None)
+                shutil.rmtree(os.path.join(self.path, "segments", entry["id"]), ignore_errors=True)
+
+        logging.debug("Compacted price history to 'segments:%s'.", len(merged))
+        return len(merged)
+
+    def _normalize(self, rows: pd.DataFrame) -> dict:
+        columns = {"product_id": np.asarray(rows["product_id"], dtype=np.int64),
+                   "ts": _to_epoch_ns(rows["ts"])}
+        if "price_cents" in rows:
+            prices = pd.array(rows["price_cents"], dtype="Int64")
+            columns["price_cents"] = prices.to_numpy(dtype=np.int64, na_value=MISSING_PRICE)
+        else:
+            columns["price_cents"] = np.full(len(rows), MISSING_PRICE, dtype=np.int64)
+        if "stock" in rows:
+            stock = pd.array(rows["stock"], dtype="Int32")
+            columns["stock"] = stock.to_numpy(dtype=np.int32, na_value=UNKNOWN_STOCK)
+        else:
+            columns["stock"] = np.full(len(rows), UNKNOWN_STOCK, dtype=np.int32)
+        return columns
+
+    def _write_segment(self, columns: dict) -> dict:
+        segment_id = uuid.uuid4().hex
+        directory = os.path.join(self.path, "segments", segment_id)
+        os.makedirs(directory)
+        for name, values in columns.items():
+            np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(values, dtype=COLUMNS[name]))
+        return {"id": segment_id, "rows": int(len(columns["product_id"])),
+                "min_ts": int(columns["ts"].min()), "max_ts": int(columns["ts"].max()),
+                "min_product": int(columns["product_id"][0]), "max_product": int(columns["product_id"][-1])}
+
+    def _write_latest(self, columns: dict) -> str:
+        # Keep the last row of each product in the sorted batch
+        last = np.flatnonzero(np.append(columns["product_id"][1:] != columns["product_id"][:-1], True))
+        batch = {name: values[last] for name, values in columns.items()}
+
+        # Merge with the previous snapshot, the newer row of each product wins
+        previous = self._latest_columns()
+        if previous is not None:
+            merged = {name: np.concatenate([previous[name], batch[name]]) for name in COLUMNS}
+            order = np.lexsort((merged["ts"], merged["product_id"]))
+            merged = {name: values[order] for name, values in merged.items()}
+            last = np.flatnonzero(np.append(merged["product_id"][1:] != merged["product_id"][:-1], True))
+            batch = {name: values[last] for name, values in merged.items()}
+
+        latest_id = "latest-" + uuid.uuid4().hex
+        directory = os.path.join(self.path, latest_id)
+        os.makedirs(directory)
+        for name, values in batch.items():
+            np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(values, dtype=COLUMNS[name]))
+
+        self._open_segments[latest_id] = batch
+        return latest_id
+
+    def _save_manifest(self):
+        manifest_path = os.path.join(self.path, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(self._manifest, manifest_file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _candidate_segments(self, start_ns: int, end_ns: int) -> list:
+        with self._lock:
+            return [entry for entry in self._manifest["segments"]
+                    if entry["max_ts"] >= start_ns and entry["min_ts"] <= end_ns]
+
+    def _segment_columns(self, entry: dict) -> dict:
+        with self._lock:
+            columns = self._open_segments.get(entry["id"])
+            if columns is None:
+                directory = os.path.join(self.path, "segments", entry["id"])
+                columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+                self._open_segments[entry["id"]] = columns
+            return columns
+
+    def _latest_columns(self):
+        latest_id = self._manifest["latest"]
+        if latest_id is None:
+            return None
+        columns = self._open_segments.get(latest_id)
+        if columns is None:
+            directory = os.path.join(self.path, latest_id)
+            columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+            self._open_segments[latest_id] = columns
+        return columns
+
+    @staticmethod
+    def _frame(parts: list, sort_by_time: bool = False) -> pd.DataFrame:
+        if parts:
+            columns = {name: np.concatenate([np.asarray(part[name]) for part in parts]) for name in COLUMNS}
+        else:
+            columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        if sort_by_time and len(parts) > 1:
+            order = np.argsort(columns["ts"], kind="stable")
+            columns = {name: values[order] for name, values in columns.items()}
+        prices = np.asarray(columns["price_cents"], dtype=np.int64)
+        return pd.DataFrame({"product_id": columns["product_id"],
+                             "ts": pd.to_datetime(columns["ts"], unit="ns", utc=True),
+                             "price_cents": pd.arrays.IntegerArray(prices, prices == MISSING_PRICE),
+                             "stock": columns["stock"]})
+
+class HistoryWriter:
+    """Buffers rows added one at a time, for example as the results of a sweep
+    arrive, and appends them to a HistoryStore in batches. Any buffered rows
+    are appended when the writer is closed.
+    """
+
+    def __init__(self, store: HistoryStore, batch_rows: int = 100000):
+        """Initializes an empty buffer for the store.
+
+        Arguments:
+            store {HistoryStore} -- the store to append to
+            batch_rows {int} -- optional, number of buffered rows which triggers an append, defaults to 100000
+        """
+        self.store = store
+        self.batch_rows = batch_rows
+        self._rows = {name: [] for name in COLUMNS}
+
+    def add(self, product_id: int, ts, price_cents: int = None, stock: int = None):
+        """Buffers a single row, appending the buffer to the store once it is full.
+
+        Arguments:
+            product_id {int} -- the id of the product
+            ts {datetime, int} -- the time of the observation, as a datetime or nanoseconds since the epoch
+            price_cents {int} -- optional, the price in integer cents, defaults to None for no price
+            stock {int} -- optional, the stock level, defaults to None for unknown
+        """
+        self._rows["product_id"].append(product_id)
+        self._rows["ts"].append(ts if isinstance(ts, (int, np.integer)) else _to_epoch_ns(ts))
+        self._rows["price_cents"].append(price_cents)
+        self._rows["stock"].append(stock)
+        if len(self._rows["product_id"]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> int:
+        """Appends the buffered rows to the store.
+
+        Returns:
+            {int} -- the number of rows appended
+        """
+        if not self._rows["product_id"]:
+            return 0
+        rows = pd.DataFrame({"product_id": self._rows["product_id"],
+                             "ts": np.asarray(self._rows["ts"], dtype=np.int64),
+                             "price_cents": pd.array(self._rows["price_cents"], dtype="Int64"),
+                             "stock": pd.array(self._rows["stock"], dtype="Int32")})
+        self._rows = {name: [] for name in COLUMNS}
+        return self.store.append(rows)
+
+    def close(self):
+        """Appends any buffered rows to the store."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,254 @@
+"""
+Summary:
+
+This module contains the asynchronous logging pipeline, which moves the
+output of log handlers off the threads that log. The root logger is
+given a single handler which only places each record on a bounded queue,
+and a listener thread passes the records on to the real handlers, such
+as the rotating log file and the status bar log box. Logging can then
+stay at DEBUG without the file writes and rollovers of each record
+adding latency to the scrape and send hot paths.
+
+When the handlers fall behind and the queue is full, records are dropped
+rather than blocking the caller. Drops are counted, and reported in the
+log by a warning record once the queue has room again.
+
+Records may be written in the usual text format, or as compact JSON
+lines for machine reading.
+
+Classes:
+    DroppingQueueHandler : queue handler which drops and counts records when its bounded queue is full.
+    JsonLinesFormatter : formatter writing each record as a single line of JSON.
+    LogPipeline : bounded queue and listener thread passing the records of a logger on to its handlers.
+
+Functions:
+    rotating_file_handler() : creates a rotating log file handler, in either text or JSON lines format.
+    init_logging() : routes the root logger at DEBUG through a log pipeline to a rotating log file.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Local Application Libraries
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_LOG_DIR = os.path.join(DATA_DIR, "logs")
+
+DEFAULT_MAX_QUEUE = 10000
+# Records waiting on the listener thread, beyond which new records are dropped.
+
+DEFAULT_MAX_BYTES = 100000
+DEFAULT_BACKUP_COUNT = 9
+# Size at which a log file is rolled over, and the number of rolled over files kept.
+
+LOG_FORMAT = "%(asctime)s | %(levelname)s | Module: %(module)s | Function: %(funcName)s | %(message)s"
+# Text format of the records written to log files.
+
+# =====================================================================
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+class DroppingQueueHandler(QueueHandler):
+    """A queue handler which never blocks the logging thread. A record which does
+    not fit on the bounded queue is dropped and counted, and a warning giving the
+    count of dropped records is queued ahead of the next record which does fit.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        """Initializes the handler over a bounded queue.
+
+        Arguments:
+            log_queue {queue.Queue} -- the queue records are placed on
+        """
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is merged with its arguments, but the traceback is kept apart from it as exc_text,
+        # so that each formatter of the listener places it, such as in the "exc" field of a JSON line
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._unreported:
+            self.report_drops()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self._unreported += 1
+
+    def report_drops(self, block: bool = False):
+        """Queues a warning giving the count of records dropped since the last report, if any.
+
+        Arguments:
+            block {bool} -- optional, wait for room on the queue rather than keeping the count for later, defaults to False
+        """
+        with self._drop_lock:
+            unreported, self._unreported = self._unreported, 0
+        if not unreported:
+            return
+        report = logging.makeLogRecord({"name": "pricepal.logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                                        "module": __name__.rsplit(".", 1)[-1], "funcName": "enqueue",
+                                        "msg": f"Dropped 'records:{unreported}' as the log handlers fell behind."})
+        try:
+            self.queue.put(report, block=block)
+        except queue.Full:
+            with self._drop_lock:
+                self._unreported += unreported
+
+class _Listener(QueueListener):
+    # The stop sentinel waits for room on the bounded queue, rather than failing when it is full
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class JsonLinesFormatter(logging.Formatter):
+    """A formatter writing each record as a single line of JSON, holding the time,
+    level, logger, module, function, thread and message of the record, and the
+    traceback of any exception.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                 "module": record.module, "function": record.funcName, "thread": record.threadName,
+                 "message": record.getMessage()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LogPipeline:
+    """A bounded queue and a listener thread, which pass the records of a logger on
+    to a set of handlers. While the pipeline is started, the logger's only added
+    handler is a DroppingQueueHandler, so logging costs the calling thread no more
+    than formatting the message and placing it on the queue.
+
+    Each handler keeps its own level and formatter, and the records of every
+    handler are written by the one listener thread. Queued records are written
+    before stop() returns.
+    """
+
+    def __init__(self, handlers, max_queue: int = DEFAULT_MAX_QUEUE):
+        """Initializes the pipeline, without yet attaching it to a logger.
+
+        Arguments:
+            handlers {iterable} -- the logging.Handler objects records are passed on to
+            max_queue {int} -- optional, records waiting on the listener thread, defaults to DEFAULT_MAX_QUEUE
+        """
+        self.handlers = list(handlers)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self._listener = None
+        self._logger = None
+
+    @property
+    def dropped(self) -> int:
+        """{int} -- the number of records dropped as the queue was full"""
+        return self.queue_handler.dropped
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_handler(self, handler: logging.Handler):
+        """Adds a handler to the pipeline, restarting the listener thread if it is running.
+
+        Arguments:
+            handler {logging.Handler} -- the handler records are to be passed on to
+        """
+        self.handlers.append(handler)
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+            self._listener.start()
+
+    def start(self, logger: logging.Logger = None):
+        """Starts the listener thread, and attaches the queue handler to a logger.
+
+        Arguments:
+            logger {logging.Logger} -- optional, the logger whose records are passed on, defaults to the root logger
+
+        Returns:
+            {LogPipeline} -- the pipeline itself
+        """
+        if self._listener is not None:
+            return self
+        self._logger = logger or logging.getLogger()
+        self._listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+        self._logger.addHandler(self.queue_handler)
+        return self
+
+    def stop(self):
+        """Detaches the queue handler from its logger, writes every queued record,
+        then stops the listener thread and flushes the handlers."""
+        if self._listener is None:
+            return
+        self._logger.removeHandler(self.queue_handler)
+        self.queue_handler.report_drops(block=True)
+        self._listener.stop()
+        self._listener = None
+        for handler in self.handlers:
+            handler.flush()
+
+def rotating_file_handler(filename: str, json_lines: bool = False, max_bytes: int = DEFAULT_MAX_BYTES,
+                          backup_count: int = DEFAULT_BACKUP_COUNT) -> RotatingFileHandler:
+    """Creates a rotating log file handler, creating the directory of the file if needed.
+
+    Arguments:
+        filename {str} -- the path of the log file
+        json_lines {bool} -- optional, write records as JSON lines rather than LOG_FORMAT text, defaults to False
+        max_bytes {int} -- optional, size at which the file is rolled over, defaults to DEFAULT_MAX_BYTES
+        backup_count {int} -- optional, number of rolled over files kept, defaults to DEFAULT_BACKUP_COUNT
+
+    Returns:
+        {RotatingFileHandler} -- the handler, with its formatter set
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    return handler
+
+def init_logging(filename: str, handlers=(), json_lines: bool = False, max_queue: int = DEFAULT_MAX_QUEUE) -> LogPipeline:
+    """Sets the root logger to DEBUG and routes its records through a log pipeline
+    to a rotating log file, and to any further handlers. The pipeline is stopped,
+    writing any queued records, when the interpreter exits.
+
+    Arguments:
+        filename {str} -- the path of the log file
+        handlers {iterable} -- optional, further handlers records are passed on to, defaults to none
+        json_lines {bool} -- optional, write the log file as JSON lines, defaults to False
+        max_queue {int} -- optional, records waiting on the listener thread, defaults to DEFAULT_MAX_QUEUE
+
+    Returns:
+        {LogPipeline} -- the started pipeline
+    """
+    logging.getLogger().setLevel(logging.DEBUG)
+    pipeline = LogPipeline([rotating_file_handler(filename, json_lines), *handlers], max_queue)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
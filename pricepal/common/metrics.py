@@ -0,0 +1,427 @@
+"""
+Summary:
+
+This module contains the metrics of a sweep: counters, and histograms of
+the time taken by each stage (fetch, parse, extract, normalize, store,
+alerts and notify), labelled by host and outcome, so that the retailers
+and stages which use up the sweep's budget can be found.
+
+Metrics are disabled until enable() is called. While disabled, timer()
+returns a shared no-op context and count() returns at once, so the
+instrumented hot paths cost no more than a global lookup.
+
+The recorded metrics can be exported as a Prometheus text file, for
+the textfile collector of a node exporter, or as a JSON snapshot, by
+default under data/metrics. A single sweep, or any other block, can be
+profiled with cProfile or a sampling profiler, to break the time of a
+stage down by function.
+
+Classes:
+    MetricsRegistry : thread-safe store of labelled counters and latency histograms.
+    Sampler : sampling profiler collecting the stacks of running threads at an interval.
+
+Functions:
+    enable() : starts recording metrics, returning the registry.
+    disable() : stops recording metrics.
+    registry() : returns the registry recording metrics, None while disabled.
+    timer() : context timing a stage into its latency histogram.
+    count() : increments a labelled counter.
+    write_prometheus() : writes the recorded metrics as a Prometheus text file.
+    write_json() : writes the recorded metrics as a JSON snapshot.
+    profile() : context profiling a block with cProfile, writing the stats under data/metrics.
+    sample() : context profiling a block with a Sampler, writing the collapsed stacks under data/metrics.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import bisect
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# Local Application Libraries
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+STAGES = ("fetch", "parse", "extract", "normalize", "store", "alerts", "notify", "sweep")
+# Stages timed by the instrumented code, "sweep" being the whole of each sweep.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds in seconds of the buckets of each latency histogram, beyond the last is counted only in +Inf.
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Seconds between the stack samples of a Sampler.
+
+METRIC_PREFIX = "pricepal"
+# Prefix of the names of exported Prometheus metrics.
+
+# =====================================================================
+
+_registry = None
+_registry_lock = threading.Lock()
+
+@lru_cache(maxsize=4096)
+def host_of(url: str) -> str:
+    """Returns the host of a url, as used to label metrics."""
+    return urlsplit(url).hostname or ""
+
+class MetricsRegistry:
+    """A thread-safe store of counters and latency histograms, each keyed by its
+    name and the host and outcome it is labelled with.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """Initializes an empty registry.
+
+        Arguments:
+            buckets {tuple} -- optional, ascending upper bounds of the histogram buckets, defaults to LATENCY_BUCKETS
+        """
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._counters = Counter()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, host: str = "", outcome: str = "", value: float = 1):
+        """Adds a value to a counter.
+
+        Arguments:
+            name {str} -- the name of the counter
+            host {str} -- optional, the host label, defaults to ""
+            outcome {str} -- optional, the outcome label, defaults to ""
+            value {float} -- optional, the value added, defaults to 1
+        """
+        with self._lock:
+            self._counters[(name, host, outcome)] += value
+
+    def observe(self, stage: str, seconds: float, host: str = "", outcome: str = ""):
+        """Records the time taken by a stage in its histogram.
+
+        Arguments:
+            stage {str} -- the stage timed
+            seconds {float} -- the time taken
+            host {str} -- optional, the host label, defaults to ""
+            outcome {str} -- optional, the outcome label, defaults to ""
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (stage, host, outcome)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the recorded metrics.
+
+        Returns:
+            {dict} -- "counters", a list of {name, host, outcome, value}, and "stages", a list of
+                      {stage, host, outcome, count, sum, buckets}, with buckets as {upper bound: count}
+        """
+        with self._lock:
+            counters = [{"name": name, "host": host, "outcome": outcome, "value": value}
+                        for (name, host, outcome), value in sorted(self._counters.items())]
+            stages = [{"stage": stage, "host": host, "outcome": outcome, "count": histogram["count"],
+                       "sum": histogram["sum"],
+                       "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], histogram["buckets"]))}
+                      for (stage, host, outcome), histogram in sorted(self._histograms.items())]
+        return {"started": self.started, "time": time.time(), "counters": counters, "stages": stages}
+
+    def to_prometheus(self) -> str:
+        """Formats the recorded metrics in the Prometheus text exposition format.
+
+        Returns:
+            {str} -- the metrics, with the stage histograms as {METRIC_PREFIX}_stage_seconds
+                     and each counter as {METRIC_PREFIX}_{name}_total
+        """
+        snapshot = self.snapshot()
+        lines = []
+        names = sorted({counter["name"] for counter in snapshot["counters"]})
+        for name in names:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            # Values are written in full, as byte counters soon outgrow the six digits of a general format
+            lines.append(f"# TYPE {metric} counter")
+            for counter in snapshot["counters"]:
+                if counter["name"] == name:
+                    lines.append(f"{metric}{_labels(host=counter['host'], outcome=counter['outcome'])} {counter['value']}")
+
+        if snapshot["stages"]:
+            metric = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# HELP {metric} Time taken by each stage of a sweep.")
+            lines.append(f"# TYPE {metric} histogram")
+        for stage in snapshot["stages"]:
+            labels = {"stage": stage["stage"], "host": stage["host"], "outcome": stage["outcome"]}
+            cumulative = 0
+            for bound, count in stage["buckets"].items():
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(**labels, le=bound)} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(**labels)} {stage['sum']:.6f}")
+            lines.append(f"{metric}_count{_labels(**labels)} {stage['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list:
+        """Returns the total time of each stage and host, largest first, to find where a sweep's time goes.
+
+        Returns:
+            {list} -- tuples of (stage, host, count, total seconds)
+        """
+        totals = Counter()
+        counts = Counter()
+        for stage in self.snapshot()["stages"]:
+            totals[(stage["stage"], stage["host"])] += stage["sum"]
+            counts[(stage["stage"], stage["host"])] += stage["count"]
+        return [(stage, host, counts[(stage, host)], seconds) for (stage, host), seconds in totals.most_common()]
+
+def _labels(**labels) -> str:
+    escaped = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                       for name, value in labels.items())
+    return "{" + escaped + "}"
+
+class _Timer:
+    # Times a stage into the registry, with an outcome of "error" if the block raises
+    __slots__ = ("registry", "stage", "host", "outcome", "started")
+
+    def __init__(self, registry: MetricsRegistry, stage: str, host: str, outcome: str):
+        self.registry = registry
+        self.stage = stage
+        self.host = host
+        self.outcome = outcome
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        outcome = "error" if exc_type is not None else self.outcome
+        self.registry.observe(self.stage, time.perf_counter() - self.started, self.host, outcome)
+        return False
+
+class _NullTimer:
+    # The timer returned while metrics are disabled, which records nothing
+    __slots__ = ()
+
+    outcome = property(lambda self: None, lambda self, value: None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def enable(buckets: tuple = LATENCY_BUCKETS) -> MetricsRegistry:
+    """Starts recording metrics into a new registry, unless metrics are already enabled.
+
+    Arguments:
+        buckets {tuple} -- optional, ascending upper bounds of the histogram buckets, defaults to LATENCY_BUCKETS
+
+    Returns:
+        {MetricsRegistry} -- the registry recording metrics
+    """
+    global _registry # pylint: disable=global-statement
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(buckets)
+        return _registry
+
+def disable():
+    """Stops recording metrics, discarding the registry."""
+    global _registry # pylint: disable=global-statement
+    with _registry_lock:
+        _registry = None
+
+def registry() -> MetricsRegistry:
+    """Returns the registry recording metrics.
+
+    Returns:
+        {MetricsRegistry} -- the registry, None while metrics are disabled
+    """
+    return _registry
+
+def timer(stage: str, url: str = None, host: str = "", outcome: str = "ok"):
+    """Returns a context timing a stage into its histogram. The outcome may be changed
+    within the block by setting the outcome attribute of the context, and is "error"
+    if the block raises. While metrics are disabled, a shared no-op context is returned.
+
+    Arguments:
+        stage {str} -- the stage timed, one of STAGES
+        url {str} -- optional, a url whose host labels the stage, defaults to None
+        host {str} -- optional, the host label if no url is given, defaults to ""
+        outcome {str} -- optional, the outcome label, defaults to "ok"
+
+    Returns:
+        {context} -- the timer
+    """
+    current = _registry
+    if current is None:
+        return _NULL_TIMER
+    return _Timer(current, stage, host_of(url) if url else host, outcome)
+
+def count(name: str, url: str = None, host: str = "", outcome: str = "", value: float = 1):
+    """Adds a value to a counter, doing nothing while metrics are disabled.
+
+    Arguments:
+        name {str} -- the name of the counter
+        url {str} -- optional, a url whose host labels the counter, defaults to None
+        host {str} -- optional, the host label if no url is given, defaults to ""
+        outcome {str} -- optional, the outcome label, defaults to ""
+        value {float} -- optional, the value added, defaults to 1
+    """
+    current = _registry
+    if current is not None:
+        current.count(name, host_of(url) if url else host, outcome, value)
+
+def _write(path: str, text: str) -> str:
+    # Written beside the target and renamed over it, so a collector never reads a partial file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+    return path
+
+def write_prometheus(path: str = os.path.join(DEFAULT_METRICS_DIR, "pricepal.prom")) -> str:
+    """Writes the recorded metrics as a Prometheus text file.
+
+    Arguments:
+        path {str} -- optional, the path of the file, defaults to pricepal.prom under DEFAULT_METRICS_DIR
+
+    Returns:
+        {str} -- the path written, None while metrics are disabled
+    """
+    current = _registry
+    if current is None:
+        logging.warning("Cannot write metrics to 'path:%s' as metrics are disabled.", path)
+        return None
+    return _write(path, current.to_prometheus())
+
+def write_json(path: str = os.path.join(DEFAULT_METRICS_DIR, "pricepal.json")) -> str:
+    """Writes the recorded metrics as a JSON snapshot.
+
+    Arguments:
+        path {str} -- optional, the path of the file, defaults to pricepal.json under DEFAULT_METRICS_DIR
+
+    Returns:
+        {str} -- the path written, None while metrics are disabled
+    """
+    current = _registry
+    if current is None:
+        logging.warning("Cannot write metrics to 'path:%s' as metrics are disabled.", path)
+        return None
+    return _write(path, json.dumps(current.snapshot(), indent=1))
+
+@contextlib.contextmanager
+def profile(path: str = None, top: int = 25):
+    """Profiles a block, such as a single sweep, with cProfile. The stats are written
+    for pstats or snakeviz, and the functions with the largest cumulative time logged.
+
+    Arguments:
+        path {str} -- optional, the path of the stats, defaults to a timestamped .prof file under DEFAULT_METRICS_DIR
+        top {int} -- optional, the number of functions logged, defaults to 25
+
+    Yields:
+        {cProfile.Profile} -- the profiler
+    """
+    path = path or os.path.join(DEFAULT_METRICS_DIR, time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+        logging.debug("Wrote profile to 'path:%s'.\n%s", path, report.getvalue())
+
+class Sampler:
+    """A sampling profiler, which records the stack of every other running thread at an
+    interval. Unlike cProfile it also sees the worker threads of a batch request, and
+    adds little overhead. Stacks are counted in the collapsed format of flame graphs.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Initializes a sampler, without yet sampling.
+
+        Arguments:
+            interval {float} -- optional, seconds between samples, defaults to DEFAULT_SAMPLE_INTERVAL
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts sampling on a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """Returns the counted stacks as lines of "frame;frame;... count", outermost frame first."""
+        return "".join(f"{stack} {samples}\n" for stack, samples in self.stacks.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items(): # pylint: disable=protected-access
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                thread_name = names.get(ident, str(ident)).split("_")[0]
+                self.stacks[";".join([thread_name] + stack[::-1])] += 1
+
+@contextlib.contextmanager
+def sample(path: str = None, interval: float = DEFAULT_SAMPLE_INTERVAL):
+    """Profiles a block, such as a single sweep, with a Sampler, writing the collapsed stacks.
+
+    Arguments:
+        path {str} -- optional, the path of the stacks, defaults to a timestamped file under DEFAULT_METRICS_DIR
+        interval {float} -- optional, seconds between samples, defaults to DEFAULT_SAMPLE_INTERVAL
+
+    Yields:
+        {Sampler} -- the sampler
+    """
+    path = path or os.path.join(DEFAULT_METRICS_DIR, time.strftime("samples-%Y%m%d-%H%M%S.collapsed"))
+    sampler = Sampler(interval)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        _write(path, sampler.collapsed())
+        logging.debug("Wrote 'samples:%s' of stacks to 'path:%s'.", sampler.samples, path)
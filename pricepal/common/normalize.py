@@ -0,0 +1,203 @@
+"""
+Summary:
+
+This module contains the normalization stage, which turns the raw price
+and stock strings scraped from a sweep into compact typed columns:
+    - price_cents : Int64 price in the minor unit of its currency,
+    - currency : categorical ISO 4217 currency code,
+    - stock : int32 lower bound on the units in stock, as kept by the history store,
+    - stock_status : categorical state of the stock, one of STOCK_STATES.
+
+Values are normalized a whole column at a time. A sweep repeats the same
+few price and stock strings many times over, so each distinct string is
+parsed once, with pandas string operations over the distinct strings,
+and the results are gathered back to every row. Thousands and decimal
+separators are told apart by position, so "$1,299.99", "1.299,99 €" and
+"1 299,99 €" all normalize to 129999 cents.
+
+Values which cannot be parsed do not raise; they are left missing in the
+typed columns and returned in a table of rejects, alongside the reason.
+
+Functions:
+    normalize_prices() : parse price strings to cents and currency codes.
+    normalize_stock() : parse stock strings to unit counts and stock states.
+    normalize_sweep() : replace the raw price and stock columns of a sweep with typed columns.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import UNKNOWN_STOCK
+
+# Constants ===========================================================
+
+DEFAULT_CURRENCY = "USD"
+# Currency of prices with no currency symbol or code, and of a bare "$".
+
+CURRENCY_SYMBOLS = {"US$": "USD", "CA$": "CAD", "C$": "CAD", "A$": "AUD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+# Currency symbols which identify a single currency, longest first within each prefix.
+
+CURRENCY_CODES = frozenset(("USD", "CAD", "AUD", "NZD", "EUR", "GBP", "JPY", "CNY", "CHF", "SEK", "NOK", "DKK", "PLN",
+                            "CZK", "HUF", "INR", "MXN", "BRL", "SGD", "HKD", "KRW", "ZAR"))
+# ISO 4217 codes recognised in a price, in any case. Other three letter words, such as "per" or "now", are not codes.
+
+STOCK_STATES = ("unknown", "out_of_stock", "in_stock")
+# States of the stock_status column.
+
+OUT_OF_STOCK_TOKENS = ("-", "—", "–", "0", "none", "out of stock", "sold out", "unavailable", "not available")
+IN_STOCK_TOKENS = ("in stock", "available", "yes", "limited stock", "low stock", "limited")
+# Stock strings, matched case insensitively, which give a state without a count.
+# An in stock string without a count is normalized to a stock of 1.
+
+REJECT_COLUMNS = ("row", "column", "value", "reason")
+# Columns of the table of rejected values.
+
+MAX_PRICE_DIGITS = 15
+# Longest whole part of a price, beyond which it is rejected rather than overflowing.
+
+# =====================================================================
+
+_SYMBOL_PATTERN = "|".join([symbol.replace("$", r"\$") for symbol in CURRENCY_SYMBOLS] + [r"\$"])
+_CODE_PATTERN = r"\b((?i:" + "|".join(sorted(CURRENCY_CODES)) + r"))\b"
+_PRICE_PATTERN = r"^(?P<sign>-)?(?P<whole>\d+|\d{1,3}(?:[.,]\d{3})+)(?:[.,](?P<frac>\d{1,2}))?$"
+_GROUP_SPACE_PATTERN = r"(?<=\d)[ ']+(?=\d{3}(?!\d))"
+_STOCK_COUNT_PATTERN = r"^(?:only\s+)?(?P<count>\d+)\s*(?P<plus>\+)?\s*(?:left|in stock|available|units?|pcs)?$"
+
+def _distinct(values) -> tuple:
+    # Returns the codes of each value and its distinct strings, missing values have code -1
+    series = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object).map(str)
+    return series.index, codes, uniques
+
+def _rejects(index, codes: np.ndarray, uniques: pd.Series, reasons: np.ndarray, column: str) -> pd.DataFrame:
+    # Gathers the rows whose distinct string has a reason for its rejection
+    rejected = np.append(pd.notna(reasons), False)
+    rows = np.flatnonzero(rejected[codes])
+    return pd.DataFrame({"row": index[rows], "column": column,
+                         "value": uniques.to_numpy()[codes[rows]],
+                         "reason": reasons[codes[rows]]}, columns=list(REJECT_COLUMNS))
+
+def normalize_prices(values, default_currency: str = DEFAULT_CURRENCY, column: str = "price") -> tuple:
+    """Parses price strings to integer cents and currency codes. Missing or blank
+    values are left missing, and values which cannot be parsed are rejected.
+
+    Arguments:
+        values {iterable} -- the raw price strings, for example "$1,299.99" or "1 299,99 €"
+        default_currency {str} -- optional, currency of a bare "$" or of no symbol, defaults to DEFAULT_CURRENCY
+        column {str} -- optional, the column named in the rejects, defaults to "price"
+
+    Returns:
+        {tuple} -- (prices, rejects), prices is a DataFrame with the columns price_cents and currency
+                   in the order of values, rejects is a DataFrame with the columns REJECT_COLUMNS
+    """
+    index, codes, uniques = _distinct(values)
+
+    text = uniques.str.replace(r"\s+", " ", regex=True).str.strip()
+    symbols = text.str.extract(f"({_SYMBOL_PATTERN})", expand=False)
+    currency_codes = text.str.extract(_CODE_PATTERN, expand=False).str.upper()
+    currency = currency_codes.fillna(symbols.map(CURRENCY_SYMBOLS)).fillna(default_currency)
+
+    number = text.str.replace(f"{_SYMBOL_PATTERN}|{_CODE_PATTERN}", "", regex=True).str.strip()
+    number = number.str.replace(_GROUP_SPACE_PATTERN, "", regex=True).str.replace(r"\s+", "", regex=True)
+    parts = number.str.extract(_PRICE_PATTERN)
+    whole = parts["whole"].str.replace(r"[.,]", "", regex=True)
+
+    blank = (text == "").to_numpy()
+    malformed = parts["whole"].isna().to_numpy() & ~blank
+    overflow = (whole.str.len().fillna(0) > MAX_PRICE_DIGITS).to_numpy()
+    valid = ~(blank | malformed | overflow)
+
+    # Distinct strings are followed by a missing entry, which missing values gather from
+    cents = np.zeros(len(uniques) + 1, dtype=np.int64)
+    if valid.any():
+        fraction = parts["frac"][valid].fillna("").str.ljust(2, "0")
+        amount = whole[valid].astype(np.int64).to_numpy() * 100 + fraction.astype(np.int64).to_numpy()
+        cents[:-1][valid] = np.where(parts["sign"][valid].notna().to_numpy(), -amount, amount)
+    valid = np.append(valid, False)
+    currency = np.append(currency.to_numpy(dtype=object), None)
+    currency[~valid] = None
+
+    prices = pd.DataFrame({"price_cents": pd.arrays.IntegerArray(cents[codes], ~valid[codes]),
+                           "currency": pd.Categorical(currency[codes])}, index=index)
+    reasons = np.where(overflow, "price too large", np.where(malformed, "unrecognized price", None))
+    rejects = _rejects(index, codes, uniques, reasons, column)
+    if len(rejects):
+        logging.debug("Rejected 'prices:%s' of 'values:%s' during normalization.", len(rejects), len(prices))
+    return prices, rejects
+
+def normalize_stock(values, column: str = "stock") -> tuple:
+    """Parses stock strings to a lower bound on the units in stock, and a stock state.
+    "5+" and "only 5 left" give a stock of 5, "-" and "sold out" give 0, and "in stock"
+    gives 1. Missing or blank values are unknown, and values which cannot be parsed are rejected.
+
+    Arguments:
+        values {iterable} -- the raw stock strings
+        column {str} -- optional, the column named in the rejects, defaults to "stock"
+
+    Returns:
+        {tuple} -- (stock, rejects), stock is a DataFrame with the columns stock and stock_status
+                   in the order of values, rejects is a DataFrame with the columns REJECT_COLUMNS
+    """
+    index, codes, uniques = _distinct(values)
+
+    text = uniques.str.replace(r"\s+", " ", regex=True).str.strip().str.lower()
+    counts = text.str.extract(_STOCK_COUNT_PATTERN)["count"]
+    out_of_stock = text.isin(OUT_OF_STOCK_TOKENS)
+    in_stock = text.isin(IN_STOCK_TOKENS)
+    blank = text == ""
+
+    stock = np.full(len(uniques), UNKNOWN_STOCK, dtype=np.int32)
+    counted = counts.notna().to_numpy() & (counts.str.len().fillna(0) < 10).to_numpy()
+    stock[counted] = counts[counted].astype(np.int32)
+    stock[in_stock.to_numpy()] = 1
+    stock[out_of_stock.to_numpy()] = 0
+
+    status = np.zeros(len(uniques), dtype=np.int8)
+    status[stock > 0] = STOCK_STATES.index("in_stock")
+    status[stock == 0] = STOCK_STATES.index("out_of_stock")
+
+    reasons = np.where((stock == UNKNOWN_STOCK) & ~blank.to_numpy(), "unrecognized stock", None)
+
+    # Distinct strings are followed by an unknown entry, which missing values gather from
+    stock = np.append(stock, np.int32(UNKNOWN_STOCK))
+    status = np.append(status, np.int8(0))
+    result = pd.DataFrame({"stock": stock[codes],
+                           "stock_status": pd.Categorical.from_codes(status[codes], STOCK_STATES)}, index=index)
+    rejects = _rejects(index, codes, uniques, reasons, column)
+    if len(rejects):
+        logging.debug("Rejected 'stock:%s' of 'values:%s' during normalization.", len(rejects), len(result))
+    return result, rejects
+
+def normalize_sweep(sweep: pd.DataFrame, price_column: str = "price", stock_column: str = "stock",
+                    default_currency: str = DEFAULT_CURRENCY) -> tuple:
+    """Replaces the raw price and stock columns of a sweep with the typed columns price_cents,
+    currency, stock and stock_status. Other columns are kept unchanged, so the result of a
+    sweep with product_id and ts columns may be appended to a HistoryStore directly.
+
+    Arguments:
+        sweep {pandas.DataFrame} -- one row per scraped product, with raw price and stock strings
+        price_column {str} -- optional, the column of raw prices, defaults to "price"
+        stock_column {str} -- optional, the column of raw stock, defaults to "stock"
+        default_currency {str} -- optional, currency of a bare "$" or of no symbol, defaults to DEFAULT_CURRENCY
+
+    Returns:
+        {tuple} -- (normalized, rejects), normalized is the sweep with typed columns, rejects is a
+                   DataFrame with the columns REJECT_COLUMNS, identifying rows by their index in the sweep
+    """
+    prices, price_rejects = normalize_prices(sweep[price_column], default_currency, price_column)
+    stock, stock_rejects = normalize_stock(sweep[stock_column], stock_column)
+    normalized = sweep.drop(columns=[price_column, stock_column])
+    normalized = pd.concat([normalized, prices, stock], axis=1)
+    rejects = pd.concat([price_rejects, stock_rejects], ignore_index=True)
+    if len(rejects):
+        logging.warning("Rejected 'values:%s' of 'rows:%s' in sweep normalization.", len(rejects), len(sweep))
+    return normalized, rejects
@@ -0,0 +1,217 @@
+"""
+Summary:
+
+This module contains the process pool which moves page parsing off the
+fetching process. Fetching is bound by network round trips and is served
+well by threads, but parsing with Beautiful soup is pure-Python, CPU bound
+work which a single process cannot spread beyond one core.
+Raw page bodies are handed to a pool of worker processes which each hold
+the extraction spec, and only the small extracted records are returned.
+The number of bodies waiting on or inside the pool is bounded, so a fast
+fetch stage cannot outrun the parse stage and exhaust memory.
+
+Classes:
+    ParsePool : a pool of worker processes extracting the fields of an extraction spec from raw pages.
+
+Functions:
+    fetch_and_extract_many() : fetches a batch of urls with threads and extracts their fields in a ParsePool.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec, available_parser, extract
+from pricepal.common.fetch_policy import FetchPolicy
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.snapshot_archive import SnapshotArchive
+
+# =====================================================================
+
+_worker_state = {}
+
+def _init_worker(spec: ExtractionSpec, parser: str):
+    # Each worker receives the spec once, so that only page bodies are sent per task
+    _worker_state["spec"] = spec
+    _worker_state["parser"] = parser
+
+def _extract_in_worker(content: bytes) -> dict:
+    return extract(content, _worker_state["spec"], _worker_state["parser"])
+
+class ParsePool:
+    """A pool of worker processes which extract the fields described by an
+    extraction spec from raw page bodies.
+
+    Pages are supplied as an iterable of (url, body) pairs and consumed on a
+    feeder thread. At most max_pending bodies are held by the pool, or by
+    results not yet taken by the caller, at any time; beyond that the feeder
+    blocks, which in turn stops it pulling further pages from the iterable.
+    """
+
+    def __init__(self, spec: ExtractionSpec, parser: str = None, workers: int = None, max_pending: int = None):
+        """Starts the worker processes of the pool.
+
+        Arguments:
+            spec {ExtractionSpec} -- the spec describing the fields to extract
+            parser {str} -- optional, the parser to be used by Beautiful soup, defaults to the fastest installed parser
+            workers {int} -- optional, number of worker processes, defaults to the number of cores
+            max_pending {int} -- optional, bound on the bodies queued in the pool, defaults to twice the workers
+        """
+        self.spec = spec
+        self.parser = parser or available_parser()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        # Workers are started from the feeder thread while fetch threads hold locks, which a forked
+        # worker would inherit held, so they are started from a clean forkserver or spawned process instead
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method),
+                                             initializer=_init_worker, initargs=(spec, self.parser))
+        logging.debug("Started parse pool of 'workers:%s' for 'spec:%s'.", self.workers, spec.name)
+
+    def close(self):
+        """Stops the worker processes, abandoning any queued bodies."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def extract_many(self, pages):
+        """Extracts the fields of each page in the pool, yielding each result as soon
+        as it completes rather than in the order supplied.
+
+        Arguments:
+            pages {iterable} -- pairs of (url, item), where item is the raw body of the page as bytes.
+                                Items which are not bytes, such as None or an exception from the fetch
+                                stage, are passed through to the results unchanged.
+
+        Yields:
+            {tuple} -- pairs of (url, result), where result is the mapping of field name to value,
+                       the passed-through item, or the exception raised while extracting
+        """
+
+        results = queue.Queue()
+        slots = threading.BoundedSemaphore(self.max_pending)
+        stop = threading.Event()
+        feeder = threading.Thread(target=self._feed, args=(pages, results, slots, stop), daemon=True)
+        feeder.start()
+
+        received = 0
+        expected = None
+        try:
+            while expected is None or received < expected:
+                kind, url, payload = results.get()
+                if kind == "done":
+                    expected = payload
+                    continue
+                if kind == "failed":
+                    raise payload
+                if kind == "parsed":
+                    received += 1
+                    slots.release()
+                    try:
+                        payload = payload.result()
+                    except Exception as error: # pylint: disable=broad-except
+                        logging.warning("Failed extraction of 'url:%s' with 'error:%r'.", url, error)
+                        payload = error
+                yield url, payload
+        finally:
+            stop.set()
+            feeder.join()
+
+    def _feed(self, pages, results: queue.Queue, slots: threading.BoundedSemaphore, stop: threading.Event):
+        submitted = 0
+        try:
+            for url, item in pages:
+                if not isinstance(item, (bytes, bytearray)):
+                    results.put(("passed", url, item))
+                    continue
+
+                # Wait for a free slot, applying backpressure to the page iterable
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+
+                future = self._executor.submit(_extract_in_worker, item)
+                future.add_done_callback(lambda done, url=url: results.put(("parsed", url, done)))
+                submitted += 1
+        except Exception as error: # pylint: disable=broad-except
+            results.put(("failed", None, error))
+        finally:
+            results.put(("done", None, submitted))
+
+def fetch_and_extract_many(urls, pool: ParsePool, max_workers: int = scraper.DEFAULT_MAX_WORKERS,
+                           max_per_host: int = scraper.DEFAULT_MAX_PER_HOST, timeout: float = scraper.DEFAULT_TIMEOUT,
+                           cache: ResponseCache = None, policy: FetchPolicy = None, archive: SnapshotArchive = None,
+                           skip_unchanged: bool = False):
+    """Requests a batch of urls concurrently on threads, and extracts the fields of each
+    page in the worker processes of a ParsePool, yielding each result as it completes.
+    Requests are scheduled exactly as in scrape_engine.request_and_parse_many.
+    Pages which the cache confirms to be unchanged reuse their memoized fields
+    without being sent to the pool. With skip_unchanged, pages whose field regions
+    are unchanged are not sent to the pool either, and yield scrape_engine.UNCHANGED,
+    while the fingerprint of any other page is yielded with its values to be recorded
+    once they are stored, as in scrape_engine.request_and_extract.
+
+    Arguments:
+        urls {iterable} -- the complete urls of the webpages to be requested
+        pool {ParsePool} -- the pool extracting the fields of each page
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of each page, defaults to None for no snapshots
+        skip_unchanged {bool} -- optional, yield UNCHANGED for pages with unchanged field regions, defaults to False
+
+    Yields:
+        {tuple} -- pairs of (url, result), where result is the scrape_engine.Extracted values of the page, UNCHANGED,
+                   None if the response status prevented a parse, or the exception raised by the request
+    """
+
+    memo_key = f"{pool.spec.key}:{pool.parser}"
+    digests = {}
+    fingerprints = {}
+
+    def pages():
+        for url, fetched in scraper.request_content_many(urls, max_workers, max_per_host, timeout, cache, policy,
+                                                                 archive):
+            if not isinstance(fetched, tuple):
+                yield url, fetched
+                continue
+            content, digest = fetched
+            if skip_unchanged and cache is not None:
+                fingerprint = scraper.changed_fingerprint(url, content, pool.spec, cache)
+                if fingerprint == scraper.UNCHANGED:
+                    yield url, scraper.UNCHANGED
+                    continue
+                fingerprints[url] = fingerprint
+            if cache is not None and digest is not None:
+                memo = cache.extracted(url, digest, memo_key)
+                if memo is not None:
+                    yield url, memo
+                    continue
+                digests[url] = digest
+            yield url, content
+
+    for url, result in pool.extract_many(pages()):
+        digest = digests.pop(url, None)
+        fingerprint = fingerprints.pop(url, None)
+        if isinstance(result, dict):
+            if digest is not None:
+                cache.remember_extracted(url, digest, memo_key, result)
+            result = scraper.Extracted(result, fingerprint)
+        yield url, result
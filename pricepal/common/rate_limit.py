@@ -0,0 +1,119 @@
+"""
+Summary:
+
+This module contains the rate limiting primitives shared by the
+scheduling and fetching code. Limits are expressed as token buckets,
+which allow short bursts up to a capacity while holding the long-run
+rate to a fixed number of operations per second.
+
+Classes:
+    TokenBucket : a thread-safe token bucket with an injectable clock.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import threading
+import time
+
+# =====================================================================
+
+class TokenBucket:
+    """A token bucket refilled continuously at a fixed rate up to its capacity.
+    Each operation takes one or more tokens, and operations are refused, or
+    delayed, while the bucket is empty.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        """Initializes a full bucket.
+
+        Arguments:
+            rate {float} -- tokens added per second
+            capacity {float} -- optional, largest number of tokens held, defaults to one second of tokens (at least 1)
+            clock {callable} -- optional, returns the current time in seconds, defaults to time.monotonic
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """{float} -- the number of tokens currently available"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes tokens from the bucket if enough are available, without waiting.
+
+        Arguments:
+            tokens {float} -- optional, the number of tokens to take, defaults to 1.0
+
+        Returns:
+            {bool} -- True if the tokens were taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire_up_to(self, tokens: int) -> int:
+        """Takes as many whole tokens as are available, up to the number requested.
+
+        Arguments:
+            tokens {int} -- the largest number of tokens to take
+
+        Returns:
+            {int} -- the number of tokens taken
+        """
+        with self._lock:
+            self._refill()
+            taken = int(min(tokens, self._tokens))
+            self._tokens -= taken
+            return taken
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Returns the time until the given number of tokens will be available.
+
+        Arguments:
+            tokens {float} -- optional, the number of tokens required, defaults to 1.0
+
+        Returns:
+            {float} -- seconds to wait, 0.0 if the tokens are available now
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                return 0.0
+            return (tokens - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Takes tokens from the bucket, sleeping until they are available.
+
+        Arguments:
+            tokens {float} -- optional, the number of tokens to take, defaults to 1.0
+            timeout {float} -- optional, longest time to wait in seconds, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if the tokens were taken, False if the timeout expired first
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while not self.try_acquire(tokens):
+            wait = self.delay(tokens)
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0 or wait > remaining:
+                    return False
+            time.sleep(wait)
+        return True
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
@@ -0,0 +1,314 @@
+"""
+Summary:
+
+This module contains a persistent, size-bounded cache of page responses.
+It allows scrape_engine to make conditional requests, sending the
+validators (ETag / Last-Modified) of the last response it saw for a url,
+and to recognise when a page is unchanged so that it can skip both the
+download and the parse of that page.
+
+Entries are stored in a small sqlite database under the data directory,
+with each body held compressed alongside its digest and validators.
+The least recently used entries are evicted once the stored bodies
+exceed the configured size.
+
+The cache also keeps the region fingerprint of each url, see
+extraction.region_fingerprint(), so that a page whose fields are
+unchanged since the previous sweep can be recognised without parsing it,
+and the fields last extracted from each url's body, so that a body which
+is unchanged is not extracted again, in any later sweep or process.
+
+Classes:
+    ResponseCache : on-disk conditional request cache, with a memo of extracted fields and of parse results.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Local Application Libraries
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, "cache", "responses.sqlite3")
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Upper bound on the total size of the compressed bodies held on disk.
+
+DEFAULT_MAX_PARSED = 256
+# Number of BeautifulSoup parse results held in memory, keyed by url. These only help a url fetched again
+# within this many other urls, not a sweep of a larger watchlist, whose extracted fields are kept on disk instead.
+
+# =====================================================================
+
+def body_digest(content: bytes) -> str:
+    """Returns the hex digest used to recognise identical response bodies.
+
+    Arguments:
+        content {bytes} -- the raw body of a response
+
+    Returns:
+        {str} -- the sha256 hex digest of the body
+    """
+    return hashlib.sha256(content).hexdigest()
+
+class ResponseCache:
+    """A persistent cache of page responses keyed by url.
+
+    For every url the cache records the last body seen (compressed), its
+    digest, and the ETag and Last-Modified validators sent by the server.
+    The cache also memoizes the fields extracted from the body of every url
+    on disk, and a bounded number of BeautifulSoup parse results in memory,
+    so that a page which is confirmed unchanged, either by a 304 response
+    or by an identical body digest, need not be extracted or parsed again.
+
+    Note: memoized parse results are shared between callers and should be
+    treated as read-only.
+
+    The cache is safe to share between the threads of a batch request.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_parsed: int = DEFAULT_MAX_PARSED):
+        """Opens, or creates, the cache database at the given path.
+
+        Arguments:
+            path {str} -- optional, location of the sqlite database, defaults to DEFAULT_CACHE_PATH
+            max_bytes {int} -- optional, bound on the total compressed size of bodies, defaults to DEFAULT_MAX_BYTES
+            max_parsed {int} -- optional, number of soups memoized in memory, defaults to DEFAULT_MAX_PARSED
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_parsed = max_parsed
+        self.hits = 0
+        self.misses = 0
+        self._parsed = OrderedDict()
+        self._lock = threading.RLock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                 "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+                                 "digest TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL, "
+                                 "accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS fingerprints ("
+                                 "url TEXT NOT NULL, key TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                                 "PRIMARY KEY (url, key))")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS extracted ("
+                                 "url TEXT NOT NULL, key TEXT NOT NULL, digest TEXT NOT NULL, fields TEXT NOT NULL, "
+                                 "PRIMARY KEY (url, key))")
+        self._connection.commit()
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        """{int} -- the total compressed size of the bodies currently held"""
+        return self._total_bytes
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM responses WHERE url = ?", (url,)).fetchone() is not None
+
+    def conditional_headers(self, url: str) -> dict:
+        """Returns the request headers needed to revalidate the cached response of a url.
+
+        Arguments:
+            url {str} -- the complete url of the webpage to be requested
+
+        Returns:
+            {dict} -- If-None-Match and/or If-Modified-Since headers, empty if the url is not cached
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT etag, last_modified FROM responses WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def not_modified(self, url: str):
+        """Returns the cached body of a url after the server has answered 304 Not Modified.
+
+        Arguments:
+            url {str} -- the complete url of the webpage which was requested
+
+        Returns:
+            {tuple} -- pair of (body, digest), or None if the url is no longer cached
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT body, digest FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch(url)
+            self.hits += 1
+        return zlib.decompress(row[0]), row[1]
+
+    def update(self, url: str, content: bytes, etag: str = None, last_modified: str = None):
+        """Records a full response for a url, replacing the stored body only if it changed.
+
+        Arguments:
+            url {str} -- the complete url of the webpage which was requested
+            content {bytes} -- the raw body of the response
+            etag {str} -- optional, the ETag header of the response, defaults to None
+            last_modified {str} -- optional, the Last-Modified header of the response, defaults to None
+
+        Returns:
+            {tuple} -- pair of (digest, changed), where changed is False if the body matched the cached body
+        """
+        digest = body_digest(content)
+        with self._lock:
+            row = self._connection.execute("SELECT digest FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is not None and row[0] == digest:
+                self._connection.execute("UPDATE responses SET etag = ?, last_modified = ?, accessed = ? WHERE url = ?",
+                                         (etag, last_modified, time.time(), url))
+                self._connection.commit()
+                self.hits += 1
+                return digest, False
+
+            body = zlib.compress(content)
+            old_size = self._connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (url, etag, last_modified, digest, body, len(body), time.time()))
+            self._total_bytes += len(body) - (old_size[0] if old_size else 0)
+            self._evict()
+            self._connection.commit()
+            self.misses += 1
+        return digest, True
+
+    def parsed(self, url: str, digest: str, key):
+        """Returns the memoized parse result of a url, if it was made from the body with the given digest.
+
+        Arguments:
+            url {str} -- the complete url of the webpage
+            digest {str} -- digest of the body which the caller would otherwise parse
+            key {hashable} -- identifies how the body was parsed, for example the parser name
+
+        Returns:
+            {object} -- the memoized parse result, or None if there is no matching result
+        """
+        with self._lock:
+            memo = self._parsed.get(url)
+            if memo is None or memo[0] != digest or memo[1] != key:
+                return None
+            self._parsed.move_to_end(url)
+            return memo[2]
+
+    def remember_parsed(self, url: str, digest: str, key, result):
+        """Memoizes the parse result of a url, evicting the least recently used result if full.
+
+        Arguments:
+            url {str} -- the complete url of the webpage
+            digest {str} -- digest of the body which was parsed
+            key {hashable} -- identifies how the body was parsed, for example the parser name
+            result {object} -- the parse result to memoize
+        """
+        with self._lock:
+            self._parsed[url] = (digest, key, result)
+            self._parsed.move_to_end(url)
+            while len(self._parsed) > self.max_parsed:
+                self._parsed.popitem(last=False)
+
+    def extracted(self, url: str, digest: str, key: str):
+        """Returns the fields last extracted from the body of a url, if they were extracted from the body
+        with the given digest. Unlike parse results, these are kept on disk for every url in the cache.
+
+        Arguments:
+            url {str} -- the complete url of the webpage
+            digest {str} -- digest of the body which the caller would otherwise extract from
+            key {str} -- identifies how the fields were extracted, such as the key of the extraction spec and the parser
+
+        Returns:
+            {dict} -- the mapping of field name to value, or None if there are no matching fields
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT fields FROM extracted WHERE url = ? AND key = ? AND digest = ?",
+                                           (url, key, digest)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def remember_extracted(self, url: str, digest: str, key: str, fields: dict):
+        """Records the fields extracted from the body of a url, replacing those of any earlier body.
+
+        Arguments:
+            url {str} -- the complete url of the webpage
+            digest {str} -- digest of the body the fields were extracted from
+            key {str} -- identifies how the fields were extracted, such as the key of the extraction spec and the parser
+            fields {dict} -- the mapping of field name to value
+        """
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO extracted VALUES (?, ?, ?, ?)",
+                                     (url, key, digest, json.dumps(fields)))
+            self._connection.commit()
+
+    def fingerprint(self, url: str, key: str) -> str:
+        """Returns the region fingerprint recorded for a url.
+
+        Arguments:
+            url {str} -- the complete url of the webpage
+            key {str} -- identifies the regions fingerprinted, the key of the extraction spec
+
+        Returns:
+            {str} -- the fingerprint of the url, None if it has none
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT fingerprint FROM fingerprints WHERE url = ? AND key = ?",
+                                           (url, key)).fetchone()
+        return None if row is None else row[0]
+
+    def record_fingerprints(self, key: str, fingerprints: dict):
+        """Records the region fingerprints of a number of urls, replacing those they had.
+        Fingerprints are not evicted with responses, as they are far smaller.
+
+        Arguments:
+            key {str} -- identifies the regions fingerprinted, the key of the extraction spec
+            fingerprints {dict} -- mapping of the complete url of each webpage to the fingerprint of its current page
+        """
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)",
+                                         [(url, key, fingerprint) for url, fingerprint in fingerprints.items()])
+            self._connection.commit()
+
+    def _touch(self, url: str):
+        self._connection.execute("UPDATE responses SET accessed = ? WHERE url = ?", (time.time(), url))
+        self._connection.commit()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._connection.execute("SELECT url, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                self._connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._connection.execute("DELETE FROM extracted WHERE url = ?", (url,))
+                self._parsed.pop(url, None)
+                self._total_bytes -= size
+                logging.debug("Evicted cached response of 'url:%s' to bound the cache size.", url)
+                if self._total_bytes <= self.max_bytes:
+                    break
@@ -0,0 +1,256 @@
+"""
+Summary:
+
+This module contains the adaptive polling scheduler, the higher level
+scheduling left out of scope by scrape_engine. Rather than polling every
+product on a fixed interval, each product's interval adapts to how often
+its price or stock has actually been seen to change: a change tightens
+the interval, and each unchanged poll relaxes it, within fixed bounds.
+Intervals are tightened further around known sale events, and the total
+number of products released for polling is held to a global budget per
+minute.
+
+Products are kept in a priority queue ordered by their next due time,
+so the most overdue products are always released first.
+
+Classes:
+    AdaptiveScheduler : priority queue of next-due products with per-product adaptive intervals.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# Local Application Libraries
+from pricepal.common.rate_limit import TokenBucket
+
+# Constants ===========================================================
+
+DEFAULT_BUDGET_PER_MINUTE = 600
+DEFAULT_MIN_INTERVAL = 5 * 60
+DEFAULT_MAX_INTERVAL = 24 * 60 * 60
+DEFAULT_INTERVAL = 60 * 60
+# Intervals are in seconds.
+
+DEFAULT_GROWTH = 1.5
+# Factor applied to a product's interval after a poll which saw no change.
+
+DEFAULT_SHRINK = 0.25
+# Factor applied to a product's interval after a poll which saw a change.
+
+DEFAULT_SALE_INTERVAL = 15 * 60
+DEFAULT_SALE_LEAD = 60 * 60
+# Largest interval used around a sale event, and how long before the event it applies.
+
+# =====================================================================
+
+class _ProductState:
+    __slots__ = ("interval", "due", "polls", "changes", "last_change", "in_flight")
+
+    def __init__(self, interval: float, due: float):
+        self.interval = interval
+        self.due = due
+        self.polls = 0
+        self.changes = 0
+        self.last_change = None
+        self.in_flight = False
+
+class AdaptiveScheduler:
+    """A priority queue of products ordered by the time each is next due to be polled.
+
+    Products released by release_due() are considered in flight until their
+    poll is reported with record(), which adapts the product's interval to
+    whether the poll saw a change, and queues its next poll.
+
+    The scheduler is safe to share between threads. Time is read from an
+    injectable clock, in seconds, so that it may be driven by tests.
+    """
+
+    def __init__(self, budget_per_minute: float = DEFAULT_BUDGET_PER_MINUTE, min_interval: float = DEFAULT_MIN_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_INTERVAL, default_interval: float = DEFAULT_INTERVAL,
+                 growth: float = DEFAULT_GROWTH, shrink: float = DEFAULT_SHRINK,
+                 sale_interval: float = DEFAULT_SALE_INTERVAL, clock=time.time):
+        """Initializes an empty scheduler.
+
+        Arguments:
+            budget_per_minute {float} -- optional, most products released per minute, defaults to DEFAULT_BUDGET_PER_MINUTE
+            min_interval {float} -- optional, shortest interval between polls of a product, defaults to DEFAULT_MIN_INTERVAL
+            max_interval {float} -- optional, longest interval between polls of a product, defaults to DEFAULT_MAX_INTERVAL
+            default_interval {float} -- optional, starting interval of a new product, defaults to DEFAULT_INTERVAL
+            growth {float} -- optional, interval factor after an unchanged poll, defaults to DEFAULT_GROWTH
+            shrink {float} -- optional, interval factor after a changed poll, defaults to DEFAULT_SHRINK
+            sale_interval {float} -- optional, longest interval around a sale event, defaults to DEFAULT_SALE_INTERVAL
+            clock {callable} -- optional, returns the current time in seconds, defaults to time.time
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.growth = growth
+        self.shrink = shrink
+        self.sale_interval = sale_interval
+        self.budget = TokenBucket(budget_per_minute / 60.0, capacity=budget_per_minute, clock=clock)
+        self._clock = clock
+        self._products = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._sales = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def __contains__(self, product_id) -> bool:
+        return product_id in self._products
+
+    def add(self, product_id, interval: float = None, due: float = None):
+        """Adds a product to the scheduler, replacing its schedule if already present.
+
+        Arguments:
+            product_id {hashable} -- the id of the product
+            interval {float} -- optional, the starting interval of the product, defaults to default_interval
+            due {float} -- optional, the time of the first poll, defaults to now
+        """
+        with self._lock:
+            interval = self._clamp(interval if interval is not None else self.default_interval)
+            state = _ProductState(interval, self._clock() if due is None else due)
+            self._products[product_id] = state
+            self._push(product_id, state)
+
+    def remove(self, product_id):
+        """Removes a product from the scheduler, any queued poll of it is discarded.
+
+        Arguments:
+            product_id {hashable} -- the id of the product
+        """
+        with self._lock:
+            self._products.pop(product_id, None)
+
+    def add_sale_event(self, start: float, end: float, product_ids=None, lead: float = DEFAULT_SALE_LEAD):
+        """Registers a known sale event, during which, and for a lead time before which,
+        the interval of the affected products is capped at sale_interval.
+        Affected products due after the event window opens are brought forward.
+
+        Arguments:
+            start {float} -- the time the sale starts
+            end {float} -- the time the sale ends
+            product_ids {iterable} -- optional, the affected products, defaults to None for every product
+            lead {float} -- optional, seconds before the start at which polling tightens, defaults to DEFAULT_SALE_LEAD
+        """
+        with self._lock:
+            now = self._clock()
+            products = None if product_ids is None else frozenset(product_ids)
+            self._sales = [sale for sale in self._sales if sale[1] > now]
+            self._sales.append((start - lead, end, products))
+            opens = max(start - lead, now)
+            for product_id in (self._products if products is None else products):
+                state = self._products.get(product_id)
+                if state is not None and not state.in_flight and state.due > opens:
+                    state.due = opens
+                    self._push(product_id, state)
+        logging.debug("Registered sale event from 'start:%s' to 'end:%s'.", start, end)
+
+    def release_due(self, limit: int = None) -> list:
+        """Releases the products which are due, most overdue first, within the remaining
+        budget. Released products are in flight until their poll is recorded.
+
+        Arguments:
+            limit {int} -- optional, the most products to release, defaults to None for no limit beyond the budget
+
+        Returns:
+            {list} -- the ids of the released products
+        """
+        with self._lock:
+            now = self._clock()
+            released = []
+            while self._queue and (limit is None or len(released) < limit):
+                due, _, product_id = self._queue[0]
+                if due > now:
+                    break
+                state = self._products.get(product_id)
+                if state is None or state.in_flight or state.due != due:
+                    heapq.heappop(self._queue)
+                    continue
+                if not self.budget.try_acquire():
+                    logging.debug("Polling budget exhausted with products still due.")
+                    break
+                heapq.heappop(self._queue)
+                state.in_flight = True
+                released.append(product_id)
+            return released
+
+    def record(self, product_id, changed: bool):
+        """Records the result of a poll of a product, adapting its interval and queuing its next poll.
+        A failed poll should also be recorded, as unchanged, so that the product is queued again.
+
+        Arguments:
+            product_id {hashable} -- the id of the product which was polled
+            changed {bool} -- True if the poll saw a change of price or stock
+        """
+        with self._lock:
+            state = self._products.get(product_id)
+            if state is None:
+                return
+            now = self._clock()
+            state.polls += 1
+            state.in_flight = False
+            if changed:
+                state.changes += 1
+                state.last_change = now
+                state.interval = self._clamp(state.interval * self.shrink)
+            else:
+                state.interval = self._clamp(state.interval * self.growth)
+            state.due = now + self._effective_interval(product_id, state, now)
+            self._push(product_id, state)
+
+    def interval(self, product_id) -> float:
+        """Returns the interval a product would next be scheduled with, including any sale event cap.
+
+        Arguments:
+            product_id {hashable} -- the id of the product
+
+        Returns:
+            {float} -- the interval in seconds
+        """
+        with self._lock:
+            state = self._products[product_id]
+            return self._effective_interval(product_id, state, self._clock())
+
+    def time_until_due(self) -> float:
+        """Returns the time until the next product is due, 0.0 if a product is already due.
+
+        Returns:
+            {float} -- seconds until the next poll, None if nothing is queued
+        """
+        with self._lock:
+            self._discard_stale()
+            if not self._queue:
+                return None
+            return max(0.0, self._queue[0][0] - self._clock())
+
+    def _effective_interval(self, product_id, state: _ProductState, now: float) -> float:
+        interval = state.interval
+        for opens, closes, products in self._sales:
+            if (products is None or product_id in products) and now < closes and now + interval > opens:
+                interval = min(interval, max(self.sale_interval, opens - now))
+        return interval
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _push(self, product_id, state: _ProductState):
+        heapq.heappush(self._queue, (state.due, next(self._sequence), product_id))
+
+    def _discard_stale(self):
+        # Entries are stale if the product was removed, rescheduled, or is in flight
+        while self._queue:
+            due, _, product_id = self._queue[0]
+            state = self._products.get(product_id)
+            if state is not None and not state.in_flight and state.due == due:
+                return
+            heapq.heappop(self._queue)
@@ -6,8 +6,19 @@ This will handle instances/actions associated with price tracking
 data collection and cleaning, but will not perform any of the higher
 level scheduling and configuring.
 
+Classes:
+    Extracted : the field values extracted from a page, with the fingerprint of the page to record once they are stored.
+
 Functions:
     request_and_parse() : requests a url of a webpage and returns the BeautifulSoup of the response.
+    request_and_parse_many() : concurrently requests a batch of urls, yielding each BeautifulSoup as it completes.
+    request_and_extract() : requests a url and returns the values of the fields described by an extraction spec.
+    request_and_extract_many() : concurrently requests a batch of urls, yielding each page's field values as it completes.
+    request_content_many() : concurrently requests a batch of urls, yielding each raw body as it completes.
+    stream_and_extract() : streams the response of a url, extracting the fields of an extraction spec until all are found.
+    stream_and_extract_many() : concurrently streams a batch of urls, yielding each page's field values as it completes.
+    changed_fingerprint() : fingerprints the field regions of a page, unless they are unchanged since the recorded fingerprint.
+    get_session() : returns the keep-alive requests session owned by the calling thread.
     tabulate_dataframe() : formats a pandas dataframe for display with either text or html formatting.
 
 """
@@ -17,63 +28,118 @@ Functions:
 # Imports =============================================================
 
 # Standard Libraries
+import codecs
 import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
 
 # Third-party Libraries
-from tabulate import tabulate
-import pandas as pd
-from requests import get
+# pandas and tabulate are imported by tabulate_dataframe, the only function needing them,
+# so that requesting and extracting pages does not pay for their import
+from requests import get, Session, RequestException
 from bs4 import BeautifulSoup
 
+# Local Application Libraries
+import pricepal.common.metrics as metrics
+from pricepal.common.extraction import ExtractionSpec, StreamingExtractor, available_parser, extract, region_fingerprint
+from pricepal.common.fetch_policy import FetchPolicy
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.snapshot_archive import SnapshotArchive
+
 
 # Constants ===========================================================
 
+DEFAULT_TIMEOUT = 30
+# Seconds to wait for the connection and for each read of the response.
+
+DEFAULT_MAX_WORKERS = 16
+# Total number of requests in flight during a batch request.
+
+DEFAULT_MAX_PER_HOST = 4
+# Number of requests in flight against any single host during a batch request.
 
+DEFAULT_MAX_BODY_BYTES = 8 * 1024 * 1024
+# Hard limit on the bytes read from a single streamed response.
+
+DEFAULT_CHUNK_BYTES = 16 * 1024
+# Size of each read from a streamed response.
+
+UNCHANGED = "unchanged"
+# Result reported for a page whose field regions are unchanged since the previous sweep.
 
 # =====================================================================
 
-def request_and_parse(url: str, parser: str = "html.parser", output_filename: str = ""):
-    """Requests the url passed as an argument, then checks status code and either
-    proceeds with parse if deemed to be successful.
-    In successful cases, it will return the BeautifulSoup object resulting from
-    the response to the request, in failed cases, it will return None.
-    Also has the functionality to saved the 'prettify' result to an html file.
-    This functionality can be leveraged by supplying an optional output_filename
-    argument.
+_thread_state = threading.local()
 
-    Arguments:
-        url {str} -- the complete url of the webpage to be requested
-        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to "html.parser"
-        output_filename {str} -- optional, filename to save the resulting html, defaults to "" which will not save result
+def get_session() -> Session:
+    """Returns the requests Session owned by the calling thread, creating it on
+    first use. Sessions hold a pool of keep-alive connections, so repeated
+    requests from the same thread to the same host reuse their connection
+    rather than paying for a new TCP (and TLS) handshake each time.
+    A Session is not safe to share between threads, hence one per thread.
 
     Returns:
-        {bs4.BeautifulSoup} -- the BeautifulSoup object resulting from the parse of the requested url
-
-    Note: will return None if webpage does not respond with the correct status code.
+        {requests.Session} -- the session for the calling thread
     """
 
-    # Get the page data from the url and extract its content
-    page_response = get(url)
+    session = getattr(_thread_state, "session", None)
+    if session is None:
+        session = Session()
+        _thread_state.session = session
+    return session
+
+def _get(url: str, session: Session, timeout: float, policy: FetchPolicy, headers: dict = None, stream: bool = False):
+    requester = get if session is None else session.get
+    if policy is None:
+        return requester(url, headers=headers, timeout=timeout, stream=stream)
 
+    # Apply the host's rate limit and circuit breaker to every attempt, retrying transient failures
+    host = urlsplit(url).netloc
+    attempt = 0
+    while True:
+        policy.before_request(host)
+        try:
+            page_response = requester(url, headers=headers, timeout=timeout, stream=stream)
+        except RequestException as error:
+            delay = policy.after_error(host, attempt)
+            if delay is None:
+                raise
+            logging.debug("Failed request to 'url:%s' with 'error:%r'. Retrying in 'delay:%.2fs'.", url, error, delay)
+        else:
+            delay = policy.after_response(host, page_response.status_code, attempt, page_response.headers.get("Retry-After"))
+            if delay is None:
+                return page_response
+            page_response.close()
+            logging.debug("Completed request to 'url:%s' with 'response code:%s'. "
+                          "Response code is transient. Retrying in 'delay:%.2fs'.", url, page_response.status_code, delay)
+        finally:
+            # A probe ended by an unexpected exception would otherwise leave the host half-open for good
+            policy.release(host)
+        policy.wait(host, delay)
+        attempt += 1
+
+def _response_ok(url: str, page_response) -> bool:
     # If response is 200, request was success and status ok, proceed with parse
     if page_response.status_code == 200:
         logging.debug("Completed request to 'url:%s' with 'response code:%s'. "
                       "Response code is OK. Proceeding with parse.", url, page_response.status_code)
-        soup = BeautifulSoup(page_response.content, parser)
+        return True
 
     # If response starts with 2, request was a success, but may not be ok
     # Log this unexpected response accordingly, but still proceed with parse
-    elif str(page_response.status_code[0]) == "2":
+    elif str(page_response.status_code)[0] == "2":
         logging.debug("Completed request to 'url:%s' with 'response code:%s'. "
                       "Response code is unexpected but not critical. Proceeding with parse.", url, page_response.status_code)
-        soup = BeautifulSoup(page_response.content, parser)
+        return True
 
     # If response starts with 4, request resulted in an error
     # Log this response at warning level and do not proceed with parse
-    elif str(page_response.status_code[0]) == "4":
+    elif str(page_response.status_code)[0] == "4":
         logging.warning("Completed request to 'url:%s' with 'response code:%s'. "
                         "Response code is critical. Cannot proceed with parse, entering error handling.", url, page_response.status_code)
-        return None
+        return False
 
     # If response is not caught by the above logic, request was not understood
     # This will be assumed as an error and logged, do not proceed with parse
@@ -81,15 +147,430 @@ def request_and_parse(url: str, parser: str = "html.parser", output_filename: st
         logging.warning("Completed request to 'url:%s' with 'response code:%s'. "
                         "Response code is unclassified, further assessment required. "
                         "Cannot proceed with parse, entering error handling.", url, page_response.status_code)
+        return False
+
+def _fetch_content(url: str, session: Session, timeout: float, cache: ResponseCache, policy: FetchPolicy,
+                   archive: SnapshotArchive = None):
+    with metrics.timer("fetch", url) as timed:
+        # Send the validators of any cached response so the server may answer 304
+        headers = cache.conditional_headers(url) if cache is not None else None
+
+        # Get the page data from the url and extract its content
+        page_response = _get(url, session, timeout, policy, headers=headers)
+
+        # A 304 response means the cached response is still current, so no body was downloaded
+        cached = cache.not_modified(url) if cache is not None and page_response.status_code == 304 else None
+
+        # If the cached response is current, reuse it
+        if cached is not None:
+            logging.debug("Completed request to 'url:%s' with 'response code:%s'. "
+                          "Response is not modified. Proceeding with cached response.", url, page_response.status_code)
+            timed.outcome = "not_modified"
+            if archive is not None:
+                archive.add(url, cached[0], digest=cached[1])
+            return cached
+
+        # Classify the response code, only a successful response proceeds to parse
+        if not _response_ok(url, page_response):
+            timed.outcome = f"http_{str(page_response.status_code)[0]}xx"
+            return None
+
+        # Without a cache there is no digest, as there is nothing to compare the body to
+        digest = None
+        if cache is not None:
+            digest, _ = cache.update(url, page_response.content, page_response.headers.get("ETag"),
+                                     page_response.headers.get("Last-Modified"))
+        if archive is not None:
+            archive.add(url, page_response.content, digest=digest)
+        metrics.count("fetched_bytes", url, value=len(page_response.content))
+        return page_response.content, digest
+
+class Extracted(dict):
+    """The mapping of field name to value extracted from a page, carrying the region fingerprint of
+    the page. The fingerprint is left to the caller to record in the cache, see
+    ResponseCache.record_fingerprints(), once the values are stored, so that a page whose values
+    were lost to a crash or a failed store is not reported unchanged the next time it is requested.
+    """
+
+    def __init__(self, fields: dict, fingerprint: str = None):
+        """Initializes the values of a page.
+
+        Arguments:
+            fields {dict} -- the mapping of field name to value
+            fingerprint {str} -- optional, the region fingerprint of the page, defaults to None for none
+        """
+        super().__init__(fields)
+        self.fingerprint = fingerprint
+
+def changed_fingerprint(url: str, content: bytes, spec: ExtractionSpec, cache: ResponseCache) -> str:
+    """Fingerprints the regions of a page holding the fields of a spec, and compares the
+    fingerprint with the one recorded for the url. The fingerprint is not recorded here.
+
+    Arguments:
+        url {str} -- the complete url of the webpage
+        content {bytes} -- the raw body of the page
+        spec {ExtractionSpec} -- the spec describing the fields of the page
+        cache {ResponseCache} -- the cache holding the fingerprint of each url
+
+    Returns:
+        {str} -- UNCHANGED if the fingerprint matches the recorded fingerprint of the url, otherwise the fingerprint
+                 of the page, or None if the page cannot be fingerprinted
+    """
+    fingerprint = region_fingerprint(content, spec)
+    if fingerprint is None or cache.fingerprint(url, spec.key) != fingerprint:
+        return fingerprint
+    logging.debug("Field regions of 'url:%s' are unchanged. Skipping extraction.", url)
+    return UNCHANGED
+
+def _memoized(url: str, digest: str, cache: ResponseCache, key, parse):
+    # The memo only holds a result made from a body with the same digest
+    if cache is not None and digest is not None:
+        result = cache.parsed(url, digest, key)
+        if result is not None:
+            logging.debug("Body of 'url:%s' is unchanged. Reusing previous parse result.", url)
+            metrics.count("parse_reused", url)
+            return result
+    result = parse()
+    if cache is not None and digest is not None:
+        cache.remember_parsed(url, digest, key, result)
+    return result
+
+def _memoized_fields(url: str, digest: str, cache: ResponseCache, key: str, extract_fields) -> dict:
+    # Extracted fields are memoized on disk, so that they outlast the in-memory memo across a whole sweep
+    if cache is not None and digest is not None:
+        fields = cache.extracted(url, digest, key)
+        if fields is not None:
+            logging.debug("Body of 'url:%s' is unchanged. Reusing previously extracted fields.", url)
+            metrics.count("parse_reused", url)
+            return fields
+    fields = extract_fields()
+    if cache is not None and digest is not None:
+        cache.remember_extracted(url, digest, key, fields)
+    return fields
+
+def request_and_parse(url: str, parser: str = "html.parser", output_filename: str = "",
+                      session: Session = None, timeout: float = DEFAULT_TIMEOUT, cache: ResponseCache = None,
+                      policy: FetchPolicy = None, archive: SnapshotArchive = None):
+    """Requests the url passed as an argument, then checks status code and either
+    proceeds with parse if deemed to be successful.
+    In successful cases, it will return the BeautifulSoup object resulting from
+    the response to the request, in failed cases, it will return None.
+    Also has the functionality to save the raw page to an html file, by supplying
+    an optional output_filename argument. To keep snapshots of a page across
+    sweeps, supply a SnapshotArchive instead.
+    When a ResponseCache is supplied the request is made conditional on the
+    cached validators of the url. A 304 Not Modified response, or a full
+    response whose body is identical to the cached body, returns the previous
+    parse result of the page where it is still held in memory.
+
+    Arguments:
+        url {str} -- the complete url of the webpage to be requested
+        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to "html.parser"
+        output_filename {str} -- optional, filename to save the raw html, defaults to "" which will not save result
+        session {requests.Session} -- optional, session used to reuse connections, defaults to None for a one-off request
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of the page, defaults to None for no snapshot
+
+    Returns:
+        {bs4.BeautifulSoup} -- the BeautifulSoup object resulting from the parse of the requested url
+
+    Note: will return None if webpage does not respond with the correct status code.
+    Note: a parse result reused from the cache is shared, and should not be modified.
+    Note: raises CircuitOpenError if the policy sheds the request, as the breaker of its host is open.
+    """
+
+    fetched = _fetch_content(url, session, timeout, cache, policy, archive)
+    if fetched is None:
         return None
+    content, digest = fetched
 
+    with metrics.timer("parse", url):
+        soup = _memoized(url, digest, cache, parser, lambda: BeautifulSoup(content, parser))
+
+    # The raw body is written as served, rather than re-serializing the parsed tree
     if output_filename != "":
-        with open(output_filename+".html", "w") as file:
-            file.write(str(soup.prettify()))
+        with open(output_filename+".html", "wb") as file:
+            file.write(content)
 
     return soup
 
-def tabulate_dataframe(df: pd.DataFrame, table_format: str = "pretty") -> str:
+def request_and_extract(url: str, spec: ExtractionSpec, parser: str = None, session: Session = None,
+                        timeout: float = DEFAULT_TIMEOUT, cache: ResponseCache = None, policy: FetchPolicy = None,
+                        archive: SnapshotArchive = None, skip_unchanged: bool = False):
+    """Requests the url passed as an argument and, if the status code is deemed to be
+    successful, extracts the fields described by an extraction spec from the page.
+    Only the elements required by the spec are parsed, using the fastest parser
+    installed unless one is given, and the result holds plain values rather
+    than a BeautifulSoup object.
+    Requests are made conditional when a ResponseCache is supplied, as with request_and_parse.
+    With skip_unchanged and a cache, a page whose field regions have the same fingerprint
+    as the one recorded for the url is not extracted, and UNCHANGED is returned instead.
+    The fingerprint of any other page is returned with its values, for the caller to
+    record once the values are stored.
+
+    Arguments:
+        url {str} -- the complete url of the webpage to be requested
+        spec {ExtractionSpec} -- the spec describing the fields to extract
+        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to the fastest installed parser
+        session {requests.Session} -- optional, session used to reuse connections, defaults to None for a one-off request
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of the page, defaults to None for no snapshot
+        skip_unchanged {bool} -- optional, return UNCHANGED for pages with unchanged field regions, defaults to False
+
+    Returns:
+        {Extracted} -- mapping of each field name to its string value, None for fields not found in the page,
+                       or UNCHANGED if skip_unchanged is set and the field regions of the page are unchanged
+
+    Note: will return None if webpage does not respond with the correct status code.
+    """
+
+    fetched = _fetch_content(url, session, timeout, cache, policy, archive)
+    if fetched is None:
+        return None
+    content, digest = fetched
+
+    with metrics.timer("extract", url) as timed:
+        fingerprint = None
+        if skip_unchanged and cache is not None:
+            fingerprint = changed_fingerprint(url, content, spec, cache)
+            if fingerprint == UNCHANGED:
+                timed.outcome = UNCHANGED
+                return UNCHANGED
+
+        parser = parser or available_parser()
+        fields = _memoized_fields(url, digest, cache, f"{spec.key}:{parser}", lambda: extract(content, spec, parser))
+        return Extracted(fields, fingerprint)
+
+def stream_and_extract(url: str, spec: ExtractionSpec, max_bytes: int = DEFAULT_MAX_BODY_BYTES,
+                       chunk_size: int = DEFAULT_CHUNK_BYTES, session: Session = None, timeout: float = DEFAULT_TIMEOUT,
+                       policy: FetchPolicy = None):
+    """Requests the url passed as an argument and, if the status code is deemed to be
+    successful, streams the response through an incremental parser to extract the
+    fields described by an extraction spec.
+    The download stops as soon as every field has been found, so for pages with
+    the fields near the top only the start of the page is transferred. The download
+    also stops once max_bytes have been read, in which case the fields found so
+    far are returned and the rest are None.
+    Streamed responses are not cached, as the body is usually only partly read.
+
+    Arguments:
+        url {str} -- the complete url of the webpage to be requested
+        spec {ExtractionSpec} -- the spec describing the fields to extract, which must be streamable
+        max_bytes {int} -- optional, hard limit on the bytes read from the response, defaults to DEFAULT_MAX_BODY_BYTES
+        chunk_size {int} -- optional, size of each read from the response, defaults to DEFAULT_CHUNK_BYTES
+        session {requests.Session} -- optional, session used to reuse connections, defaults to None for a one-off request
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+
+    Returns:
+        {dict} -- mapping of each field name to its string value, None for fields not found in the page
+
+    Note: will return None if webpage does not respond with the correct status code.
+    """
+
+    extractor = StreamingExtractor(spec)
+
+    page_response = _get(url, session, timeout, policy, stream=True)
+
+    with page_response:
+        # Classify the response code, only a successful response proceeds to parse
+        if not _response_ok(url, page_response):
+            return None
+
+        # Without a declared charset assume utf-8, rather than the http default of latin-1
+        declared = "charset=" in page_response.headers.get("Content-Type", "").lower()
+        encoding = page_response.encoding if declared and page_response.encoding else "utf-8"
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        bytes_read = 0
+        for chunk in page_response.iter_content(chunk_size):
+            # The chunk reaching the limit is cut to it, so that nothing past the limit is parsed
+            chunk = chunk[:max_bytes - bytes_read]
+            bytes_read += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            if extractor.done:
+                logging.debug("Found all fields of 'url:%s' after 'bytes:%s'. Stopping download.", url, bytes_read)
+                break
+            if bytes_read >= max_bytes:
+                logging.warning("Reached the body size limit of 'url:%s' at 'bytes:%s' before finding all fields. "
+                                "Stopping download.", url, bytes_read)
+                break
+        else:
+            # At the end of the page, any element left open, such as a final <td> without its end tag, is ended
+            extractor.feed(decoder.decode(b"", final=True))
+            extractor.close()
+
+    metrics.count("fetched_bytes", url, value=bytes_read)
+    return dict(extractor.values)
+
+def _request_and_parse_pooled(url: str, parser: str, timeout: float, cache: ResponseCache, policy: FetchPolicy,
+                              archive: SnapshotArchive):
+    return request_and_parse(url, parser, session=get_session(), timeout=timeout, cache=cache, policy=policy,
+                             archive=archive)
+
+def _request_and_extract_pooled(url: str, spec: ExtractionSpec, parser: str, timeout: float, cache: ResponseCache,
+                                policy: FetchPolicy, archive: SnapshotArchive, skip_unchanged: bool):
+    return request_and_extract(url, spec, parser, session=get_session(), timeout=timeout, cache=cache, policy=policy,
+                               archive=archive, skip_unchanged=skip_unchanged)
+
+def _request_content_pooled(url: str, timeout: float, cache: ResponseCache, policy: FetchPolicy,
+                            archive: SnapshotArchive):
+    return _fetch_content(url, get_session(), timeout, cache, policy, archive)
+
+def _stream_and_extract_pooled(url: str, spec: ExtractionSpec, max_bytes: int, chunk_size: int, timeout: float,
+                               policy: FetchPolicy):
+    return stream_and_extract(url, spec, max_bytes, chunk_size, session=get_session(), timeout=timeout, policy=policy)
+
+def _run_batch(urls, task, task_args: tuple, max_workers: int, max_per_host: int):
+    # Queue the urls by host, hosts are visited in the order first seen
+    pending = defaultdict(deque)
+    for url in urls:
+        pending[urlsplit(url).netloc].append(url)
+
+    in_flight = defaultdict(int)
+    futures = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit_ready():
+            for host in list(pending):
+                host_queue = pending[host]
+                while host_queue and in_flight[host] < max_per_host and len(futures) < max_workers:
+                    url = host_queue.popleft()
+                    futures[executor.submit(task, url, *task_args)] = (url, host)
+                    in_flight[host] += 1
+                if not host_queue:
+                    del pending[host]
+
+        submit_ready()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, host = futures.pop(future)
+                in_flight[host] -= 1
+                try:
+                    result = future.result()
+                except Exception as error: # pylint: disable=broad-except
+                    logging.warning("Failed request to 'url:%s' with 'error:%r'.", url, error)
+                    result = error
+                yield url, result
+            submit_ready()
+
+def request_and_parse_many(urls, parser: str = "html.parser", max_workers: int = DEFAULT_MAX_WORKERS,
+                           max_per_host: int = DEFAULT_MAX_PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                           cache: ResponseCache = None, policy: FetchPolicy = None, archive: SnapshotArchive = None):
+    """Requests and parses a batch of urls concurrently, yielding each result as
+    soon as it completes rather than in the order supplied.
+    Requests are made from a pool of worker threads, each holding its own
+    keep-alive session. No more than max_per_host requests are ever in flight
+    against a single host; urls for a saturated host wait their turn while the
+    remaining workers are handed urls for other hosts.
+
+    Arguments:
+        urls {iterable} -- the complete urls of the webpages to be requested
+        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to "html.parser"
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of each page, defaults to None for no snapshots
+
+    Yields:
+        {tuple} -- pairs of (url, result), where result is the BeautifulSoup object of the page,
+                   None if the response status prevented a parse, or the exception raised by the request
+
+    Note: the batch is cut short without waiting on unsent urls if the caller stops iterating.
+    """
+
+    return _run_batch(urls, _request_and_parse_pooled, (parser, timeout, cache, policy, archive), max_workers, max_per_host)
+
+def request_and_extract_many(urls, spec: ExtractionSpec, parser: str = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                             max_per_host: int = DEFAULT_MAX_PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                             cache: ResponseCache = None, policy: FetchPolicy = None, archive: SnapshotArchive = None,
+                             skip_unchanged: bool = False):
+    """Requests a batch of urls concurrently and extracts the fields described by an
+    extraction spec from each page, yielding each result as soon as it completes.
+    Requests are scheduled exactly as in request_and_parse_many, and pages with
+    unchanged field regions may be skipped as in request_and_extract.
+
+    Arguments:
+        urls {iterable} -- the complete urls of the webpages to be requested
+        spec {ExtractionSpec} -- the spec describing the fields to extract
+        parser {str} -- optional, the parser to be used by Beautiful soup, defaults to the fastest installed parser
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of each page, defaults to None for no snapshots
+        skip_unchanged {bool} -- optional, yield UNCHANGED for pages with unchanged field regions, defaults to False
+
+    Yields:
+        {tuple} -- pairs of (url, result), where result is the Extracted values of the page, UNCHANGED,
+                   None if the response status prevented a parse, or the exception raised by the request
+    """
+
+    return _run_batch(urls, _request_and_extract_pooled, (spec, parser, timeout, cache, policy, archive, skip_unchanged),
+                      max_workers, max_per_host)
+
+def stream_and_extract_many(urls, spec: ExtractionSpec, max_bytes: int = DEFAULT_MAX_BODY_BYTES,
+                            chunk_size: int = DEFAULT_CHUNK_BYTES, max_workers: int = DEFAULT_MAX_WORKERS,
+                            max_per_host: int = DEFAULT_MAX_PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                            policy: FetchPolicy = None):
+    """Requests a batch of urls concurrently, streaming each response to extract the fields
+    described by an extraction spec, and yields each result as soon as it completes.
+    Each page is streamed as in stream_and_extract, so at most max_bytes of any
+    response are held by each of the max_workers requests in flight.
+    Requests are scheduled exactly as in request_and_parse_many.
+
+    Arguments:
+        urls {iterable} -- the complete urls of the webpages to be requested
+        spec {ExtractionSpec} -- the spec describing the fields to extract, which must be streamable
+        max_bytes {int} -- optional, hard limit on the bytes read from each response, defaults to DEFAULT_MAX_BODY_BYTES
+        chunk_size {int} -- optional, size of each read from a response, defaults to DEFAULT_CHUNK_BYTES
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+
+    Yields:
+        {tuple} -- pairs of (url, result), where result is the mapping of field name to value,
+                   None if the response status prevented a parse, or the exception raised by the request
+    """
+
+    return _run_batch(urls, _stream_and_extract_pooled, (spec, max_bytes, chunk_size, timeout, policy),
+                      max_workers, max_per_host)
+
+def request_content_many(urls, max_workers: int = DEFAULT_MAX_WORKERS, max_per_host: int = DEFAULT_MAX_PER_HOST,
+                         timeout: float = DEFAULT_TIMEOUT, cache: ResponseCache = None, policy: FetchPolicy = None,
+                         archive: SnapshotArchive = None):
+    """Requests a batch of urls concurrently without parsing them, yielding the raw body
+    of each page as soon as it completes. This is the fetch stage alone, for callers
+    which parse the pages elsewhere, for example in a process pool.
+    Requests are scheduled exactly as in request_and_parse_many.
+
+    Arguments:
+        urls {iterable} -- the complete urls of the webpages to be requested
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        cache {ResponseCache} -- optional, cache used to make conditional requests, defaults to None for no caching
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of each page, defaults to None for no snapshots
+
+    Yields:
+        {tuple} -- pairs of (url, result), where result is a pair of (body, digest), None if the response
+                   status prevented a parse, or the exception raised by the request.
+                   The digest is None unless a cache is supplied.
+    """
+
+    return _run_batch(urls, _request_content_pooled, (timeout, cache, policy, archive), max_workers, max_per_host)
+
+def tabulate_dataframe(df: "pandas.DataFrame", table_format: str = "pretty") -> str:
     """Accepts a pandas DataFrame and formats it for viewing as a table.
     The output format can be defined via input arguments, and is capable
     of a variety of html or text formats.
@@ -109,5 +590,6 @@ def tabulate_dataframe(df: pd.DataFrame, table_format: str = "pretty") -> str:
     if table_format == "html":
         table_data = df.to_html(index=False, justify="center")
     else:
+        from tabulate import tabulate # pylint: disable=import-outside-toplevel
         table_data = tabulate(df, headers='keys', tablefmt=table_format, showindex=False, colalign=("left",))
     return table_data
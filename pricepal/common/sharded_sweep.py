@@ -0,0 +1,425 @@
+"""
+Summary:
+
+This module contains the sharded sweep, which spreads the requests of a
+sweep over several worker processes, so that a sweep is no longer bound
+by the GIL and socket limits of a single process.
+
+Products are partitioned into shards by the host of their url, through a
+consistent hash ring, so that every page of a host is requested by the
+same worker and the per-host concurrency limit of that worker is the
+limit for the host. Adding a shard moves only the hosts which the new
+shard takes over, which keeps the per-shard response caches warm.
+
+The coordinator puts the pages of each shard on a durable WorkQueue as
+tasks, and starts a worker process per shard. Each worker leases the
+tasks of its shard, requests and extracts their pages through the scrape
+engine, and completes each task with the raw field values found. A
+worker which crashes is restarted, as is a worker which hangs and lets
+the lease of its task expire, and its expired leases are taken up
+again. Once every task is finished, the coordinator merges the results
+into the history store and alert rules, as the single writer of the
+store. A coordinator which is itself stopped may resume the sweep later,
+as the tasks and results of the sweep outlive it in the queue. A sweep
+is marked merged in the queue once its rows are stored, so that resuming
+a stopped merge never sends its alerts twice.
+
+Classes:
+    HashRing : consistent hash ring mapping hosts to shards.
+    SweepCoordinator : partitions a sweep into shards, runs a worker process per shard and merges the results.
+
+Functions:
+    run_worker() : leases and runs the tasks of one shard of a sweep until none are left, the worker process main.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# Third-party Libraries
+import pandas as pd
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.normalize import DEFAULT_CURRENCY
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.sweep import record_changes
+from pricepal.common.work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, DEFAULT_QUEUE_PATH, WorkQueue
+from pricepal.notification.rules import RuleEngine
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_SHARD_CACHE_DIR = os.path.join(DATA_DIR, "cache", "shards")
+
+DEFAULT_REPLICAS = 64
+# Points of each shard on the hash ring, more points spread the hosts more evenly.
+
+DEFAULT_BATCH_SIZE = 200
+# Pages per task. A crashed worker repeats at most the pages of the tasks it held.
+
+DEFAULT_MAX_RESTARTS = 3
+# Times the worker of a shard is restarted after exiting with tasks unfinished, before the shard is abandoned.
+
+DEFAULT_POLL_INTERVAL = 0.2
+# Seconds between checks on the workers by the coordinator, and on the queue by a worker waiting on an expired lease.
+
+# =====================================================================
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+    """A consistent hash ring of shards, mapping each host to one shard."""
+
+    def __init__(self, shards, replicas: int = DEFAULT_REPLICAS):
+        """Places each shard on the ring at a number of points.
+
+        Arguments:
+            shards {iterable} -- the shards, such as range(workers)
+            replicas {int} -- optional, points of each shard on the ring, defaults to DEFAULT_REPLICAS
+        """
+        self.shards = list(shards)
+        if not self.shards:
+            raise ValueError("A hash ring needs at least one shard.")
+        points = sorted((_ring_hash(f"{shard}#{replica}"), shard) for shard in self.shards for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_of(self, host: str):
+        """Returns the shard of a host, the first shard clockwise of the host's point on the ring.
+
+        Arguments:
+            host {str} -- the host, as from urlsplit(url).netloc
+
+        Returns:
+            {object} -- the shard
+        """
+        return self._owners[bisect.bisect(self._points, _ring_hash(host)) % len(self._points)]
+
+def run_worker(queue_path: str, sweep: str, shard: int, spec: ExtractionSpec, cache_path: str = None,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               max_workers: int = scraper.DEFAULT_MAX_WORKERS, max_per_host: int = scraper.DEFAULT_MAX_PER_HOST,
+               timeout: float = scraper.DEFAULT_TIMEOUT, price_field: str = "price", stock_field: str = "stock",
+               poll_interval: float = DEFAULT_POLL_INTERVAL) -> int:
+    """Leases and runs the tasks of one shard of a sweep until none are left unfinished. Each task's
+    pages are requested and extracted with request_and_extract_many, and the task completed with the
+    raw price and stock of each changed product, and the counts of changed, unchanged and failed pages.
+    With a cache, pages with unchanged field regions are skipped, and the task also completed with the
+    fingerprints of the changed pages, which the coordinator records once their rows are stored.
+
+    Arguments:
+        queue_path {str} -- location of the WorkQueue database
+        sweep {str} -- the id of the sweep
+        shard {int} -- the shard of the sweep to run
+        spec {ExtractionSpec} -- the spec describing the fields of the pages, including price_field and stock_field
+        cache_path {str} -- optional, location of the ResponseCache of the shard, defaults to None for no caching
+        lease_seconds {float} -- optional, seconds a lease lasts without renewal, defaults to DEFAULT_LEASE_SECONDS
+        max_attempts {int} -- optional, times a task is leased before it fails, defaults to DEFAULT_MAX_ATTEMPTS
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        price_field {str} -- optional, the field of the spec holding the price, defaults to "price"
+        stock_field {str} -- optional, the field of the spec holding the stock, defaults to "stock"
+        poll_interval {float} -- optional, seconds between checks for an expired lease, defaults to DEFAULT_POLL_INTERVAL
+
+    Returns:
+        {int} -- the number of tasks completed by this worker
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    cache = ResponseCache(cache_path) if cache_path else None
+    completed = 0
+    try:
+        with WorkQueue(queue_path, lease_seconds, max_attempts) as queue:
+            while True:
+                tasks = queue.lease(owner, sweep, shard)
+                if not tasks:
+                    # Tasks still leased are held by a worker which has since died, and are leased once expired
+                    if not queue.unfinished(sweep, shard):
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                task = tasks[0]
+                try:
+                    result = _run_task(queue, owner, task, spec, cache, max_workers, max_per_host, timeout,
+                                       price_field, stock_field)
+                except Exception as error: # pylint: disable=broad-except
+                    queue.fail(owner, task.id, repr(error))
+                    continue
+                if result is not None and queue.complete(owner, task.id, result):
+                    completed += 1
+    finally:
+        if cache is not None:
+            cache.close()
+    logging.debug("Worker 'owner:%s' completed 'tasks:%s' of 'shard:%s' of 'sweep:%s'.", owner, completed, shard, sweep)
+    return completed
+
+def _run_task(queue: WorkQueue, owner: str, task, spec: ExtractionSpec, cache: ResponseCache, max_workers: int,
+              max_per_host: int, timeout: float, price_field: str, stock_field: str) -> dict:
+    product_ids = dict(task.payload)
+    result = {"rows": [], "fingerprints": [], "changed": 0, "unchanged": 0, "failed": 0}
+    renewed = time.monotonic()
+    for url, fields in scraper.request_and_extract_many(list(product_ids), spec, max_workers=max_workers,
+                                                        max_per_host=max_per_host, timeout=timeout, cache=cache,
+                                                        skip_unchanged=cache is not None):
+        if isinstance(fields, dict):
+            result["changed"] += 1
+            result["rows"].extend([product_id, fields.get(price_field), fields.get(stock_field)]
+                                  for product_id in product_ids[url])
+            if fields.fingerprint is not None:
+                result["fingerprints"].append([url, fields.fingerprint])
+        elif fields == scraper.UNCHANGED:
+            result["unchanged"] += 1
+        else:
+            result["failed"] += 1
+
+        # The lease is renewed well before it expires, for tasks of slow pages. A task whose lease was lost is
+        # being run by another worker, and is stopped rather than requesting its pages from the host twice
+        if time.monotonic() - renewed > queue.lease_seconds / 3:
+            if not queue.renew(owner, [task.id]):
+                logging.warning("Lost lease of 'task:%s' by 'owner:%s'. Stopping task.", task.id, owner)
+                return None
+            renewed = time.monotonic()
+    return result
+
+class SweepCoordinator:
+    """Runs sweeps sharded by host over worker processes, merging the results into one
+    history store. The coordinator is the only process writing to the store.
+    """
+
+    def __init__(self, spec: ExtractionSpec, store: HistoryStore, workers: int = None, queue_path: str = DEFAULT_QUEUE_PATH,
+                 cache_dir: str = None, engine: RuleEngine = None, dispatcher=None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, max_restarts: int = DEFAULT_MAX_RESTARTS,
+                 max_workers: int = scraper.DEFAULT_MAX_WORKERS, max_per_host: int = scraper.DEFAULT_MAX_PER_HOST,
+                 timeout: float = scraper.DEFAULT_TIMEOUT, price_field: str = "price", stock_field: str = "stock",
+                 default_currency: str = DEFAULT_CURRENCY, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 worker=run_worker):
+        """Initializes a coordinator, no workers are started until a sweep is run.
+
+        Arguments:
+            spec {ExtractionSpec} -- the spec describing the fields of the pages, including price_field and stock_field
+            store {HistoryStore} -- the store the prices of changed products are appended to
+            workers {int} -- optional, number of shards, each run by a worker process, defaults to the number of cores
+            queue_path {str} -- optional, location of the WorkQueue database, defaults to DEFAULT_QUEUE_PATH
+            cache_dir {str} -- optional, directory of the response cache of each shard, defaults to None for no caching
+            engine {RuleEngine} -- optional, the alert rules evaluated against changed products, defaults to None for no alerts
+            dispatcher {NotificationDispatcher} -- optional, dispatcher the alerts are queued on, defaults to None
+            batch_size {int} -- optional, pages per task, defaults to DEFAULT_BATCH_SIZE
+            lease_seconds {float} -- optional, seconds a lease lasts without renewal, defaults to DEFAULT_LEASE_SECONDS
+            max_attempts {int} -- optional, times a task is leased before it fails, defaults to DEFAULT_MAX_ATTEMPTS
+            max_restarts {int} -- optional, restarts of a shard's worker before it is abandoned, defaults to DEFAULT_MAX_RESTARTS
+            max_workers {int} -- optional, concurrent requests of each worker, defaults to DEFAULT_MAX_WORKERS
+            max_per_host {int} -- optional, concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+            timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+            price_field {str} -- optional, the field of the spec holding the price, defaults to "price"
+            stock_field {str} -- optional, the field of the spec holding the stock, defaults to "stock"
+            default_currency {str} -- optional, currency of a bare "$" or of no symbol, defaults to DEFAULT_CURRENCY
+            poll_interval {float} -- optional, seconds between checks on the workers, defaults to DEFAULT_POLL_INTERVAL
+            worker {callable} -- optional, the main of each worker process, taking the arguments of run_worker,
+                                 defaults to run_worker
+        """
+        self.spec = spec
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.ring = HashRing(range(self.workers))
+        self.queue_path = queue_path
+        self.cache_dir = cache_dir
+        self.engine = engine
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.max_restarts = max_restarts
+        self.default_currency = default_currency
+        self.poll_interval = poll_interval
+        self.worker = worker
+        self.worker_options = {"lease_seconds": lease_seconds, "max_attempts": max_attempts, "max_workers": max_workers,
+                               "max_per_host": max_per_host, "timeout": timeout, "price_field": price_field,
+                               "stock_field": stock_field, "poll_interval": poll_interval}
+        self.queue = WorkQueue(queue_path, lease_seconds, max_attempts)
+        # Spawned rather than forked, as forking a process running threads may copy held locks
+        self._context = multiprocessing.get_context("spawn")
+
+    def close(self):
+        """Closes the coordinator's connection to the queue."""
+        self.queue.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, products: pd.DataFrame) -> str:
+        """Partitions the products of a sweep into shards by host, and puts their pages on the queue.
+
+        Arguments:
+            products {pandas.DataFrame} -- one row per product with the columns product_id and url
+
+        Returns:
+            {str} -- the id of the sweep, which resume() runs
+        """
+        submitted = time.time()
+        sweep = time.strftime("%Y%m%d-%H%M%S-", time.localtime(submitted)) + uuid.uuid4().hex[:8]
+        self.queue.mark_submitted(sweep, submitted)
+        shard_of_host = {}
+        pages = defaultdict(lambda: defaultdict(list))
+        for product_id, url in zip(products["product_id"].tolist(), products["url"].tolist()):
+            host = urlsplit(url).netloc
+            shard = shard_of_host.get(host)
+            if shard is None:
+                shard = shard_of_host[host] = self.ring.shard_of(host)
+            pages[shard][url].append(product_id)
+
+        for shard, product_ids in pages.items():
+            urls = list(product_ids.items())
+            self.queue.put_many(sweep, shard, [urls[start:start + self.batch_size]
+                                               for start in range(0, len(urls), self.batch_size)])
+        logging.info("Submitted 'sweep:%s' of 'pages:%s' over 'shards:%s'.",
+                     sweep, sum(len(urls) for urls in pages.values()), len(pages))
+        return sweep
+
+    def unfinished(self) -> list:
+        """Returns the ids of the sweeps in the queue, oldest first, which were left unfinished or unmerged
+        by a coordinator which stopped, to be run to completion with resume().
+
+        Returns:
+            {list} -- the ids of the sweeps
+        """
+        return self.queue.sweeps()
+
+    def run(self, products: pd.DataFrame, ts=None) -> dict:
+        """Runs a sweep of products over the worker processes, as submit() then resume().
+
+        Arguments:
+            products {pandas.DataFrame} -- one row per product with the columns product_id and url
+            ts {datetime, str} -- optional, the time recorded against the sweep, defaults to the time it is submitted
+
+        Returns:
+            {dict} -- the report of the sweep, as resume()
+        """
+        return self.resume(self.submit(products), ts)
+
+    def resume(self, sweep: str, ts=None) -> dict:
+        """Runs a worker process for each shard of a sweep with unfinished tasks until every task
+        is finished, restarting any worker which exits early, or which hangs holding a lease past
+        its expiry, then merges the results of the sweep into the history store and alert rules,
+        and purges the sweep from the queue.
+
+        Arguments:
+            sweep {str} -- the id of the sweep, as returned by submit()
+            ts {datetime, str} -- optional, the time recorded against the sweep, defaults to the time it was submitted
+
+        Returns:
+            {dict} -- counts of the sweep: pages, unchanged, changed, failed, rejected and alerts, as run_sweep,
+                      with the number of worker restarts, tasks failed and the seconds taken by each stage
+        """
+        started = time.perf_counter()
+        if ts is None:
+            # A sweep resumed after its coordinator stopped is recorded against the time it was submitted
+            submitted = self.queue.submitted(sweep)
+            ts = pd.Timestamp.now(tz="UTC") if submitted is None else pd.Timestamp(submitted, unit="s", tz="UTC")
+        else:
+            ts = pd.Timestamp(ts)
+        restarts = defaultdict(int)
+        processes = {shard: self._start(sweep, shard) for shard in self.queue.shards(sweep)}
+        host = socket.gethostname()
+        while processes:
+            time.sleep(self.poll_interval)
+            # A worker still holding a lease past its expiry has hung, as it renews its leases while it works
+            hung = {owner for _, _, owner in self.queue.leases(sweep, expired=True)}
+            for shard, process in list(processes.items()):
+                if process.is_alive():
+                    if f"{host}:{process.pid}" not in hung:
+                        continue
+                    logging.warning("Worker of 'shard:%s' of 'sweep:%s' holds an expired lease. Terminating worker.",
+                                    shard, sweep)
+                    process.terminate()
+                    process.join(self.poll_interval * 10)
+                    if process.is_alive():
+                        process.kill()
+                process.join()
+                if not self.queue.unfinished(sweep, shard):
+                    del processes[shard]
+                elif restarts[shard] < self.max_restarts:
+                    restarts[shard] += 1
+                    logging.warning("Worker of 'shard:%s' of 'sweep:%s' exited with 'code:%s' and tasks unfinished. "
+                                    "Restarting worker.", shard, sweep, process.exitcode)
+                    processes[shard] = self._start(sweep, shard)
+                else:
+                    failed = self.queue.abandon(sweep, shard, f"worker exited with code {process.exitcode}")
+                    logging.warning("Worker of 'shard:%s' of 'sweep:%s' exited with 'code:%s' after 'restarts:%s'. "
+                                    "Abandoning 'tasks:%s'.", shard, sweep, process.exitcode, restarts[shard], failed)
+                    del processes[shard]
+
+        report = {"sweep": sweep, "pages": 0, "unchanged": 0, "changed": 0, "failed": 0, "rejected": 0, "alerts": 0,
+                  "restarts": sum(restarts.values()), "tasks_failed": 0}
+        rows = {"product_id": [], "price": [], "stock": []}
+        fingerprints = defaultdict(dict)
+        for _, shard, result in self.queue.results(sweep):
+            fingerprints[shard].update(result.get("fingerprints", ()))
+            report["changed"] += result["changed"]
+            report["unchanged"] += result["unchanged"]
+            report["failed"] += result["failed"]
+            for product_id, price, stock in result["rows"]:
+                rows["product_id"].append(product_id)
+                rows["price"].append(price)
+                rows["stock"].append(stock)
+        for _, _, payload, _ in self.queue.failures(sweep):
+            report["tasks_failed"] += 1
+            report["failed"] += len(payload)
+        report["pages"] = report["changed"] + report["unchanged"] + report["failed"]
+        seconds = {"fetch": time.perf_counter() - started}
+
+        if self.queue.merged(sweep):
+            # The coordinator stopped after the merge, and merging again would repeat the rows and alerts
+            logging.warning("Results of 'sweep:%s' were merged before the coordinator stopped. Purging sweep.", sweep)
+        elif rows["product_id"]:
+            # The sweep is marked merged once its rows are stored and before any alert is sent, so that
+            # alerts are sent at most once, however often a stopped merge is resumed
+            def stored():
+                self._record_fingerprints(fingerprints)
+                self.queue.mark_merged(sweep)
+
+            downstream = record_changes(rows, self.store, self.engine, self.dispatcher, ts, self.default_currency, stored)
+            report["rejected"], report["alerts"] = downstream["rejected"], downstream["alerts"]
+            seconds.update(downstream["seconds"])
+        self.queue.purge(sweep)
+
+        report["seconds"] = seconds
+        logging.info("Completed sharded 'sweep:%s' of 'pages:%s' with 'changed:%s', 'unchanged:%s', 'failed:%s', "
+                     "'restarts:%s'.", sweep, report["pages"], report["changed"], report["unchanged"], report["failed"],
+                     report["restarts"])
+        return report
+
+    def _cache_path(self, shard: int) -> str:
+        return os.path.join(self.cache_dir, f"responses-{shard}.sqlite3") if self.cache_dir else None
+
+    def _record_fingerprints(self, fingerprints: dict):
+        # The workers of the sweep have exited, and the coordinator records the fingerprints of their
+        # changed pages in each shard's cache, now that the rows of those pages are stored
+        for shard, shard_fingerprints in fingerprints.items():
+            cache_path = self._cache_path(shard)
+            if cache_path and shard_fingerprints:
+                with ResponseCache(cache_path) as cache:
+                    cache.record_fingerprints(self.spec.key, shard_fingerprints)
+
+    def _start(self, sweep: str, shard: int):
+        cache_path = self._cache_path(shard)
+        process = self._context.Process(target=self.worker, name=f"pricepal-shard-{shard}", daemon=True,
+                                        args=(self.queue_path, sweep, shard, self.spec, cache_path),
+                                        kwargs=self.worker_options)
+        process.start()
+        return process
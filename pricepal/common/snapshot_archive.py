@@ -0,0 +1,285 @@
+"""
+Summary:
+
+This module contains the archive of raw page snapshots kept for debugging
+extractors. Every page fetched in a sweep may be archived, and a page can
+later be recovered exactly as it was served at a given time.
+
+Snapshots are content addressed: each distinct body is stored once,
+compressed, in a file named by its digest, so a page which is unchanged
+between sweeps costs only a row in the index. The index, a small sqlite
+database, records the url, time and digest of every snapshot.
+
+Bodies are hashed, compressed and written on a background thread, so
+archiving adds no disk work to the fetch threads. When the stored bodies
+exceed the size cap, the oldest snapshots are pruned along with any body
+no longer referenced.
+
+Classes:
+    SnapshotArchive : content-addressed, compressed, size-capped archive of raw page snapshots.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+# Local Application Libraries
+from pricepal.common.response_cache import body_digest
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_ARCHIVE_DIR = os.path.join(DATA_DIR, "snapshots")
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# Upper bound on the total compressed size of the bodies held on disk.
+
+DEFAULT_MAX_PENDING = 256
+# Snapshots waiting on the writer thread, beyond which new snapshots are dropped.
+
+DEFAULT_COMPRESSION_LEVEL = 6
+# zlib compression level of stored bodies.
+
+PRUNE_TARGET = 0.9
+# Fraction of the size cap that pruning reduces the archive to, so that it does not prune on every write.
+
+# =====================================================================
+
+_STOP = object()
+
+class SnapshotArchive:
+    """An archive of raw page bodies, indexed by url and time, and stored once per distinct body.
+
+    Snapshots are added with add(), which only queues the body and never blocks;
+    if the writer falls behind by max_pending snapshots, further snapshots are
+    dropped and counted rather than holding up the caller. Queued snapshots are
+    written before flush() or close() return.
+
+    The archive is safe to share between the threads of a batch request.
+    """
+
+    def __init__(self, path: str = DEFAULT_ARCHIVE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_pending: int = DEFAULT_MAX_PENDING, level: int = DEFAULT_COMPRESSION_LEVEL):
+        """Opens, or creates, the archive in the given directory and starts its writer thread.
+
+        Arguments:
+            path {str} -- optional, directory of the archive, defaults to DEFAULT_ARCHIVE_DIR
+            max_bytes {int} -- optional, bound on the total compressed size of bodies, defaults to DEFAULT_MAX_BYTES
+            max_pending {int} -- optional, snapshots waiting on the writer, defaults to DEFAULT_MAX_PENDING
+            level {int} -- optional, zlib compression level, defaults to DEFAULT_COMPRESSION_LEVEL
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.level = level
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS objects ("
+                                 "digest TEXT PRIMARY KEY, size INTEGER NOT NULL, raw_size INTEGER NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS snapshots ("
+                                 "id INTEGER PRIMARY KEY, url TEXT NOT NULL, ts REAL NOT NULL, digest TEXT NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS snapshots_url_ts ON snapshots (url, ts)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS snapshots_ts ON snapshots (ts)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS snapshots_digest ON snapshots (digest)")
+        self._connection.commit()
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="snapshot-archive", daemon=True)
+        self._writer.start()
+
+    @property
+    def total_bytes(self) -> int:
+        """{int} -- the total compressed size of the bodies currently held"""
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, url: str, content: bytes, ts: float = None, digest: str = None) -> bool:
+        """Queues a snapshot of a page for archiving, without waiting on the disk.
+
+        Arguments:
+            url {str} -- the complete url of the page
+            content {bytes} -- the raw body of the page
+            ts {float} -- optional, the time of the snapshot in seconds since the epoch, defaults to now
+            digest {str} -- optional, the body_digest() of the content if already known, defaults to None
+
+        Returns:
+            {bool} -- True if the snapshot was queued, False if the writer is behind and it was dropped
+        """
+        if self._closed:
+            raise RuntimeError("Cannot add to a closed snapshot archive.")
+        try:
+            self._queue.put_nowait((url, content, time.time() if ts is None else ts, digest))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.debug("Dropped snapshot of 'url:%s' as the archive writer is behind.", url)
+            return False
+        return True
+
+    def flush(self):
+        """Waits until every queued snapshot has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Writes every queued snapshot, then stops the writer and closes the index."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._lock:
+            self._connection.close()
+
+    def snapshots(self, url: str, start: float = None, end: float = None) -> list:
+        """Returns the snapshots of a url, oldest first.
+
+        Arguments:
+            url {str} -- the complete url of the page
+            start {float} -- optional, earliest time to include in seconds since the epoch, defaults to None for no bound
+            end {float} -- optional, latest time to include in seconds since the epoch, defaults to None for no bound
+
+        Returns:
+            {list} -- pairs of (ts, digest)
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT ts, digest FROM snapshots WHERE url = ? AND ts >= ? AND ts <= ? ORDER BY ts, id",
+                (url, float("-inf") if start is None else start, float("inf") if end is None else end)).fetchall()
+
+    def read(self, digest: str) -> bytes:
+        """Returns the body stored under a digest.
+
+        Arguments:
+            digest {str} -- the digest of the body
+
+        Returns:
+            {bytes} -- the raw body, None if it is not held
+        """
+        try:
+            with open(self._object_path(digest), "rb") as file:
+                return zlib.decompress(file.read())
+        except FileNotFoundError:
+            return None
+
+    def at(self, url: str, ts: float = None) -> bytes:
+        """Returns the body of a url as it was at a given time, from the latest snapshot at or before it.
+
+        Arguments:
+            url {str} -- the complete url of the page
+            ts {float} -- optional, the time in seconds since the epoch, defaults to None for the latest snapshot
+
+        Returns:
+            {bytes} -- the raw body, None if there is no snapshot of the url by that time
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT digest FROM snapshots WHERE url = ? AND ts <= ? ORDER BY ts DESC, id DESC LIMIT 1",
+                (url, float("inf") if ts is None else ts)).fetchone()
+        return None if row is None else self.read(row[0])
+
+    def prune(self, max_bytes: int = None) -> int:
+        """Deletes the oldest snapshots, and any body no longer referenced by a snapshot,
+        until the stored bodies fit within a size.
+
+        Arguments:
+            max_bytes {int} -- optional, the size to prune to, defaults to PRUNE_TARGET of the size cap
+
+        Returns:
+            {int} -- the number of bytes freed
+        """
+        target = int(self.max_bytes * PRUNE_TARGET) if max_bytes is None else max_bytes
+        freed = 0
+        with self._lock:
+            while self._total_bytes > target:
+                oldest = self._connection.execute("SELECT id, digest FROM snapshots ORDER BY ts, id LIMIT 256").fetchall()
+                if not oldest:
+                    break
+                for snapshot_id, digest in oldest:
+                    self._connection.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+                    if self._connection.execute("SELECT 1 FROM snapshots WHERE digest = ? LIMIT 1",
+                                                (digest,)).fetchone() is None:
+                        freed += self._delete_object(digest)
+                    if self._total_bytes <= target:
+                        break
+            self._connection.commit()
+        if freed:
+            logging.debug("Pruned 'bytes:%s' from the snapshot archive.", freed)
+        return freed
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            except Exception as error: # pylint: disable=broad-except
+                # Any failure loses this snapshot only, the writer carries on so that flush() returns
+                logging.warning("Failed to archive snapshot of 'url:%s' with 'error:%r'.", item[0], error)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, url: str, content: bytes, ts: float, digest: str):
+        digest = digest or body_digest(content)
+        with self._lock:
+            stored = self._connection.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone()
+        if stored is None:
+            # The body is written before it is indexed, so the index never refers to a missing body
+            compressed = zlib.compress(content, self.level)
+            path = self._object_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(compressed)
+            os.replace(path + ".tmp", path)
+
+        with self._lock:
+            if stored is None:
+                self._connection.execute("INSERT OR IGNORE INTO objects (digest, size, raw_size) VALUES (?, ?, ?)",
+                                         (digest, len(compressed), len(content)))
+                self._total_bytes += len(compressed)
+                self.written += 1
+            else:
+                self.deduplicated += 1
+            self._connection.execute("INSERT INTO snapshots (url, ts, digest) VALUES (?, ?, ?)", (url, ts, digest))
+            self._connection.commit()
+        if self._total_bytes > self.max_bytes:
+            self.prune()
+
+    def _delete_object(self, digest: str) -> int:
+        row = self._connection.execute("SELECT size FROM objects WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return 0
+        self._connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        self._total_bytes -= row[0]
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+        return row[0]
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.path, "objects", digest[:2], digest + ".z")
@@ -2,53 +2,80 @@
 
 # Standard Libraries
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import threading
+from collections import deque
 
 # Third-party Libraries
 from PyQt5 import QtCore, QtWidgets
 
+# Local Application Libraries
+from pricepal.common.log_pipeline import DEFAULT_LOG_DIR, LOG_FORMAT, init_logging
+
+# Constants ===========================================================
+
+DEFAULT_FLUSH_INTERVAL = 100
+# Milliseconds between flushes of buffered records to the log box.
+
+DEFAULT_MAX_BUFFERED = 5000
+# Lines buffered between flushes, beyond which the oldest are discarded.
+
+DEFAULT_MAX_BLOCKS = 2000
+# Lines held by the log box, beyond which the oldest are removed.
+
 # =====================================================================
 
 class QTextEditLogger(logging.Handler, QtCore.QObject):
     """A widget implementing the plain text widget, which can also be
     used as a threadsafe log handler. This class includes functionality
-    to emit both logging and scrolling to the proper row to view the
-    most recent log.
+    to display logging and scroll to the proper row to view the most
+    recent log.
+
+    Records may be logged from any thread at any rate. Each record is
+    only formatted into a bounded ring buffer, and the buffer is flushed
+    to the widget by a QTimer on the GUI thread, with one append and one
+    scroll per tick. Consecutive records with the same level and message
+    are coalesced into one line with a repeat count, and the widget holds
+    at most max_blocks lines, so neither the event loop nor the memory of
+    the widget grows with the rate of logging.
 
     Note, this class has been hard-coded to highly optimize its
     appearance in a PyQt statusbar widget as its parent. The function
-    and signals are not hardcoded, but rather the UI formatting.
+    and timer are not hardcoded, but rather the UI formatting.
 
     Inherits:
         logging.Handler: for functionality to handle logs as created across the higher level application.
-        QtCore.QObject: for general Qt functionality, as well as to use pyqtSignals for threadsafe operations.
+        QtCore.QObject: for general Qt functionality, as well as to own the QTimer flushing the buffer.
     """
 
-    # Create a signal to manage the appending of a single line of text
-    appendPlainText = QtCore.pyqtSignal(str)
-
-    # Create a signal to scroll to a specified row of AbstractScrollArea
-    setScrollValue = QtCore.pyqtSignal(int)
-
-    def __init__(self, status_bar: QtWidgets.QStatusBar):
+    def __init__(self, status_bar: QtWidgets.QStatusBar, flush_interval: int = DEFAULT_FLUSH_INTERVAL,
+                 max_buffered: int = DEFAULT_MAX_BUFFERED, max_blocks: int = DEFAULT_MAX_BLOCKS):
         """Initializes a QTextEditLogger within a specified QStatusBar parent.
 
         Args:
             status_bar (QtWidgets.QStatusBar): the parent of the QTextEditLogger, must be of type QStatusBar.
             This requirement is due to UI formatting and could be lifted with generalized or dynamic formatting.
+            flush_interval (int): optional, milliseconds between flushes to the widget, defaults to DEFAULT_FLUSH_INTERVAL.
+            max_buffered (int): optional, lines held between flushes before the oldest are discarded,
+            defaults to DEFAULT_MAX_BUFFERED.
+            max_blocks (int): optional, lines held by the widget before the oldest are removed, defaults to DEFAULT_MAX_BLOCKS.
         """
         super().__init__()
         QtCore.QObject.__init__(self)
 
+        # Buffered lines are [key, text, count], with the key identifying repeats of a record
+        self._buffer = deque(maxlen=max_buffered)
+        self._buffer_lock = threading.Lock()
+        self.discarded = 0
+
         # Instantiate the QPlainTextEdit widget with Qt functionality
         self.widget = QtWidgets.QPlainTextEdit(status_bar)
 
         # Set this widget to be ReadOnly to facilitate logging display
         self.widget.setReadOnly(True)
 
-        # Connect the defined pyqt signals to their respective functionality
-        self.setScrollValue.connect(self.widget.verticalScrollBar().setValue)
-        self.appendPlainText.connect(self.widget.appendPlainText)
+        # Bound the lines held by the widget, the oldest are removed first
+        self.widget.setMaximumBlockCount(max_blocks)
 
         # Add the widget as the first in the statusbar, set static formatting
         status_bar.addPermanentWidget(self.widget, 1)
@@ -63,30 +90,47 @@ class QTextEditLogger(logging.Handler, QtCore.QObject):
         # Generate placeholder text which will be replaced by the first log message
         self.widget.setPlaceholderText("Initializing Logger ...")
 
+        # Flush the buffer to the widget from the GUI thread on each tick of the timer
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(flush_interval)
+        self.timer.timeout.connect(self.flush_to_widget)
+        self.timer.start()
+
     def emit(self, record):
-        msg = self.format(record)
-        self.appendPlainText.emit(msg)
-        self.setScrollValue.emit(self.widget.verticalScrollBar().maximum() - 1)
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        key = (record.levelno, record.getMessage())
+        with self._buffer_lock:
+            if self._buffer and self._buffer[-1][0] == key:
+                # Repeats show the time of the latest record, along with the count
+                self._buffer[-1][1] = msg
+                self._buffer[-1][2] += 1
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self.discarded += 1
+            self._buffer.append([key, msg, 1])
+
+    def flush_to_widget(self):
+        """Appends the buffered lines to the widget in a single block, and scrolls to the latest.
+        Must be called from the GUI thread, as it is by the timer."""
+        with self._buffer_lock:
+            if not self._buffer:
+                return
+            lines = [text if count == 1 else f"{text} (repeated {count} times)" for _, text, count in self._buffer]
+            self._buffer.clear()
+
+        self.widget.appendPlainText("\n".join(lines))
+        scroll_bar = self.widget.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum() - 1)
 
 def init_test_logging():
-    logging.getLogger().setLevel(logging.DEBUG)
-
     log_console = logging.StreamHandler()
-    log_console.setFormatter(
-        logging.Formatter(
-            '%(asctime)s | %(levelname)s | Module: %(module)s | Function: %(funcName)s | %(message)s'
-        )
-    )
-
-    logging.getLogger().addHandler(log_console)
-
-    rotating_log_file = RotatingFileHandler('data/logs/pricepal-test-log.log', maxBytes=100000, backupCount=9)
-    rotating_log_file.setFormatter(
-        logging.Formatter(
-            '%(asctime)s | %(levelname)s | Module: %(module)s | Function: %(funcName)s | %(message)s'
-        )
-    )
-
-    logging.getLogger().addHandler(rotating_log_file)
+    log_console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    # The console and log file are written from the pipeline's listener thread, off the logging thread
+    init_logging(os.path.join(DEFAULT_LOG_DIR, 'pricepal-test-log.log'), handlers=[log_console])
 
     logging.debug("Initialized logger for test functionality.")
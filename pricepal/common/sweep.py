@@ -0,0 +1,166 @@
+"""
+Summary:
+
+This module contains the sweep pipeline, which carries a batch of
+watched products from their pages through to alerts:
+    fetch and extract -> normalize -> history store -> alert rules -> notification.
+
+Pages are requested with their field regions fingerprinted, and a page
+whose regions are unchanged since the previous sweep is reported as
+unchanged and goes no further: it is not extracted, normalized, written
+to the history store or evaluated against the alert rules. A steady
+state sweep, where few prices move, is therefore little more than the
+requests themselves. The fingerprint of a changed page is recorded once
+its row is stored, so a sweep which fails part way leaves its pages to
+be carried through by the next sweep.
+
+Functions:
+    run_sweep() : fetches the pages of a batch of products and carries any changes through to alerts.
+    record_changes() : carries the raw field values of changed products through normalization, storage and alerts.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import time
+from collections import defaultdict
+
+# Third-party Libraries
+import pandas as pd
+
+# Local Application Libraries
+import pricepal.common.metrics as metrics
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.common.fetch_policy import FetchPolicy
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.normalize import DEFAULT_CURRENCY, normalize_sweep
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.snapshot_archive import SnapshotArchive
+from pricepal.notification.rules import RuleEngine, notify_alerts
+
+# =====================================================================
+
+def run_sweep(products: pd.DataFrame, spec: ExtractionSpec, store: HistoryStore, cache: ResponseCache = None,
+              engine: RuleEngine = None, dispatcher=None, policy: FetchPolicy = None, archive: SnapshotArchive = None,
+              max_workers: int = scraper.DEFAULT_MAX_WORKERS, max_per_host: int = scraper.DEFAULT_MAX_PER_HOST,
+              timeout: float = scraper.DEFAULT_TIMEOUT, price_field: str = "price", stock_field: str = "stock",
+              default_currency: str = DEFAULT_CURRENCY, ts=None) -> dict:
+    """Fetches the page of every product, and carries the products whose fields changed through
+    normalization, the history store and the alert rules, queuing any alerts raised.
+    Without a cache every page is treated as changed, as there is no fingerprint to compare against.
+    The fingerprints of the changed pages are recorded only once their rows are stored, so that if
+    the sweep fails before then, the next sweep carries their changes through again.
+
+    Arguments:
+        products {pandas.DataFrame} -- one row per product with the columns product_id and url
+        spec {ExtractionSpec} -- the spec describing the fields of the pages, including price_field and stock_field
+        store {HistoryStore} -- the store the prices of changed products are appended to
+        cache {ResponseCache} -- optional, cache of responses and region fingerprints, defaults to None for no caching
+        engine {RuleEngine} -- optional, the alert rules evaluated against changed products, defaults to None for no alerts
+        dispatcher {NotificationDispatcher} -- optional, dispatcher the alerts are queued on, defaults to None
+        policy {FetchPolicy} -- optional, per-host rate limit, retry and circuit breaker, defaults to None for none
+        archive {SnapshotArchive} -- optional, archive keeping a snapshot of each page, defaults to None for no snapshots
+        max_workers {int} -- optional, total number of concurrent requests, defaults to DEFAULT_MAX_WORKERS
+        max_per_host {int} -- optional, number of concurrent requests per host, defaults to DEFAULT_MAX_PER_HOST
+        timeout {float} -- optional, seconds to wait on the connection and each read, defaults to DEFAULT_TIMEOUT
+        price_field {str} -- optional, the field of the spec holding the price, defaults to "price"
+        stock_field {str} -- optional, the field of the spec holding the stock, defaults to "stock"
+        default_currency {str} -- optional, currency of a bare "$" or of no symbol, defaults to DEFAULT_CURRENCY
+        ts {datetime, str} -- optional, the time recorded against the sweep, defaults to now
+
+    Returns:
+        {dict} -- counts of the sweep: pages, unchanged, changed, failed, rejected and alerts,
+                  along with the seconds taken by each stage under "seconds"
+    """
+    started = time.perf_counter()
+    ts = pd.Timestamp.now(tz="UTC") if ts is None else pd.Timestamp(ts)
+    product_ids = defaultdict(list)
+    for product_id, url in zip(products["product_id"], products["url"]):
+        product_ids[url].append(product_id)
+
+    report = {"pages": len(product_ids), "unchanged": 0, "changed": 0, "failed": 0, "rejected": 0, "alerts": 0}
+    rows = {"product_id": [], "price": [], "stock": []}
+    fingerprints = {}
+    for url, result in scraper.request_and_extract_many(list(product_ids), spec, max_workers=max_workers,
+                                                        max_per_host=max_per_host, timeout=timeout, cache=cache,
+                                                        policy=policy, archive=archive, skip_unchanged=True):
+        if isinstance(result, dict):
+            report["changed"] += 1
+            if result.fingerprint is not None:
+                fingerprints[url] = result.fingerprint
+            for product_id in product_ids[url]:
+                rows["product_id"].append(product_id)
+                rows["price"].append(result.get(price_field))
+                rows["stock"].append(result.get(stock_field))
+        elif result == scraper.UNCHANGED:
+            report["unchanged"] += 1
+        else:
+            report["failed"] += 1
+    seconds = {"fetch": time.perf_counter() - started}
+
+    if rows["product_id"]:
+        stored = None if cache is None else lambda: cache.record_fingerprints(spec.key, fingerprints)
+        downstream = record_changes(rows, store, engine, dispatcher, ts, default_currency, stored)
+        report["rejected"], report["alerts"] = downstream["rejected"], downstream["alerts"]
+        seconds.update(downstream["seconds"])
+
+    report["seconds"] = seconds
+    # Fetch, parse and extract are timed per page by the scrape engine, the later stages once per sweep
+    current = metrics.registry()
+    if current is not None:
+        for stage in ("normalize", "store", "alerts"):
+            if stage in seconds:
+                current.observe(stage, seconds[stage])
+        current.observe("sweep", time.perf_counter() - started)
+        for outcome in ("changed", "unchanged", "failed"):
+            current.count("sweep_pages", outcome=outcome, value=report[outcome])
+        current.count("sweep_rejected", value=report["rejected"])
+        current.count("sweep_alerts", value=report["alerts"])
+    logging.info("Completed sweep of 'pages:%s' with 'changed:%s', 'unchanged:%s', 'failed:%s', 'alerts:%s'.",
+                 report["pages"], report["changed"], report["unchanged"], report["failed"], report["alerts"])
+    return report
+
+def record_changes(rows: dict, store: HistoryStore, engine: RuleEngine = None, dispatcher=None, ts=None,
+                   default_currency: str = DEFAULT_CURRENCY, stored=None) -> dict:
+    """Carries the raw field values of changed products through normalization, the history
+    store and the alert rules, queuing any alerts raised.
+
+    Arguments:
+        rows {dict} -- lists of the product_id, raw price and raw stock of each changed product
+        store {HistoryStore} -- the store the prices are appended to
+        engine {RuleEngine} -- optional, the alert rules evaluated against the products, defaults to None for no alerts
+        dispatcher {NotificationDispatcher} -- optional, dispatcher the alerts are queued on, defaults to None
+        ts {datetime, str} -- optional, the time recorded against the rows, defaults to now
+        default_currency {str} -- optional, currency of a bare "$" or of no symbol, defaults to DEFAULT_CURRENCY
+        stored {callable} -- optional, called once the rows are in the store, before the alert rules, defaults to None
+
+    Returns:
+        {dict} -- counts of the rejected values and alerts raised, with the seconds taken by each stage under "seconds"
+    """
+    ts = pd.Timestamp.now(tz="UTC") if ts is None else pd.Timestamp(ts)
+    result = {"rejected": 0, "alerts": 0, "seconds": {}}
+    seconds = result["seconds"]
+
+    began = time.perf_counter()
+    normalized, rejects = normalize_sweep(pd.DataFrame(rows), default_currency=default_currency)
+    normalized["ts"] = ts
+    result["rejected"] = len(rejects)
+    seconds["normalize"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    store.append(normalized[["product_id", "ts", "price_cents", "stock"]])
+    if stored is not None:
+        stored()
+    seconds["store"] = time.perf_counter() - began
+
+    if engine is not None:
+        began = time.perf_counter()
+        alerts = engine.evaluate(normalized)
+        result["alerts"] = len(alerts)
+        if dispatcher is not None:
+            notify_alerts(alerts, dispatcher)
+        seconds["alerts"] = time.perf_counter() - began
+    return result
@@ -0,0 +1,450 @@
+"""
+Summary:
+
+This module contains the watchlist, the resident set of tracked products
+read by the scheduling and alert paths, sized for a million products.
+
+Rather than an object or dict per product, each field is held in a numpy
+array with one row per product. Hosts are interned, so a product holds
+only the id of its host, and the remainder of each url is held as utf-8
+bytes in one shared buffer. Products are found by id through a pandas
+index over the ids loaded in bulk, a hash table in C rather than a dict
+of Python ints, with a dict only for products added since the index was
+last built.
+
+Memory per product:
+    product_id 8, host_id 4, url offset and length 12, last_price_cents 8,
+    last_change 8, next_due 8, fingerprint 16, alive 1    -- 65 bytes
+    id index, a copy of the id and its hash table entry   -- ~42 bytes
+    the utf-8 bytes of the url after its host             -- ~30-80 bytes for typical product urls
+so a million products with 40 byte paths use about 150 MB, where a dict
+per product would use over 1 GB. Arrays grow by doubling, so products
+added one at a time may leave up to 65 bytes of spare capacity each,
+which compact() trims. See BYTES_PER_PRODUCT, as held by the test suite.
+
+Classes:
+    Watchlist : compact, array-backed set of tracked products with interned hosts and urls.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import threading
+import time
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore, MISSING_PRICE
+
+# Constants ===========================================================
+
+FIELDS = {"product_id": (np.int64, ()), "host_id": (np.int32, ()), "url_start": (np.int64, ()),
+          "url_length": (np.int32, ()), "last_price_cents": (np.int64, ()), "last_change": (np.int64, ()),
+          "next_due": (np.float64, ()), "fingerprint": (np.uint8, (16,)), "alive": (np.bool_, ())}
+# Array, dtype and shape of each row, of every field held per product.
+# last_change holds nanoseconds since the epoch, UTC, and next_due seconds since the epoch as from time.time.
+
+NO_TIME = np.iinfo(np.int64).min
+# Stored in last_change for products never seen to change, read back as NaT.
+
+BYTES_PER_PRODUCT = 120
+# Bytes held per product excluding its url, when loaded in bulk, which the test suite holds the watchlist to.
+
+MIN_CAPACITY = 1024
+# Rows allocated by an empty watchlist on its first add.
+
+REINDEX_FRACTION = 0.25
+# Share of the indexed products which may be added through the dict before the id index is rebuilt.
+
+# =====================================================================
+
+class Watchlist:
+    """The tracked products, each with its url, host, last price, time of its last
+    price change, time its next poll is due and the fingerprint of its page regions.
+
+    Products are added by add() or in bulk by add_many(), from_frame() or
+    from_history(), and read by get(), url(), due() or in bulk by to_frame(). Removed
+    products leave a tombstone row until compact() is called.
+
+    The watchlist is safe to share between threads.
+    """
+
+    def __init__(self, capacity: int = 0):
+        """Initializes an empty watchlist.
+
+        Arguments:
+            capacity {int} -- optional, rows to allocate up front, defaults to 0 to allocate on the first add
+        """
+        self.size = 0
+        self.removed = 0
+        self.hosts = []
+        self._host_ids = {}
+        self._columns = {name: np.empty((capacity,) + shape, dtype=dtype) for name, (dtype, shape) in FIELDS.items()}
+        self._urls = bytearray()
+        self._index = pd.Index(np.empty(0, dtype=np.int64))
+        self._recent = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.size - self.removed
+
+    def __contains__(self, product_id) -> bool:
+        with self._lock:
+            return self._row(product_id) >= 0
+
+    def add(self, product_id: int, url: str, next_due: float = 0.0, last_price_cents: int = None):
+        """Adds a product, or replaces the url and schedule of a product already present,
+        and its price if one is given.
+
+        Arguments:
+            product_id {int} -- the id of the product
+            url {str} -- the complete url of the product's page
+            next_due {float} -- optional, the time its next poll is due in seconds since the epoch, defaults to 0.0 for now
+            last_price_cents {int} -- optional, the last known price, defaults to None for unknown
+        """
+        self.add_many([product_id], [url], next_due, [last_price_cents])
+
+    def add_many(self, product_ids, urls, next_due=0.0, last_price_cents=None) -> int:
+        """Adds a batch of products, replacing the url and schedule of any already present,
+        and their price where one is given.
+
+        Arguments:
+            product_ids {array-like} -- the unique ids of the products
+            urls {iterable} -- the complete url of each product's page
+            next_due {float, array-like} -- optional, time each next poll is due in seconds since the epoch, defaults to 0.0
+            last_price_cents {array-like} -- optional, the last known price of each product, None for unknown,
+                                             or for a product present to keep its price, defaults to None for all
+
+        Returns:
+            {int} -- the number of products added which were not already present
+
+        Raises:
+            ValueError -- if the batch holds an id more than once, or the number of urls differs from the ids
+        """
+        ids = np.asarray(product_ids, dtype=np.int64).ravel()
+        urls = urls.tolist() if hasattr(urls, "tolist") else list(urls)
+        if len(urls) != len(ids):
+            raise ValueError("A url must be given for each product id added to a watchlist.")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Product ids added to a watchlist must be unique within the batch.")
+        if len(ids) == 0:
+            return 0
+        prices = np.full(len(ids), MISSING_PRICE, dtype=np.int64)
+        if last_price_cents is not None:
+            known = pd.array(list(last_price_cents), dtype="Int64")
+            prices = known.to_numpy(dtype=np.int64, na_value=MISSING_PRICE)
+
+        with self._lock:
+            # Intern each host, and append the rest of every url to the shared buffer
+            # A url is split after its host, "https://shop.example/p/1" into "https://shop.example" and "/p/1"
+            host_ids = []
+            paths = []
+            for url in urls:
+                cut = url.find("/", url.find("//") + 2)
+                if cut < 0:
+                    cut = len(url)
+                host = url[:cut]
+                host_id = self._host_ids.get(host)
+                if host_id is None:
+                    host_id = self._host_ids[host] = len(self.hosts)
+                    self.hosts.append(host)
+                host_ids.append(host_id)
+                paths.append(url[cut:].encode("utf-8"))
+            host_ids = np.array(host_ids, dtype=np.int32)
+            lengths = np.fromiter(map(len, paths), dtype=np.int32, count=len(paths))
+            starts = len(self._urls) + np.concatenate(([0], np.cumsum(lengths[:-1], dtype=np.int64)))
+            self._urls.extend(b"".join(paths))
+
+            # Products already present keep their row, so that their last change is kept
+            rows = self._rows(ids)
+            new = rows < 0
+            added = int(new.sum())
+            self._reserve(self.size + added)
+            rows[new] = np.arange(self.size, self.size + added)
+            columns = self._columns
+            columns["product_id"][rows] = ids
+            columns["host_id"][rows] = host_ids
+            columns["url_start"][rows] = starts
+            columns["url_length"][rows] = lengths
+            # A product already present keeps its known price unless a price is given for it
+            kept = ~new & (prices == MISSING_PRICE)
+            kept[kept] = columns["alive"][rows[kept]]
+            prices[kept] = columns["last_price_cents"][rows[kept]]
+            columns["last_price_cents"][rows] = prices
+            columns["next_due"][rows] = next_due
+            # A removed product added again starts afresh, as a new product, rather than from its old row
+            revived = ~new
+            revived[revived] = ~columns["alive"][rows[revived]]
+            columns["last_change"][rows[new | revived]] = NO_TIME
+            columns["fingerprint"][rows[new | revived]] = 0
+            self.removed -= int(revived.sum())
+            columns["alive"][rows] = True
+            self.size += added
+
+            if len(self._recent) + added > max(MIN_CAPACITY, REINDEX_FRACTION * len(self._index)):
+                self._reindex()
+            else:
+                self._recent.update(zip(ids[new].tolist(), rows[new].tolist()))
+        return added
+
+    def remove(self, product_id: int) -> bool:
+        """Removes a product, leaving a tombstone row until compact() is called.
+
+        Arguments:
+            product_id {int} -- the id of the product
+
+        Returns:
+            {bool} -- True if the product was present
+        """
+        with self._lock:
+            row = self._row(product_id)
+            if row < 0:
+                return False
+            self._columns["alive"][row] = False
+            self.removed += 1
+            return True
+
+    def get(self, product_id: int) -> dict:
+        """Returns the fields of a product.
+
+        Arguments:
+            product_id {int} -- the id of the product
+
+        Returns:
+            {dict} -- product_id, url, host, last_price_cents (None if unknown), last_change (pandas.Timestamp,
+                      None if never seen to change), next_due and fingerprint (hex, None if unknown),
+                      or None if the product is not present
+        """
+        with self._lock:
+            row = self._row(product_id)
+            if row < 0:
+                return None
+            columns = self._columns
+            price = int(columns["last_price_cents"][row])
+            changed = int(columns["last_change"][row])
+            fingerprint = columns["fingerprint"][row]
+            return {"product_id": int(product_id), "url": self._url(row), "host": self.hosts[columns["host_id"][row]],
+                    "last_price_cents": None if price == MISSING_PRICE else price,
+                    "last_change": None if changed == NO_TIME else pd.Timestamp(changed, unit="ns", tz="UTC"),
+                    "next_due": float(columns["next_due"][row]),
+                    "fingerprint": fingerprint.tobytes().hex() if fingerprint.any() else None}
+
+    def url(self, product_id: int) -> str:
+        """Returns the url of a product, or None if the product is not present."""
+        with self._lock:
+            row = self._row(product_id)
+            return None if row < 0 else self._url(row)
+
+    def record(self, product_ids, price_cents, ts=None, fingerprints=None, next_due=None) -> np.ndarray:
+        """Records the prices seen by a poll of a batch of products. The last change of each product
+        whose price differs from its last known price is set to the time of the poll.
+
+        Arguments:
+            product_ids {array-like} -- the ids of the products polled, ids not present or removed are ignored
+            price_cents {array-like} -- the price of each product, None or <NA> for no price
+            ts {datetime, str, int} -- optional, the time of the poll, defaults to now
+            fingerprints {iterable} -- optional, the hex region fingerprint of each page, defaults to None to keep them
+            next_due {float, array-like} -- optional, the time each next poll is due, defaults to None to keep them
+
+        Returns:
+            {numpy.ndarray} -- the ids of the products whose price changed
+        """
+        ids = np.asarray(product_ids, dtype=np.int64).ravel()
+        prices = pd.array(list(price_cents), dtype="Int64").to_numpy(dtype=np.int64, na_value=MISSING_PRICE)
+        if fingerprints is not None:
+            fingerprints = np.array([np.frombuffer(bytes.fromhex(fingerprint), dtype=np.uint8) if fingerprint
+                                     else np.zeros(16, dtype=np.uint8) for fingerprint in fingerprints]).reshape(-1, 16)
+        ts_ns = pd.Timestamp.now(tz="UTC").value if ts is None else pd.Timestamp(ts).value
+
+        with self._lock:
+            rows = self._rows(ids)
+            present = rows >= 0
+            # Removed products are ignored, as are ids never added
+            present[present] = self._columns["alive"][rows[present]]
+            rows, ids, prices = rows[present], ids[present], prices[present]
+            columns = self._columns
+            changed = columns["last_price_cents"][rows] != prices
+            columns["last_price_cents"][rows] = prices
+            columns["last_change"][rows[changed]] = ts_ns
+            if next_due is not None:
+                columns["next_due"][rows] = np.broadcast_to(next_due, len(present))[present]
+            if fingerprints is not None:
+                columns["fingerprint"][rows] = fingerprints[present]
+        return ids[changed]
+
+    def due(self, now: float = None, limit: int = None) -> np.ndarray:
+        """Returns the ids of the products whose next poll is due, most overdue first.
+
+        Arguments:
+            now {float} -- optional, the current time in seconds since the epoch, defaults to time.time()
+            limit {int} -- optional, most ids returned, defaults to None for every due product
+
+        Returns:
+            {numpy.ndarray} -- the ids of the due products
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            columns = {name: values[:self.size] for name, values in self._columns.items()}
+            rows = np.flatnonzero(columns["alive"] & (columns["next_due"] <= now))
+            due = columns["next_due"][rows]
+            if limit is not None and limit < len(rows):
+                nearest = np.argpartition(due, limit)[:limit]
+                rows, due = rows[nearest], due[nearest]
+            return columns["product_id"][rows[np.argsort(due, kind="stable")]]
+
+    def to_frame(self, urls: bool = True) -> pd.DataFrame:
+        """Exports the products as a DataFrame, with the columns product_id, url, host (categorical),
+        host_id, last_price_cents (nullable integer), last_change (UTC datetimes), next_due and fingerprint.
+
+        Arguments:
+            urls {bool} -- optional, include the url column, the only column built per product, defaults to True
+
+        Returns:
+            {pandas.DataFrame} -- one row per product in the order added
+        """
+        with self._lock:
+            rows = np.flatnonzero(self._columns["alive"][:self.size])
+            columns = {name: values[rows] for name, values in self._columns.items()}
+            hosts = pd.Categorical.from_codes(columns["host_id"], categories=pd.Index(self.hosts, dtype=object)) \
+                if self.hosts else pd.Categorical([])
+            frame = {"product_id": columns["product_id"]}
+            if urls:
+                frame["url"] = [self._url(row) for row in rows]
+            prices = columns["last_price_cents"]
+            fingerprints = columns["fingerprint"]
+            known = fingerprints.any(axis=1)
+            frame.update({"host": hosts, "host_id": columns["host_id"],
+                          "last_price_cents": pd.arrays.IntegerArray(prices, prices == MISSING_PRICE),
+                          "last_change": pd.to_datetime(columns["last_change"], unit="ns", utc=True),
+                          "next_due": columns["next_due"],
+                          "fingerprint": [fingerprint.tobytes().hex() if present else None
+                                          for fingerprint, present in zip(fingerprints, known)]})
+        return pd.DataFrame(frame)
+
+    @classmethod
+    def from_frame(cls, products: pd.DataFrame) -> "Watchlist":
+        """Creates a watchlist from a DataFrame of products.
+
+        Arguments:
+            products {pandas.DataFrame} -- one row per product with the columns product_id and url,
+                                           and optionally next_due and last_price_cents
+
+        Returns:
+            {Watchlist} -- the watchlist
+        """
+        watchlist = cls(capacity=len(products))
+        watchlist.add_many(products["product_id"].to_numpy(), products["url"],
+                           products["next_due"].to_numpy() if "next_due" in products else 0.0,
+                           products["last_price_cents"] if "last_price_cents" in products else None)
+        return watchlist
+
+    @classmethod
+    def from_history(cls, products: pd.DataFrame, store: HistoryStore) -> "Watchlist":
+        """Creates a watchlist from a DataFrame of products, as from_frame, with the last price of
+        each product taken from the latest rows of a HistoryStore. As sweeps store only products
+        whose page changed, the time of a product's latest row is taken as its last change.
+
+        Arguments:
+            products {pandas.DataFrame} -- one row per product with the columns product_id and url
+            store {HistoryStore} -- the store holding the price history of the products
+
+        Returns:
+            {Watchlist} -- the watchlist
+        """
+        watchlist = cls.from_frame(products)
+        watchlist.load_history(store)
+        return watchlist
+
+    def load_history(self, store: HistoryStore) -> int:
+        """Sets the last price and last change of each product from the latest rows of a HistoryStore.
+
+        Arguments:
+            store {HistoryStore} -- the store holding the price history of the products
+
+        Returns:
+            {int} -- the number of products found in the store
+        """
+        latest = store.latest()
+        ids = latest["product_id"].to_numpy(dtype=np.int64)
+        prices = latest["price_cents"].to_numpy(dtype=np.int64, na_value=MISSING_PRICE)
+        changes = latest["ts"].dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        with self._lock:
+            rows = self._rows(ids)
+            present = rows >= 0
+            present[present] = self._columns["alive"][rows[present]]
+            self._columns["last_price_cents"][rows[present]] = prices[present]
+            self._columns["last_change"][rows[present]] = changes[present]
+        return int(present.sum())
+
+    def compact(self):
+        """Drops the rows of removed products and the url bytes no longer referred to, and trims
+        the arrays to the number of products."""
+        with self._lock:
+            rows = np.flatnonzero(self._columns["alive"][:self.size])
+            columns = {name: values[rows] for name, values in self._columns.items()}
+            urls = bytearray()
+            for position, row in enumerate(rows):
+                start = int(self._columns["url_start"][row])
+                columns["url_start"][position] = len(urls)
+                urls += self._urls[start:start + int(self._columns["url_length"][row])]
+            self._columns = columns
+            self._urls = urls
+            self.size = len(rows)
+            self.removed = 0
+            self._reindex()
+
+    def memory_bytes(self) -> int:
+        """Returns the bytes held by the arrays, url buffer and id index of the watchlist,
+        excluding the interned hosts.
+
+        Returns:
+            {int} -- the bytes held
+        """
+        with self._lock:
+            arrays = sum(values.nbytes for values in self._columns.values())
+            # An entry of the dict of recent additions holds about 100 bytes, with its int key and value
+            return arrays + len(self._urls) + self._index.memory_usage(deep=True) + 100 * len(self._recent)
+
+    def _reserve(self, size: int):
+        capacity = len(self._columns["product_id"])
+        if size <= capacity:
+            return
+        capacity = max(2 * capacity, size, MIN_CAPACITY)
+        for name, values in self._columns.items():
+            grown = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self._columns[name] = grown
+
+    def _reindex(self):
+        # Hashed lookup over every row, the dict of recent additions is emptied
+        self._index = pd.Index(self._columns["product_id"][:self.size].copy())
+        if self.size:
+            # Builds the hash table now, rather than on the first lookup
+            self._index.get_loc(self._index[0])
+        self._recent = {}
+
+    def _row(self, product_id) -> int:
+        row = self._recent.get(product_id, -1)
+        if row < 0:
+            try:
+                row = self._index.get_loc(product_id)
+            except KeyError:
+                return -1
+        return row if self._columns["alive"][row] else -1
+
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        # Rows of every id, alive or removed, -1 for ids never added
+        rows = self._index.get_indexer(ids) if len(self._index) else np.full(len(ids), -1, dtype=np.intp)
+        if self._recent:
+            missing = np.flatnonzero(rows < 0)
+            rows[missing] = [self._recent.get(product_id, -1) for product_id in ids[missing].tolist()]
+        return rows.astype(np.int64)
+
+    def _url(self, row: int) -> str:
+        start = int(self._columns["url_start"][row])
+        path = self._urls[start:start + int(self._columns["url_length"][row])].decode("utf-8")
+        return self.hosts[self._columns["host_id"][row]] + path
@@ -0,0 +1,347 @@
+"""
+Summary:
+
+This module contains the durable work queue shared by the processes of a
+sharded sweep. Tasks and their results are held in a sqlite database in
+WAL mode under the data directory, so that any number of processes on
+the machine may put, lease and complete tasks concurrently, and nothing
+is lost if a process, or the whole machine, stops part way.
+
+A task is leased by one worker at a time, for a limited time. A worker
+which crashes or hangs simply stops renewing its lease, and once the
+lease expires the task is leased again, by a restarted worker, up to a
+maximum number of attempts. A worker whose lease has expired can no
+longer complete the task, so each task's result is recorded once.
+
+Classes:
+    Task : a leased task, with its id, sweep, shard, payload and attempt number.
+    WorkQueue : sqlite backed queue of tasks with lease-based retry, and their results.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Local Application Libraries
+from pricepal.pricepal_utils import DATA_DIR
+
+# Constants ===========================================================
+
+DEFAULT_QUEUE_PATH = os.path.join(DATA_DIR, "queue", "sweeps.sqlite3")
+
+DEFAULT_LEASE_SECONDS = 120
+# Seconds a task stays leased without being renewed, after which it is leased again.
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Times a task is leased before it is marked failed, so that a task which crashes every worker is given up.
+
+DEFAULT_RETRY_DELAY = 5
+# Seconds before a task failed by its worker is leased again.
+
+DEFAULT_BUSY_TIMEOUT = 30
+# Seconds a connection waits on the write lock held by another process.
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+# States of a task.
+
+# =====================================================================
+
+Task = namedtuple("Task", ["id", "sweep", "shard", "payload", "attempts"])
+
+class WorkQueue:
+    """A durable queue of tasks, partitioned into sweeps and, within a sweep, shards.
+
+    Each process should open its own WorkQueue on the same path; a WorkQueue may
+    be shared between the threads of a process. Time is read from an injectable
+    clock, in seconds, so that lease expiry may be driven by tests.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        """Opens, or creates, the queue database at the given path.
+
+        Arguments:
+            path {str} -- optional, location of the sqlite database, defaults to DEFAULT_QUEUE_PATH
+            lease_seconds {float} -- optional, seconds a lease lasts without renewal, defaults to DEFAULT_LEASE_SECONDS
+            max_attempts {int} -- optional, times a task is leased before it fails, defaults to DEFAULT_MAX_ATTEMPTS
+            clock {callable} -- optional, returns the current time in seconds, defaults to time.time
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Transactions are begun explicitly, so that a lease reads and claims tasks under one write lock
+        self._connection = sqlite3.connect(path, timeout=DEFAULT_BUSY_TIMEOUT, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                                 "id INTEGER PRIMARY KEY, sweep TEXT NOT NULL, shard INTEGER NOT NULL, "
+                                 "payload TEXT NOT NULL, state TEXT NOT NULL, attempts INTEGER NOT NULL, "
+                                 "owner TEXT, expires REAL, available REAL NOT NULL, error TEXT, result TEXT)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS tasks_shard ON tasks (sweep, shard, state, available)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS merged (sweep TEXT PRIMARY KEY)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS submitted (sweep TEXT PRIMARY KEY, ts REAL NOT NULL)")
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put_many(self, sweep: str, shard: int, payloads) -> int:
+        """Adds tasks to a shard of a sweep.
+
+        Arguments:
+            sweep {str} -- the id of the sweep
+            shard {int} -- the shard the tasks belong to
+            payloads {iterable} -- the json serializable payload of each task
+
+        Returns:
+            {int} -- the number of tasks added
+        """
+        now = self._clock()
+        rows = [(sweep, shard, json.dumps(payload), PENDING, 0, now) for payload in payloads]
+        with self._lock, self._transaction():
+            self._connection.executemany("INSERT INTO tasks (sweep, shard, payload, state, attempts, available) "
+                                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def lease(self, owner: str, sweep: str, shard: int, limit: int = 1) -> list:
+        """Leases the next available tasks of a shard, which are pending, or leased under a lease
+        which has expired. A task whose lease expired on its last attempt is failed instead.
+
+        Arguments:
+            owner {str} -- identifies the worker taking the lease, such as its host and pid
+            sweep {str} -- the id of the sweep
+            shard {int} -- the shard to lease from
+            limit {int} -- optional, most tasks leased, defaults to 1
+
+        Returns:
+            {list} -- the leased Tasks, empty if none are available
+        """
+        now = self._clock()
+        with self._lock, self._transaction():
+            expired = self._connection.execute(
+                "SELECT id, owner FROM tasks WHERE sweep = ? AND shard = ? AND state = ? AND expires <= ? "
+                "AND attempts >= ?", (sweep, shard, LEASED, now, self.max_attempts)).fetchall()
+            for task_id, previous in expired:
+                logging.warning("Lease of 'task:%s' by 'owner:%s' expired on its last attempt. Failing task.",
+                                task_id, previous)
+                self._connection.execute("UPDATE tasks SET state = ?, owner = NULL, error = ? WHERE id = ?",
+                                         (FAILED, f"lease by {previous} expired", task_id))
+
+            rows = self._connection.execute(
+                "SELECT id, payload, attempts, owner FROM tasks WHERE sweep = ? AND shard = ? "
+                "AND ((state = ? AND available <= ?) OR (state = ? AND expires <= ?)) ORDER BY id LIMIT ?",
+                (sweep, shard, PENDING, now, LEASED, now, limit)).fetchall()
+            tasks = []
+            for task_id, payload, attempts, previous in rows:
+                if previous is not None:
+                    logging.warning("Lease of 'task:%s' by 'owner:%s' expired. Leasing again to 'owner:%s'.",
+                                    task_id, previous, owner)
+                self._connection.execute("UPDATE tasks SET state = ?, owner = ?, expires = ?, attempts = ? WHERE id = ?",
+                                         (LEASED, owner, now + self.lease_seconds, attempts + 1, task_id))
+                tasks.append(Task(task_id, sweep, shard, json.loads(payload), attempts + 1))
+        return tasks
+
+    def renew(self, owner: str, task_ids) -> int:
+        """Extends the leases of tasks still held by a worker.
+
+        Arguments:
+            owner {str} -- the worker holding the leases
+            task_ids {iterable} -- the ids of the tasks
+
+        Returns:
+            {int} -- the number of leases extended, fewer than given if any had expired and been taken
+        """
+        expires = self._clock() + self.lease_seconds
+        with self._lock, self._transaction():
+            return sum(self._connection.execute("UPDATE tasks SET expires = ? WHERE id = ? AND owner = ? AND state = ?",
+                                                (expires, task_id, owner, LEASED)).rowcount for task_id in task_ids)
+
+    def complete(self, owner: str, task_id: int, result) -> bool:
+        """Records the result of a leased task, and marks it done.
+
+        Arguments:
+            owner {str} -- the worker holding the lease
+            task_id {int} -- the id of the task
+            result {object} -- the json serializable result of the task
+
+        Returns:
+            {bool} -- True if recorded, False if the lease was lost to another worker and the result discarded
+        """
+        with self._lock, self._transaction():
+            updated = self._connection.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, result = ? WHERE id = ? AND owner = ? AND state = ?",
+                (DONE, json.dumps(result), task_id, owner, LEASED)).rowcount
+        if not updated:
+            logging.warning("Lost lease of 'task:%s' by 'owner:%s'. Discarding result.", task_id, owner)
+        return bool(updated)
+
+    def fail(self, owner: str, task_id: int, error: str, retry_delay: float = DEFAULT_RETRY_DELAY) -> bool:
+        """Releases a leased task which its worker could not complete, to be leased again after a delay,
+        or marks it failed if it has been attempted max_attempts times.
+
+        Arguments:
+            owner {str} -- the worker holding the lease
+            task_id {int} -- the id of the task
+            error {str} -- a description of the failure
+            retry_delay {float} -- optional, seconds before the task is leased again, defaults to DEFAULT_RETRY_DELAY
+
+        Returns:
+            {bool} -- True if the task will be retried
+        """
+        with self._lock, self._transaction():
+            row = self._connection.execute("SELECT attempts FROM tasks WHERE id = ? AND owner = ? AND state = ?",
+                                           (task_id, owner, LEASED)).fetchone()
+            if row is None:
+                return False
+            retry = row[0] < self.max_attempts
+            self._connection.execute("UPDATE tasks SET state = ?, owner = NULL, available = ?, error = ? WHERE id = ?",
+                                     (PENDING if retry else FAILED, self._clock() + retry_delay, error, task_id))
+        logging.warning("Failed 'task:%s' with 'error:%s'. %s", task_id, error, "Retrying." if retry else "Giving up.")
+        return retry
+
+    def abandon(self, sweep: str, shard: int, error: str) -> int:
+        """Marks every unfinished task of a shard failed, such as when its worker cannot be kept running.
+
+        Arguments:
+            sweep {str} -- the id of the sweep
+            shard {int} -- the shard
+            error {str} -- a description of the failure
+
+        Returns:
+            {int} -- the number of tasks failed
+        """
+        with self._lock, self._transaction():
+            return self._connection.execute("UPDATE tasks SET state = ?, owner = NULL, error = ? "
+                                            "WHERE sweep = ? AND shard = ? AND state IN (?, ?)",
+                                            (FAILED, error, sweep, shard, PENDING, LEASED)).rowcount
+
+    def counts(self, sweep: str, shard: int = None) -> dict:
+        """Returns the number of tasks of a sweep, or of one of its shards, in each state.
+
+        Arguments:
+            sweep {str} -- the id of the sweep
+            shard {int} -- optional, the shard, defaults to None for every shard
+
+        Returns:
+            {dict} -- the count of tasks in each of PENDING, LEASED, DONE and FAILED
+        """
+        query = "SELECT state, COUNT(*) FROM tasks WHERE sweep = ?"
+        arguments = (sweep,)
+        if shard is not None:
+            query += " AND shard = ?"
+            arguments += (shard,)
+        with self._lock:
+            counts = dict(self._connection.execute(query + " GROUP BY state", arguments).fetchall())
+        return {state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED)}
+
+    def unfinished(self, sweep: str, shard: int = None) -> int:
+        """Returns the number of tasks of a sweep, or of one of its shards, which are pending or leased."""
+        counts = self.counts(sweep, shard)
+        return counts[PENDING] + counts[LEASED]
+
+    def shards(self, sweep: str) -> list:
+        """Returns the shards of a sweep with unfinished tasks."""
+        with self._lock:
+            rows = self._connection.execute("SELECT DISTINCT shard FROM tasks WHERE sweep = ? AND state IN (?, ?) "
+                                            "ORDER BY shard", (sweep, PENDING, LEASED)).fetchall()
+        return [row[0] for row in rows]
+
+    def leases(self, sweep: str, expired: bool = False) -> list:
+        """Returns the (task id, shard, owner) of every task of a sweep currently leased, or with expired,
+        only of those whose lease has expired, such as those held by a worker which has hung."""
+        query = "SELECT id, shard, owner FROM tasks WHERE sweep = ? AND state = ?"
+        params = (sweep, LEASED)
+        if expired:
+            query += " AND expires <= ?"
+            params += (self._clock(),)
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    def results(self, sweep: str):
+        """Yields the (task id, shard, result) of every task of a sweep which is done.
+
+        Arguments:
+            sweep {str} -- the id of the sweep
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT id, shard, result FROM tasks WHERE sweep = ? AND state = ? "
+                                            "ORDER BY id", (sweep, DONE)).fetchall()
+        for task_id, shard, result in rows:
+            yield task_id, shard, json.loads(result)
+
+    def failures(self, sweep: str) -> list:
+        """Returns the (task id, shard, payload, error) of every task of a sweep which failed."""
+        with self._lock:
+            rows = self._connection.execute("SELECT id, shard, payload, error FROM tasks WHERE sweep = ? AND state = ? "
+                                            "ORDER BY id", (sweep, FAILED)).fetchall()
+        return [(task_id, shard, json.loads(payload), error) for task_id, shard, payload, error in rows]
+
+    def sweeps(self) -> list:
+        """Returns the ids of the sweeps with tasks in the queue, oldest first, such as those left by a stopped coordinator."""
+        with self._lock:
+            rows = self._connection.execute("SELECT sweep FROM tasks GROUP BY sweep ORDER BY MIN(id)").fetchall()
+        return [row[0] for row in rows]
+
+    def mark_submitted(self, sweep: str, ts: float):
+        """Records the time a sweep was submitted, so that a sweep resumed later is recorded against that time."""
+        with self._lock, self._transaction():
+            self._connection.execute("INSERT OR REPLACE INTO submitted (sweep, ts) VALUES (?, ?)", (sweep, ts))
+
+    def submitted(self, sweep: str) -> float:
+        """Returns the time a sweep was submitted in seconds since the epoch, None if it was not recorded."""
+        with self._lock:
+            row = self._connection.execute("SELECT ts FROM submitted WHERE sweep = ?", (sweep,)).fetchone()
+        return None if row is None else row[0]
+
+    def mark_merged(self, sweep: str):
+        """Records that the results of a sweep have been merged, so that they are not merged again before it is purged."""
+        with self._lock, self._transaction():
+            self._connection.execute("INSERT OR IGNORE INTO merged (sweep) VALUES (?)", (sweep,))
+
+    def merged(self, sweep: str) -> bool:
+        """Returns True if the results of a sweep have been marked merged."""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM merged WHERE sweep = ?", (sweep,)).fetchone() is not None
+
+    def purge(self, sweep: str) -> int:
+        """Deletes every task of a sweep, once its results have been merged.
+
+        Returns:
+            {int} -- the number of tasks deleted
+        """
+        with self._lock, self._transaction():
+            self._connection.execute("DELETE FROM merged WHERE sweep = ?", (sweep,))
+            self._connection.execute("DELETE FROM submitted WHERE sweep = ?", (sweep,))
+            return self._connection.execute("DELETE FROM tasks WHERE sweep = ?", (sweep,)).rowcount
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # An immediate transaction takes the write lock at once, rather than on the first write
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
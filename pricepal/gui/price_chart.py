@@ -0,0 +1,322 @@
+"""
+Summary:
+
+This module contains the price chart, which draws price histories of any
+length on a matplotlib axes at the cost of what is visible on screen.
+
+Each series is drawn from at most a few points per pixel column of the
+axes: the visible range of the series is split into one bucket per
+column, and the first, lowest, highest and last point of each bucket are
+kept (min/max bucketing, also known as M4), which draws the same pixels
+as the full series. When the view is zoomed or panned, the visible range
+is requeried, from memory or from the history store, and downsampled
+again for the new range.
+
+New points are appended to the artists already drawn. The lines are
+animated artists, blitted over a saved background of the axes, so an
+append which stays within the current view redraws only the lines rather
+than the whole figure.
+
+Classes:
+    PriceChart : incrementally updated, downsampled price chart over a matplotlib axes.
+
+Functions:
+    downsample_minmax() : keeps the first, lowest, highest and last point of each bucket of a series.
+    history_loader() : creates a loader querying the price history of a product from a HistoryStore.
+
+"""
+
+# Imports =============================================================
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore
+
+# Constants ===========================================================
+
+POINTS_PER_BUCKET = 4
+# Points kept from each bucket by min/max bucketing: the first, lowest, highest and last.
+
+DEFAULT_BUCKETS = 1000
+# Buckets used when the width of the axes is not yet known.
+
+VIEW_MARGIN = 0.05
+# Fraction of the extent of the series added either side of the view when it is fitted.
+
+REFRESH_APPENDED = 1.0
+# Fraction of the drawn points which may be appended raw before the view is downsampled again.
+
+# =====================================================================
+
+def downsample_minmax(x: np.ndarray, y: np.ndarray, start: float = None, end: float = None,
+                      buckets: int = DEFAULT_BUCKETS) -> tuple:
+    """Downsamples the part of a series within a range to the first, lowest, highest and
+    last point of each of a number of equal width buckets. With a bucket per pixel column,
+    the result draws the same line as the whole series. The points either side of the range
+    are kept so that the line runs to the edges of the view.
+
+    Arguments:
+        x {numpy.ndarray} -- the x values of the series, in ascending order
+        y {numpy.ndarray} -- the y values of the series, without NaN
+        start {float} -- optional, the start of the range, defaults to None for the first x
+        end {float} -- optional, the end of the range, defaults to None for the last x
+        buckets {int} -- optional, the number of buckets, defaults to DEFAULT_BUCKETS
+
+    Returns:
+        {tuple} -- (x, y) arrays of the kept points, in ascending order of x
+    """
+    low = 0 if start is None else max(int(np.searchsorted(x, start, side="left")) - 1, 0)
+    high = len(x) if end is None else min(int(np.searchsorted(x, end, side="right")) + 1, len(x))
+    x, y = x[low:high], y[low:high]
+    if len(x) <= POINTS_PER_BUCKET * buckets:
+        return x, y
+
+    # Empty buckets share their start with the next bucket, and are dropped
+    edges = np.linspace(x[0], x[-1], buckets + 1)[:-1]
+    starts = np.unique(np.searchsorted(x, edges, side="left"))
+    counts = np.diff(np.append(starts, len(x)))
+    bucket = np.repeat(np.arange(len(starts)), counts)
+
+    kept = [starts, starts + counts - 1]
+    for extreme in (np.minimum, np.maximum):
+        # The first point of each bucket holding the bucket's extreme value
+        hits = np.flatnonzero(y == extreme.reduceat(y, starts)[bucket])
+        _, first = np.unique(bucket[hits], return_index=True)
+        kept.append(hits[first])
+    index = np.unique(np.concatenate(kept))
+    return x[index], y[index]
+
+def history_loader(store: HistoryStore, product_id: int, scale: float = 0.01):
+    """Creates a loader for PriceChart which queries the price history of a product from a
+    HistoryStore, with times as matplotlib date numbers and prices in the major unit.
+
+    Arguments:
+        store {HistoryStore} -- the store holding the price history
+        product_id {int} -- the id of the product
+        scale {float} -- optional, the factor from price_cents to the plotted price, defaults to 0.01
+
+    Returns:
+        {function} -- the loader, taking the start and end of a range as date numbers, or None for no bound
+    """
+    epoch = mdates.date2num(np.datetime64("1970-01-01T00:00:00"))
+
+    def load(start: float = None, end: float = None) -> tuple:
+        bounds = [None if bound is None else int(round((bound - epoch) * 86400e9)) for bound in (start, end)]
+        rows = store.history(product_id, *bounds)
+        prices = rows["price_cents"]
+        present = prices.notna().to_numpy()
+        days = ((rows["ts"] - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+        return epoch + days[present], prices.to_numpy(dtype=np.float64, na_value=np.nan)[present] * scale
+
+    return load
+
+class _Series:
+    # The points of one line, held in arrays with spare capacity so that appends are amortized. The
+    # points of a series from a loader are only those appended since it was set, drawn after the loaded points
+    def __init__(self, line, x=None, y=None, loader=None):
+        self.line = line
+        self.loader = loader
+        self.size = 0
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.appended = 0
+        # The (left, right, bottom, top) of every point, found once and grown by appends, as for a
+        # series from a loader it is a query of the whole history
+        self.extent = None
+        if x is not None:
+            self.extend(x, y)
+
+    def extend(self, x, y):
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        present = ~np.isnan(y)
+        x, y = x[present], y[present]
+        if self.size + len(x) > len(self.x):
+            capacity = max(2 * len(self.x), self.size + len(x), 1024)
+            self.x = np.resize(self.x[:self.size], capacity)
+            self.y = np.resize(self.y[:self.size], capacity)
+        self.x[self.size:self.size + len(x)] = x
+        self.y[self.size:self.size + len(x)] = y
+        self.size += len(x)
+        if self.extent is not None and len(x):
+            left, right, bottom, top = self.extent
+            self.extent = (min(left, float(x.min())), max(right, float(x.max())),
+                           min(bottom, float(y.min())), max(top, float(y.max())))
+        return x, y
+
+    def points(self, start: float = None, end: float = None) -> tuple:
+        x, y = self.x[:self.size], self.y[:self.size]
+        if self.loader is None:
+            return x, y
+        loaded_x, loaded_y = self.loader(start, end)
+        loaded_x, loaded_y = np.asarray(loaded_x, dtype=np.float64), np.asarray(loaded_y, dtype=np.float64)
+        # Appended points are drawn until the loader returns them itself
+        tail = x > loaded_x[-1] if len(loaded_x) else slice(None)
+        return np.concatenate((loaded_x, x[tail])), np.concatenate((loaded_y, y[tail]))
+
+    def visible(self, start: float, end: float, buckets: int) -> tuple:
+        x, y = self.points(start, end)
+        return downsample_minmax(x, y, start, end, buckets)
+
+    def limits(self) -> tuple:
+        if self.extent is None:
+            x, y = self.points()
+            if len(x) == 0:
+                return None
+            self.extent = (float(np.min(x)), float(np.max(x)), float(np.min(y)), float(np.max(y)))
+        return self.extent
+
+class PriceChart:
+    """A price chart over a matplotlib axes, drawing each series downsampled to the
+    resolution of the axes, and appending new points by blitting.
+
+    Series are held either as arrays in memory, given to set_series() and grown by
+    append(), or by a loader which queries the points within a range, such as one
+    made by history_loader(). Zooming or panning the axes, with the navigation
+    toolbar or by setting its limits, requeries each series for the new view.
+    The extent of a series from a loader is queried once, when it is set, so a
+    series whose history grows outside of append() should be set again.
+
+    Methods must be called from the thread owning the canvas, the GUI thread.
+    """
+
+    def __init__(self, axes, **line_kwargs):
+        """Initializes the chart over an axes, which should not hold other lines.
+
+        Arguments:
+            axes {matplotlib.axes.Axes} -- the axes the series are drawn on
+            line_kwargs {dict} -- optional, keyword arguments given to each new line, such as linewidth
+        """
+        self.axes = axes
+        self.canvas = axes.figure.canvas
+        self.line_kwargs = line_kwargs
+        self.series = {}
+        self.redraws = 0
+        self.blits = 0
+        self._background = None
+        self._refreshing = False
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        axes.callbacks.connect("xlim_changed", self._on_xlim_changed)
+
+    @property
+    def buckets(self) -> int:
+        """{int} -- the number of buckets each series is downsampled to, one per pixel column of the axes"""
+        width = int(self.axes.bbox.width)
+        return width if width > 0 else DEFAULT_BUCKETS
+
+    def set_series(self, label: str, x=None, y=None, loader=None):
+        """Replaces, or adds, a series and fits the view to every series.
+
+        Arguments:
+            label {str} -- the label of the series, as shown in a legend
+            x {array-like} -- optional, the x values, such as matplotlib date numbers, in ascending order
+            y {array-like} -- optional, the y values, NaN values are not drawn
+            loader {function} -- optional, instead of x and y, a function of (start, end) returning (x, y)
+                                  within a range, where either bound may be None, defaults to None
+        """
+        self.remove_series(label, redraw=False)
+        line, = self.axes.plot([], [], label=label, animated=True, **self.line_kwargs)
+        self.series[label] = _Series(line, x, y, loader)
+        self.fit()
+
+    def remove_series(self, label: str, redraw: bool = True):
+        """Removes a series from the chart, if present.
+
+        Arguments:
+            label {str} -- the label of the series
+            redraw {bool} -- optional, redraw the chart, defaults to True
+        """
+        series = self.series.pop(label, None)
+        if series is not None:
+            series.line.remove()
+            if redraw:
+                self._redraw()
+
+    def append(self, label: str, x, y):
+        """Appends points to the end of a series. When the points fall within the current
+        view, they are added to the drawn line and blitted, without redrawing the figure;
+        a full redraw is only made when the y limits must grow. Points appended to a series
+        from a loader are drawn after the loaded points, until the loader returns them itself.
+
+        Arguments:
+            label {str} -- the label of the series
+            x {array-like} -- the x values of the points, after the existing points of the series
+            y {array-like} -- the y values of the points
+        """
+        series = self.series[label]
+        x, y = series.extend(x, y)
+        if len(x) == 0:
+            return
+        start, end = self.axes.get_xlim()
+        visible = (x >= start) & (x <= end)
+        if not visible.any():
+            return
+
+        bottom, top = self.axes.get_ylim()
+        drawn_x, drawn_y = series.line.get_data()
+        series.appended += int(visible.sum())
+        if y[visible].min() < bottom or y[visible].max() > top or series.appended > REFRESH_APPENDED * max(len(drawn_x), 1):
+            self._refresh()
+            self._redraw()
+            return
+        series.line.set_data(np.append(drawn_x, x[visible]), np.append(drawn_y, y[visible]))
+        self._blit()
+
+    def fit(self):
+        """Sets the view to the full extent of every series, and redraws the chart."""
+        limits = [series.limits() for series in self.series.values()]
+        limits = [limit for limit in limits if limit is not None]
+        if limits:
+            limits = np.array(limits)
+            left, right = limits[:, 0].min(), limits[:, 1].max()
+            bottom, top = limits[:, 2].min(), limits[:, 3].max()
+            # The margins leave room for appended points to be blitted without moving the view
+            x_margin = (right - left) * VIEW_MARGIN or 0.5
+            y_margin = (top - bottom) * VIEW_MARGIN or 1.0
+            self._refreshing = True
+            try:
+                self.axes.set_xlim(left - x_margin, right + x_margin)
+                self.axes.set_ylim(bottom - y_margin, top + y_margin)
+            finally:
+                self._refreshing = False
+        self._refresh()
+        self._redraw()
+
+    def _refresh(self):
+        # Requeries each series for the view, at the resolution of the axes
+        start, end = self.axes.get_xlim()
+        buckets = self.buckets
+        for series in self.series.values():
+            x, y = series.visible(start, end, buckets)
+            series.line.set_data(x, y)
+            series.appended = 0
+
+    def _redraw(self):
+        self.redraws += 1
+        self.canvas.draw_idle()
+
+    def _blit(self):
+        if self._background is None:
+            self._redraw()
+            return
+        self.blits += 1
+        self.canvas.restore_region(self._background)
+        self._draw_lines()
+        self.canvas.blit(self.axes.bbox)
+
+    def _draw_lines(self):
+        for series in self.series.values():
+            self.axes.draw_artist(series.line)
+
+    def _on_draw(self, event):
+        # The background is saved without the animated lines, which are then drawn over it
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self._draw_lines()
+
+    def _on_xlim_changed(self, axes):
+        if not self._refreshing:
+            self._refresh()
@@ -0,0 +1,285 @@
+"""
+Summary:
+
+This module contains the worker layer of the GUI, which runs scrape
+sweeps, notification sends and other blocking work on a Qt thread pool
+so the window never waits on the network.
+
+A Worker runs a function on the pool. When the function returns an
+iterator, such as the generators of the batch request functions, each
+item is streamed back to the GUI thread as a partial result. Results and
+progress are batched and sent through Qt signals at most once per
+interval, so a sweep of thousands of pages costs the event loop a few
+signals a second rather than one per page. A worker may be cancelled at
+any time; an iterating worker stops at its next item and closes the
+iterator, which cuts a batch request short without sending the
+remaining urls.
+
+The WorkerPool caps the number of workers running at once, with any
+further workers queued until a thread is free.
+
+Classes:
+    WorkerSignals : the Qt signals through which a worker reports to the GUI thread.
+    Worker : runnable carrying out a function on a thread pool, streaming the items of an iterator result.
+    WorkerPool : capped thread pool running workers, with helpers for sweeps and email sends.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import smtplib
+import threading
+import time
+
+# Third-party Libraries
+from PyQt5 import QtCore
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+import pricepal.notification.notification as notification
+from pricepal.common.extraction import ExtractionSpec
+
+# Constants ===========================================================
+
+DEFAULT_MAX_THREADS = 2
+# Workers run at once, further workers wait in the pool's queue.
+# Sweeps run their requests on threads of their own, so few workers are needed.
+
+DEFAULT_REPORT_INTERVAL = 0.1
+# Seconds between batches of partial results and progress sent to the GUI thread.
+
+# =====================================================================
+
+class WorkerSignals(QtCore.QObject):
+    """The signals of a worker. These are emitted from the worker's thread
+    and, as the object lives on the GUI thread, delivered to connected slots
+    on the GUI thread.
+
+    Signals:
+        started: the worker has begun running.
+        progress(int, int): the items completed, and the total number of items or -1 if unknown.
+        results(list): a batch of partial results, the items yielded since the last batch.
+        finished(object): the worker completed, with the return value of the function, or the item count.
+        failed(object): the worker raised the exception given.
+        cancelled: the worker stopped early after being cancelled.
+    """
+
+    started = QtCore.pyqtSignal()
+    progress = QtCore.pyqtSignal(int, int)
+    results = QtCore.pyqtSignal(list)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+
+class Worker(QtCore.QRunnable):
+    """A runnable carrying out a function on a thread pool. Exactly one of finished,
+    failed or cancelled is emitted once the worker ends.
+
+    The signals object must be created on the GUI thread, so a worker should be
+    created there, before being submitted to a WorkerPool.
+    """
+
+    def __init__(self, function, *args, total: int = None, report_interval: float = DEFAULT_REPORT_INTERVAL, **kwargs):
+        """Initializes a worker calling a function with the arguments given.
+
+        Arguments:
+            function {function} -- the function to call, if it returns an iterator each item is a partial result
+            args {tuple} -- optional, positional arguments of the function
+            total {int} -- optional, the number of items the iterator is expected to yield, defaults to None for unknown
+            report_interval {float} -- optional, seconds between batches of results, defaults to DEFAULT_REPORT_INTERVAL
+            kwargs {dict} -- optional, keyword arguments of the function
+        """
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = WorkerSignals()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.total = total
+        self.report_interval = report_interval
+        self.completed = 0
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def is_cancelled(self) -> bool:
+        """{bool} -- True once the worker has been cancelled"""
+        return self._cancelled.is_set()
+
+    @property
+    def is_done(self) -> bool:
+        """{bool} -- True once the worker has ended, by finishing, failing or being cancelled"""
+        return self._done.is_set()
+
+    def cancel(self):
+        """Asks the worker to stop. An iterating worker stops before its next item;
+        a worker blocked in a single call ends once the call returns."""
+        self._cancelled.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for the worker to end.
+
+        Arguments:
+            timeout {float} -- optional, seconds to wait, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if the worker ended within the timeout
+        """
+        return self._done.wait(timeout)
+
+    def run(self):
+        try:
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+                return
+            self.signals.started.emit()
+            result = self.function(*self.args, **self.kwargs)
+            if hasattr(result, "__next__"):
+                result = self._stream(result)
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+        except Exception as error: # pylint: disable=broad-except
+            logging.warning("Background worker running 'function:%s' failed with 'error:%r'.",
+                            getattr(self.function, "__name__", self.function), error)
+            self.signals.failed.emit(error)
+        finally:
+            self._done.set()
+
+    def _stream(self, items) -> int:
+        # Sends the items in batches, closing the iterator if cancelled
+        batch = []
+        total = -1 if self.total is None else self.total
+        reported = time.monotonic()
+        try:
+            for item in items:
+                batch.append(item)
+                self.completed += 1
+                if self.is_cancelled:
+                    break
+                if time.monotonic() - reported >= self.report_interval:
+                    self.signals.results.emit(batch)
+                    self.signals.progress.emit(self.completed, total)
+                    batch = []
+                    reported = time.monotonic()
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+        if batch:
+            self.signals.results.emit(batch)
+        self.signals.progress.emit(self.completed, total)
+        return self.completed
+
+class WorkerPool(QtCore.QObject):
+    """A thread pool running workers, at most max_threads at once. Workers beyond
+    the cap are queued, and started in order as threads become free.
+    """
+
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS, parent: QtCore.QObject = None):
+        """Initializes a pool with its own threads, separate from the global Qt thread pool.
+
+        Arguments:
+            max_threads {int} -- optional, workers run at once, defaults to DEFAULT_MAX_THREADS
+            parent {QtCore.QObject} -- optional, the Qt parent of the pool, defaults to None
+        """
+        super().__init__(parent)
+        self.thread_pool = QtCore.QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max_threads)
+        self.workers = []
+        self._pending = []
+
+    @property
+    def max_threads(self) -> int:
+        """{int} -- the number of workers run at once"""
+        return self.thread_pool.maxThreadCount()
+
+    def submit(self, worker: Worker) -> Worker:
+        """Queues a worker to run on the pool. The worker is started once control returns to
+        the event loop, so that its signals may be connected by the caller before it can emit.
+
+        Arguments:
+            worker {Worker} -- the worker to run
+
+        Returns:
+            {Worker} -- the worker, whose signals may be connected to
+        """
+        self.workers = [queued for queued in self.workers if not queued.is_done]
+        self.workers.append(worker)
+        self._pending.append(worker)
+        QtCore.QMetaObject.invokeMethod(self, "_start_pending", QtCore.Qt.QueuedConnection)
+        return worker
+
+    def run(self, function, *args, **kwargs) -> Worker:
+        """Creates a worker calling a function, as Worker, and queues it to run on the pool.
+
+        Returns:
+            {Worker} -- the worker, whose signals may be connected to
+        """
+        return self.submit(Worker(function, *args, **kwargs))
+
+    def sweep(self, urls, spec: ExtractionSpec, **kwargs) -> Worker:
+        """Queues a worker requesting a batch of urls and extracting the fields of a spec from
+        each, with request_and_extract_many. Each partial result is a (url, result) pair.
+
+        Arguments:
+            urls {iterable} -- the complete urls of the webpages to be requested
+            spec {ExtractionSpec} -- the spec describing the fields to extract
+            kwargs {dict} -- optional, keyword arguments of request_and_extract_many, such as cache and policy
+
+        Returns:
+            {Worker} -- the worker, whose signals may be connected to
+        """
+        urls = list(urls)
+        return self.run(scraper.request_and_extract_many, urls, spec, total=len(urls), **kwargs)
+
+    def send_emails(self, emails, mailer: notification.Mailer = None) -> Worker:
+        """Queues a worker sending a batch of composed emails over a mailer. Each partial
+        result is a (receiver_email, error) pair, where error is None if the email was sent.
+
+        Arguments:
+            emails {iterable} -- pairs of (email_content, receiver_email), receiver_email may be None
+            mailer {Mailer} -- optional, the mailer to send with, defaults to the default_mailer()
+
+        Returns:
+            {Worker} -- the worker, whose signals may be connected to
+        """
+        emails = list(emails)
+        return self.run(_send_each, emails, mailer, total=len(emails))
+
+    def cancel_all(self):
+        """Cancels every queued and running worker."""
+        for worker in self.workers:
+            worker.cancel()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for every worker to end.
+
+        Arguments:
+            timeout {float} -- optional, seconds to wait, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if every worker ended within the timeout
+        """
+        self._start_pending()
+        return self.thread_pool.waitForDone(-1 if timeout is None else int(timeout * 1000))
+
+    @QtCore.pyqtSlot()
+    def _start_pending(self):
+        pending, self._pending = self._pending, []
+        for worker in pending:
+            self.thread_pool.start(worker)
+
+def _send_each(emails: list, mailer: notification.Mailer):
+    # Yields as each email is sent, so that sends are reported and may be cancelled part way
+    mailer = mailer or notification.default_mailer()
+    for email_content, receiver_email in emails:
+        try:
+            mailer.send(email_content, receiver_email)
+            yield receiver_email or email_content["To"], None
+        except (smtplib.SMTPException, OSError) as error:
+            logging.warning("Failed to send email to 'to:%s', 'subject:%s' with 'error:%r'.",
+                            receiver_email or email_content["To"], email_content["Subject"], error)
+            yield receiver_email or email_content["To"], error
@@ -0,0 +1,276 @@
+"""
+Summary:
+
+This module contains the background dispatcher which takes the sending
+of notifications off the code which raises them. Alerts are placed on a
+bounded queue and returned from immediately, and a worker thread sends
+them through a Mailer, so a slow smtp server never holds up a sweep.
+
+Alerts for the same recipient raised within a coalescing window are
+collected into a single digest email, presenting one table row per
+alert, so that a large price drop sends one email per recipient rather
+than one per product. Alerts still collecting are sent when the
+dispatcher is flushed or closed.
+
+Classes:
+    Alert : a single notification for a recipient, with an optional row of data.
+    NotificationDispatcher : bounded queue and worker thread coalescing alerts into digest emails.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import queue
+import threading
+import time
+
+# Third-party Libraries
+import pandas as pd
+
+# Local Application Libraries
+import pricepal.notification.notification as notification
+
+# Constants ===========================================================
+
+DEFAULT_WINDOW = 60.0
+# Seconds alerts for a recipient are collected for before they are sent.
+
+DEFAULT_MAX_QUEUE = 10000
+# Alerts waiting on the worker before notify() blocks, or drops the alert.
+
+DEFAULT_MAX_DIGEST_ROWS = 500
+# Alerts collected for one recipient before their digest is sent early.
+
+DEFAULT_DIGEST_SUBJECT = "PricePal: {count} alerts"
+DEFAULT_DIGEST_MESSAGE = "{count} alerts were raised in the last {window:g} seconds."
+# Templates of a digest, formatted with the count of alerts and the window.
+
+# =====================================================================
+
+_STOP = object()
+
+class Alert:
+    """A single notification for a recipient. Alerts which carry a row of data are
+    presented as a table, and a digest presents each alert as one row of its table.
+    """
+
+    __slots__ = ("receiver_email", "subject", "message", "row", "raised")
+
+    def __init__(self, receiver_email, subject: str, message: str = "", row: dict = None):
+        """Initializes the alert.
+
+        Arguments:
+            receiver_email {list, str} -- destination email address(es), can be single or list of strings
+            subject {str} -- the subject bar of the alert
+            message {str} -- optional, the body of the alert, defaults to ""
+            row {dict} -- optional, mapping of column name to value presented in a table, defaults to None
+        """
+        self.receiver_email = receiver_email
+        self.subject = subject
+        self.message = message
+        self.row = row
+        self.raised = time.time()
+
+    @property
+    def recipient(self):
+        """{hashable} -- the key alerts are coalesced by"""
+        if isinstance(self.receiver_email, str):
+            return self.receiver_email
+        return tuple(self.receiver_email)
+
+class NotificationDispatcher:
+    """A bounded queue of alerts, sent by a background worker thread.
+
+    The first alert for a recipient opens a coalescing window; every alert for
+    that recipient received before the window closes is sent with it, as one
+    digest. A lone alert is sent as the email it would have been on its own.
+    Failed sends are logged and counted, and do not stop the worker.
+    """
+
+    def __init__(self, mailer: notification.Mailer = None, window: float = DEFAULT_WINDOW,
+                 max_queue: int = DEFAULT_MAX_QUEUE, max_digest_rows: int = DEFAULT_MAX_DIGEST_ROWS,
+                 digest_subject: str = DEFAULT_DIGEST_SUBJECT, digest_message: str = DEFAULT_DIGEST_MESSAGE):
+        """Initializes the dispatcher and starts its worker thread.
+
+        Arguments:
+            mailer {Mailer} -- optional, the mailer to send with, defaults to notification.default_mailer() on first send
+            window {float} -- optional, seconds alerts for a recipient are collected for, defaults to DEFAULT_WINDOW
+            max_queue {int} -- optional, alerts waiting on the worker, defaults to DEFAULT_MAX_QUEUE
+            max_digest_rows {int} -- optional, alerts which send a digest early, defaults to DEFAULT_MAX_DIGEST_ROWS
+            digest_subject {str} -- optional, template of the subject of a digest, defaults to DEFAULT_DIGEST_SUBJECT
+            digest_message {str} -- optional, template of the body of a digest, defaults to DEFAULT_DIGEST_MESSAGE
+        """
+        self.mailer = mailer
+        self.window = window
+        self.max_digest_rows = max_digest_rows
+        self.digest_subject = digest_subject
+        self.digest_message = digest_message
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        # Held while putting on the queue, so that nothing is queued behind the stop of close(). The worker
+        # never takes it, so a put blocked on a full queue is always drained
+        self._put_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def notify(self, receiver_email, subject: str, message: str = "", row: dict = None,
+               block: bool = True, timeout: float = None) -> bool:
+        """Queues an alert for sending, returning without waiting on the smtp server.
+
+        Arguments:
+            receiver_email {list, str} -- destination email address(es), can be single or list of strings
+            subject {str} -- the subject bar of the alert
+            message {str} -- optional, the body of the alert, defaults to ""
+            row {dict} -- optional, mapping of column name to value presented in a table, defaults to None
+            block {bool} -- optional, wait for space if the queue is full, defaults to True
+            timeout {float} -- optional, longest wait for space in seconds, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if the alert was queued, False if the queue was full and the alert dropped
+        """
+        return self.submit(Alert(receiver_email, subject, message, row), block, timeout)
+
+    def submit(self, alert: Alert, block: bool = True, timeout: float = None) -> bool:
+        """Queues an alert for sending, as notify().
+
+        Arguments:
+            alert {Alert} -- the alert to send
+            block {bool} -- optional, wait for space if the queue is full, defaults to True
+            timeout {float} -- optional, longest wait for space in seconds, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if the alert was queued, False if the queue was full and the alert dropped
+        """
+        try:
+            with self._put_lock:
+                if self._closed:
+                    raise RuntimeError("Cannot notify through a closed dispatcher.")
+                self._queue.put(alert, block, timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.warning("Dropped alert to 'to:%s', 'subject:%s' as the notification queue is full.",
+                            alert.receiver_email, alert.subject)
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Sends every queued and collecting alert now, without waiting for their windows to close.
+
+        Arguments:
+            timeout {float} -- optional, longest wait in seconds, defaults to None to wait indefinitely
+
+        Returns:
+            {bool} -- True if every alert queued before the call has been sent, or failed
+        """
+        flushed = threading.Event()
+        with self._put_lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put(flushed)
+        if closed:
+            # The worker sends every alert before it stops, and takes no more from the queue
+            self._worker.join(timeout)
+            return not self._worker.is_alive()
+        return flushed.wait(timeout)
+
+    def close(self, timeout: float = None):
+        """Sends every queued and collecting alert, then stops the worker thread.
+
+        Arguments:
+            timeout {float} -- optional, longest wait in seconds, defaults to None to wait indefinitely
+        """
+        with self._put_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._time_until_due())
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._send_due(force=True)
+                return
+            if isinstance(item, threading.Event):
+                self._send_due(force=True)
+                item.set()
+                continue
+            if item is not None:
+                self._collect(item)
+            self._send_due()
+
+    def _collect(self, alert: Alert):
+        _, alerts = self._pending.setdefault(alert.recipient, (time.monotonic(), []))
+        alerts.append(alert)
+        if len(alerts) >= self.max_digest_rows:
+            del self._pending[alert.recipient]
+            self._send(alerts)
+
+    def _time_until_due(self):
+        if not self._pending:
+            return None
+        opened = min(opened for opened, _ in self._pending.values())
+        return max(0.0, opened + self.window - time.monotonic())
+
+    def _send_due(self, force: bool = False):
+        now = time.monotonic()
+        for recipient, (opened, alerts) in list(self._pending.items()):
+            if force or now - opened >= self.window:
+                del self._pending[recipient]
+                self._send(alerts)
+
+    def _send(self, alerts: list):
+        try:
+            mailer = self.mailer or notification.default_mailer()
+            email_content = self._compose(alerts, mailer.sender_email)
+            mailer.send(email_content, alerts[0].receiver_email)
+        except Exception as error: # pylint: disable=broad-except
+            # Any failure, such as missing credentials, fails these alerts rather than the worker thread
+            with self._lock:
+                self.failed += len(alerts)
+            logging.warning("Failed to send 'alerts:%s' to 'to:%s' with 'error:%r'.",
+                            len(alerts), alerts[0].receiver_email, error)
+            return
+        with self._lock:
+            self.sent += 1
+        if len(alerts) > 1:
+            logging.debug("Coalesced 'alerts:%s' to 'to:%s' into one digest.", len(alerts), alerts[0].receiver_email)
+
+    def _compose(self, alerts: list, sender_email: str):
+        first = alerts[0]
+        if len(alerts) == 1:
+            if first.row is None:
+                return notification.compose_unformatted_email(first.subject, first.message, first.receiver_email,
+                                                              sender_email)
+            return notification.compose_formatted_table_email(first.subject, first.message, first.receiver_email,
+                                                              sender_email, pd.DataFrame([first.row]))
+
+        # Each alert is one row of the digest, led by its subject
+        rows = [{"alert": alert.subject, **(alert.row or {})} for alert in alerts]
+        subject = self.digest_subject.format(count=len(alerts), window=self.window)
+        message = self.digest_message.format(count=len(alerts), window=self.window)
+        return notification.compose_formatted_table_email(subject, message, first.receiver_email, sender_email,
+                                                          pd.DataFrame(rows))
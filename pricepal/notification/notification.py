@@ -6,7 +6,18 @@ This module will accept all required information for the body or
 content of a notification, and will perform actions related to the
 configuration and delivery of that content.
 
+Emails are sent through a Mailer, which loads the sender credentials once
+and keeps a single authenticated SMTP session open across many emails,
+rather than paying for a TLS handshake and login per email.
+
+Classes:
+    Mailer : a persistent, authenticated SMTP session which reconnects on failure.
+
 Functions:
+    load_credentials() : load, once, the credentials of the sending email account.
+    default_mailer() : returns the Mailer shared by the send functions of this module.
+    compose_unformatted_email() : compose a simple email with addressee, subject, and body.
+    compose_formatted_table_email() : compose an email with both a body and html formatted DataFrame.
     send_unformatted_email() : send a simple email with addressee, subject, and body.
     send_formatted_table_email() : send an email both a body and html formatted DataFrame to contain data.
 
@@ -15,10 +26,12 @@ Functions:
 # Imports =============================================================
 
 # Standard Libraries
+import atexit
 import logging
 import smtplib
 import ssl
 import json
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
@@ -26,6 +39,7 @@ from email.mime.multipart import MIMEMultipart
 import pandas as pd
 
 # Local Application Libraries
+import pricepal.common.metrics as metrics
 import pricepal.common.scrape_engine as scraper
 from pricepal.pricepal_utils import root_relative_path
 
@@ -37,116 +51,295 @@ SEND_EMAIL_CREDENTIALS = "email_credentials.json"
 # pw : <str> -- password for the sending email account
 # server : <str> -- the smtp server to be used by sending email account
 # port : <int> -- the port number to be used by sending email account
+# security : <str> -- optional, one of "ssl", "starttls" or "none", defaults to "ssl"
 
-# =====================================================================
+DEFAULT_MAX_MESSAGES_PER_SESSION = 100
+# Emails sent over one SMTP session before it is closed and a new one opened,
+# many servers refuse further mail on a session beyond a limit of their own.
 
-#TODO: consider refactoring email functions such that there is a single with overloads.
+DEFAULT_SMTP_TIMEOUT = 30
+# Seconds to wait on the connection to, and each reply from, the smtp server.
 
-def send_unformatted_email(subject: str, message: str, receiver_email: str):
-    """Sends an email with subject and body to a single or list of addressees.
+# =====================================================================
 
-    This function is dependent on a local email credentials file which contains
-    the login credentials and server information of the originating email.
-    Consult the constant within notification.py for the conventional formatting
-    of this credentials file.
+_credentials = {}
+_credentials_lock = threading.Lock()
+_default_mailer = None
+_default_mailer_lock = threading.Lock()
+
+def load_credentials(file_location: str = None) -> dict:
+    """Loads the credentials of the sending email account. Each file is read and
+    parsed once, later calls return the same credentials.
 
     Arguments:
-        subject {str} -- the subject bar of the email
-        message {str} -- the body of the email, can contain formatting elements, as well as plaintext
-        receiver_email {list, str} -- destination email address(es), can be single or list of strings
-    """
+        file_location {str} -- optional, path to the credentials file, defaults to SEND_EMAIL_CREDENTIALS beside this module
 
-    # Create a secure SSL context
-    context = ssl.create_default_context()
-    logging.debug("Created secure SSL context.")
+    Returns:
+        {dict} -- the credentials, as described by SEND_EMAIL_CREDENTIALS
+    """
 
     # Generate root of relative filepath
-    file_location = root_relative_path(SEND_EMAIL_CREDENTIALS)
+    file_location = file_location or root_relative_path(SEND_EMAIL_CREDENTIALS)
+
+    with _credentials_lock:
+        if file_location not in _credentials:
+            # Open and parse sender credentials
+            with open(file_location) as credentials_file:
+                _credentials[file_location] = json.load(credentials_file)
+            logging.debug("Loaded credentials file for outgoing email.")
+        return _credentials[file_location]
+
+class Mailer:
+    """A long-lived, authenticated session with the smtp server of the sending
+    email account, shared by every email sent through it.
+
+    The session is opened on the first email, and is replaced after
+    max_messages_per_session emails, or when the server drops it; an email
+    which fails because the session was lost is retried once on a new one.
+    A Mailer may be shared between threads, emails are sent one at a time.
+    """
 
-    # Open and parse sender credentials
-    with open(file_location) as credentials_file:
-        credentials = json.load(credentials_file)
-    logging.debug("Loaded credentials file for outgoing email.")
+    def __init__(self, credentials: dict = None, max_messages_per_session: int = DEFAULT_MAX_MESSAGES_PER_SESSION,
+                 timeout: float = DEFAULT_SMTP_TIMEOUT):
+        """Initializes the mailer, no connection is made until the first email is sent.
+
+        Arguments:
+            credentials {dict} -- optional, the credentials of the sending email account, defaults to load_credentials()
+            max_messages_per_session {int} -- optional, emails sent per session, defaults to DEFAULT_MAX_MESSAGES_PER_SESSION
+            timeout {float} -- optional, seconds to wait on the smtp server, defaults to DEFAULT_SMTP_TIMEOUT
+        """
+
+        # Populate credentials for originating email account and server
+        credentials = credentials if credentials is not None else load_credentials()
+        self.sender_email = credentials["email"]
+        self._password = credentials.get("pw")
+        self.server = credentials["server"]
+        self.port = credentials["port"]
+        self.security = credentials.get("security", "ssl")
+        if self.security not in ("ssl", "starttls", "none"):
+            raise ValueError(f"Unknown email security '{self.security}'.")
+
+        self.max_messages_per_session = max_messages_per_session
+        self.timeout = timeout
+        self.sessions = 0
+        self.sent = 0
+
+        # Create a secure SSL context, once for every session
+        self._context = ssl.create_default_context() if self.security != "none" else None
+        self._session = None
+        self._session_messages = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, email_content: MIMEMultipart, receiver_email=None):
+        """Sends a composed email over the session, opening a new session if required.
+
+        Arguments:
+            email_content {MIMEMultipart} -- the composed email
+            receiver_email {list, str} -- optional, destination email address(es), defaults to the To header of the email
+
+        Raises:
+            smtplib.SMTPException -- if the email is refused, or cannot be sent after reconnecting
+        """
+        with self._lock:
+            self._send(email_content, receiver_email)
+
+    def send_many(self, emails) -> int:
+        """Sends a batch of composed emails over the session. An email which is refused
+        is logged and skipped, the remainder of the batch is still sent.
+
+        Arguments:
+            emails {iterable} -- pairs of (email_content, receiver_email), receiver_email may be None
+                                 to use the To header of the email
+
+        Returns:
+            {int} -- the number of emails sent
+        """
+        sent = 0
+        with self._lock:
+            for email_content, receiver_email in emails:
+                try:
+                    self._send(email_content, receiver_email)
+                    sent += 1
+                except (smtplib.SMTPException, OSError) as error:
+                    logging.warning("Failed to send email to 'to:%s', 'subject:%s' with 'error:%r'.",
+                                    receiver_email or email_content["To"], email_content["Subject"], error)
+        return sent
+
+    def close(self):
+        """Closes the session, a later email opens a new one."""
+        with self._lock:
+            self._close()
+
+    def _send(self, email_content: MIMEMultipart, receiver_email):
+        with metrics.timer("notify", host=self.server):
+            if receiver_email is None:
+                receiver_email = [address.strip() for address in email_content["To"].split(",")]
+
+            for attempt in range(2):
+                try:
+                    session = self._open()
+                    session.sendmail(self.sender_email, receiver_email, email_content.as_string())
+                    break
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError) as error:
+                    lost = error
+                except smtplib.SMTPResponseException as error:
+                    # 421 is the server closing the session, any other refusal is not retried
+                    if error.smtp_code != 421:
+                        raise
+                    lost = error
+                self._close()
+                if attempt:
+                    raise lost
+                logging.debug("Lost SMTP session to 'server:%s' with 'error:%r', reconnecting.", self.server, lost)
+
+            self._session_messages += 1
+            self.sent += 1
+            logging.info("Sent email to 'to:%s', 'subject:%s'.", receiver_email, email_content["Subject"])
+
+    def _open(self) -> smtplib.SMTP:
+        if self._session is not None and self._session_messages >= self.max_messages_per_session:
+            self._close()
+        if self._session is not None:
+            return self._session
+
+        if self.security == "ssl":
+            session = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout, context=self._context)
+        else:
+            session = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.security == "starttls":
+                session.starttls(context=self._context)
+            if self._password:
+                session.login(self.sender_email, self._password)
+        except BaseException:
+            session.close()
+            raise
+
+        self._session = session
+        self._session_messages = 0
+        self.sessions += 1
+        logging.debug("Opened SMTP session to 'server:%s', 'port:%s'.", self.server, self.port)
+        return session
+
+    def _close(self):
+        if self._session is None:
+            return
+        try:
+            self._session.quit()
+        except (smtplib.SMTPException, OSError):
+            self._session.close()
+        self._session = None
+        logging.debug("Closed SMTP session to 'server:%s' after 'emails:%s'.", self.server, self._session_messages)
+
+def default_mailer() -> Mailer:
+    """Returns the Mailer shared by the send functions of this module, created from
+    the credentials file on first use and closed when the interpreter exits.
+
+    Returns:
+        {Mailer} -- the shared mailer
+    """
+    global _default_mailer # pylint: disable=global-statement
+    with _default_mailer_lock:
+        if _default_mailer is None:
+            _default_mailer = Mailer(load_credentials())
+            atexit.register(_default_mailer.close)
+        return _default_mailer
 
-    # Populate credentials for originating email account and server
-    sender_email = credentials["email"]
-    password = credentials["pw"]
-    sender_email_server = credentials["server"]
-    sender_email_port = credentials["port"]
+def compose_unformatted_email(subject: str, message: str, receiver_email, sender_email: str) -> MIMEMultipart:
+    """Composes an email with subject and body to a single or list of addressees.
 
-    # Compose email
-    email_content = MIMEMultipart()
-    email_content["To"] = receiver_email
-    email_content["From"] = sender_email
-    email_content["Subject"] = subject
+    Arguments:
+        subject {str} -- the subject bar of the email
+        message {str} -- the body of the email, can contain formatting elements, as well as plaintext
+        receiver_email {list, str} -- destination email address(es), can be single or list of strings
+        sender_email {str} -- the originating email address
+
+    Returns:
+        {MIMEMultipart} -- the composed email
+    """
+    email_content = _compose(subject, receiver_email, sender_email)
     email_content.attach(MIMEText(message, "plain"))
 
-    # Split email to name and address for compatibility with logging, log the name of recipient
     logging.debug("Composed unformatted email to 'to:%s', 'subject:%s'.",
                   receiver_email, subject)
+    return email_content
 
-    # Send email
-    with smtplib.SMTP_SSL(sender_email_server, sender_email_port, context=context) as server:
-        server.login(sender_email, password)
-        server.sendmail(sender_email, receiver_email, email_content.as_string())
-
-    logging.info("Sent unformatted email to 'to:%s', 'subject:%s'.",
-                 receiver_email, subject)
-
-def send_formatted_table_email(subject: str, message: str, receiver_email: str, data_table: pd.DataFrame):
-    """Sends an email with subject, body and formatted data table to a single or list of addressees.
-    This can be used to present a table of data (stock, price, otherwise) as well as preceeding paragraph.
-
-    This function is dependent on a local email credentials file which contains
-    the login credentials and server information of the originating email.
-    Consult the constant within notification.py for the conventional formatting
-    of this credentials file.
+def compose_formatted_table_email(subject: str, message: str, receiver_email, sender_email: str,
+                                  data_table: pd.DataFrame) -> MIMEMultipart:
+    """Composes an email with subject, body and formatted data table to a single or list of addressees.
 
     Arguments:
         subject {str} -- the subject bar of the email
         message {str} -- the body of the email, can contain formatting elements, as well as plaintext
         receiver_email {list, str} -- destination email address(es), can be single or list of strings
+        sender_email {str} -- the originating email address
         data_table {pandas.DataFrame} -- data table of data to present, will include row and column headers
-    """
 
-    # Create a secure SSL context
-    context = ssl.create_default_context()
-    logging.debug("Created secure SSL context.")
+    Returns:
+        {MIMEMultipart} -- the composed email
+    """
+    email_content = _compose(subject, receiver_email, sender_email)
 
-    # Generate root of relative filepath
-    file_location = root_relative_path(SEND_EMAIL_CREDENTIALS)
+    # Add email message at start of the body
+    email_content.attach(MIMEText(message+"\n\n", "plain"))
 
-    # Open and parse sender credentials
-    with open(file_location) as credentials_file:
-        credentials = json.load(credentials_file)
-    logging.debug("Loaded credentials file for outgoing email.")
+    txt_data_table = scraper.tabulate_dataframe(data_table, "html")
+    email_content.attach(MIMEText(txt_data_table, "html"))
 
-    # Populate credentials for originating email account and server
-    sender_email = credentials["email"]
-    password = credentials["pw"]
-    sender_email_server = credentials["server"]
-    sender_email_port = credentials["port"]
+    logging.debug("Composed formatted table email to 'to:%s', 'subject:%s'.",
+                  receiver_email, subject)
+    return email_content
 
-    # Compose email
+def _compose(subject: str, receiver_email, sender_email: str) -> MIMEMultipart:
     email_content = MIMEMultipart()
-    email_content["To"] = receiver_email
+    email_content["To"] = receiver_email if isinstance(receiver_email, str) else ", ".join(receiver_email)
     email_content["From"] = sender_email
     email_content["Subject"] = subject
+    return email_content
 
-    # Add email message at start of the body
-    email_content.attach(MIMEText(message+"\n\n", "plain"))
+#TODO: consider refactoring email functions such that there is a single with overloads.
 
-    txt_data_table = scraper.tabulate_dataframe(data_table, "html")
-    email_content.attach(MIMEText(txt_data_table, "html"))
+def send_unformatted_email(subject: str, message: str, receiver_email: str, mailer: Mailer = None):
+    """Sends an email with subject and body to a single or list of addressees.
 
-    # Split email to name and address for compatibility with logging, log the name of recipient
-    logging.debug("Composed formatted table email to 'to:%s', 'subject:%s'.",
-                  receiver_email, subject)
+    Unless a mailer is supplied, this function is dependent on a local email
+    credentials file which contains the login credentials and server information
+    of the originating email. Consult the constant within notification.py for
+    the conventional formatting of this credentials file.
 
-    # Send email
-    with smtplib.SMTP_SSL(sender_email_server, sender_email_port, context=context) as server:
-        server.login(sender_email, password)
-        server.sendmail(sender_email, receiver_email, email_content.as_string())
+    Arguments:
+        subject {str} -- the subject bar of the email
+        message {str} -- the body of the email, can contain formatting elements, as well as plaintext
+        receiver_email {list, str} -- destination email address(es), can be single or list of strings
+        mailer {Mailer} -- optional, the mailer to send the email with, defaults to default_mailer()
+    """
+    mailer = mailer or default_mailer()
+    email_content = compose_unformatted_email(subject, message, receiver_email, mailer.sender_email)
+    mailer.send(email_content, receiver_email)
+
+def send_formatted_table_email(subject: str, message: str, receiver_email: str, data_table: pd.DataFrame,
+                               mailer: Mailer = None):
+    """Sends an email with subject, body and formatted data table to a single or list of addressees.
+    This can be used to present a table of data (stock, price, otherwise) as well as preceeding paragraph.
 
-    logging.info("Sent formatted table email to 'to:%s', 'subject:%s'.",
-                 receiver_email, subject)
+    Unless a mailer is supplied, this function is dependent on a local email
+    credentials file which contains the login credentials and server information
+    of the originating email. Consult the constant within notification.py for
+    the conventional formatting of this credentials file.
+
+    Arguments:
+        subject {str} -- the subject bar of the email
+        message {str} -- the body of the email, can contain formatting elements, as well as plaintext
+        receiver_email {list, str} -- destination email address(es), can be single or list of strings
+        data_table {pandas.DataFrame} -- data table of data to present, will include row and column headers
+        mailer {Mailer} -- optional, the mailer to send the email with, defaults to default_mailer()
+    """
+    mailer = mailer or default_mailer()
+    email_content = compose_formatted_table_email(subject, message, receiver_email, mailer.sender_email, data_table)
+    mailer.send(email_content, receiver_email)
@@ -0,0 +1,312 @@
+"""
+Summary:
+
+This module contains the alert rule engine, which decides which alerts a
+sweep raises. Every rule watches one product for one kind of event:
+    - price_below : the price falls below a threshold, in cents,
+    - drop_pct : the price drops by at least a percentage since the last sweep,
+    - back_in_stock : the product returns to stock after being out of stock,
+    - all_time_low : the price falls below the lowest price seen before.
+
+Rules are held as a table sorted by product, and the engine keeps the
+last price, stock and lowest price of each product it has seen. Each
+sweep is evaluated in one vectorized pass: the snapshot is joined to the
+product state and to the rules of its products with sorted array
+searches, and every rule kind is tested over the whole join at once.
+By default only products whose price or stock changed are evaluated.
+
+Price rules are edge triggered, so a rule fires on the sweep which
+crosses its condition and not again on every sweep after it.
+
+Classes:
+    RuleEngine : table of alert rules evaluated against price snapshots.
+
+Functions:
+    notify_alerts() : queue the alerts raised by a RuleEngine on a NotificationDispatcher.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import threading
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import MISSING_PRICE, UNKNOWN_STOCK
+
+# Constants ===========================================================
+
+RULE_KINDS = ("price_below", "drop_pct", "back_in_stock", "all_time_low")
+# The kinds of rule, a rule's kind is stored as its position in this tuple.
+
+PRICE_BELOW, DROP_PCT, BACK_IN_STOCK, ALL_TIME_LOW = range(len(RULE_KINDS))
+
+ALERT_SUBJECTS = {"price_below": "Product {product_id} is below {threshold_price}",
+                  "drop_pct": "Product {product_id} dropped {threshold:g}% or more",
+                  "back_in_stock": "Product {product_id} is back in stock",
+                  "all_time_low": "Product {product_id} is at an all time low"}
+# Subjects of the alert raised by each kind of rule.
+
+ALERT_COLUMNS = ("rule_id", "product_id", "kind", "threshold", "receiver_email",
+                 "price_cents", "previous_cents", "low_cents", "stock", "previous_stock")
+# Columns of the table of alerts returned by RuleEngine.evaluate().
+
+# =====================================================================
+
+def _price_column(values) -> np.ndarray:
+    # Prices are held as int64 with missing prices as MISSING_PRICE
+    return pd.array(values, dtype="Int64").to_numpy(dtype=np.int64, na_value=MISSING_PRICE)
+
+def _stock_column(values) -> np.ndarray:
+    return pd.array(values, dtype="Int32").to_numpy(dtype=np.int32, na_value=UNKNOWN_STOCK)
+
+class RuleEngine:
+    """A table of alert rules, and the state of each product they watch.
+
+    Rules are supplied as a DataFrame with the columns:
+        rule_id {int} -- unique id of the rule
+        product_id {int} -- id of the product watched
+        kind {str} -- one of RULE_KINDS
+        threshold {float} -- price in cents for price_below, percentage for drop_pct, unused otherwise
+        receiver_email {str} -- destination email address of the alert
+
+    Snapshots are supplied as a DataFrame with one row per product and the columns
+    product_id, price_cents and stock, as returned by HistoryStore.latest().
+    A stock of 0 is out of stock, and a positive stock is in stock.
+    """
+
+    def __init__(self, rules: pd.DataFrame = None):
+        """Initializes the engine with no product state.
+
+        Arguments:
+            rules {pandas.DataFrame} -- optional, the rules to evaluate, defaults to None for no rules
+        """
+        self._lock = threading.Lock()
+        self._rules = self._empty_rules()
+        self._sorted = None
+        self._state_ids = np.empty(0, dtype=np.int64)
+        self._state_price = np.empty(0, dtype=np.int64)
+        self._state_stock = np.empty(0, dtype=np.int32)
+        self._state_low = np.empty(0, dtype=np.int64)
+        if rules is not None:
+            self.add_rules(rules)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    @property
+    def rules(self) -> pd.DataFrame:
+        """{pandas.DataFrame} -- a copy of the rules, with kinds as their names"""
+        rules = self._rules.copy()
+        rules["kind"] = pd.Categorical.from_codes(rules["kind"], RULE_KINDS)
+        return rules
+
+    def add_rules(self, rules: pd.DataFrame):
+        """Adds rules to the engine, replacing any existing rules with the same ids.
+
+        Arguments:
+            rules {pandas.DataFrame} -- the rules to add
+
+        Raises:
+            ValueError -- if a rule has an unknown kind, or a price rule has no threshold
+        """
+        known_kinds = np.isin(np.asarray(rules["kind"], dtype=object), RULE_KINDS)
+        if not known_kinds.all():
+            unknown = sorted(set(np.asarray(rules["kind"], dtype=object)[~known_kinds]))
+            raise ValueError(f"Unknown rule kinds {unknown}, expected one of {RULE_KINDS}.")
+        kinds = pd.Categorical(rules["kind"], categories=RULE_KINDS)
+        threshold = (np.asarray(rules["threshold"], dtype=np.float64) if "threshold" in rules
+                     else np.full(len(rules), np.nan))
+        needs_threshold = np.isin(kinds.codes, (PRICE_BELOW, DROP_PCT))
+        if np.isnan(threshold[needs_threshold]).any():
+            raise ValueError("Rules of kind price_below and drop_pct require a threshold.")
+
+        added = pd.DataFrame({"rule_id": np.asarray(rules["rule_id"], dtype=np.int64),
+                              "product_id": np.asarray(rules["product_id"], dtype=np.int64),
+                              "kind": kinds.codes.astype(np.int8),
+                              "threshold": threshold,
+                              "receiver_email": np.asarray(rules["receiver_email"], dtype=object)})
+        with self._lock:
+            kept = self._rules[~self._rules["rule_id"].isin(added["rule_id"])]
+            combined = pd.concat([kept, added], ignore_index=True) if len(kept) else added
+            self._rules = combined.drop_duplicates("rule_id", keep="last", ignore_index=True)
+            self._sorted = None
+        logging.debug("Added 'rules:%s' to rule engine.", len(added))
+
+    def remove_rules(self, rule_ids):
+        """Removes rules from the engine.
+
+        Arguments:
+            rule_ids {iterable} -- the ids of the rules to remove
+        """
+        with self._lock:
+            self._rules = self._rules[~self._rules["rule_id"].isin(list(rule_ids))].reset_index(drop=True)
+            self._sorted = None
+
+    def prime(self, history: pd.DataFrame):
+        """Sets the state of products from their price history, without raising alerts,
+        so that the first evaluated sweep is compared against the last known prices.
+
+        Arguments:
+            history {pandas.DataFrame} -- rows of product_id, price_cents and stock, ordered by
+                                          product id and then time, as returned by HistoryStore.between()
+        """
+        ids = np.asarray(history["product_id"], dtype=np.int64)
+        price = _price_column(history["price_cents"])
+        stock = _stock_column(history["stock"])
+        with self._lock:
+            self._merge_state(ids, price, stock)
+
+    def evaluate(self, snapshot: pd.DataFrame, changed_only: bool = True) -> pd.DataFrame:
+        """Evaluates every rule against a snapshot of the latest prices, raising the alerts
+        of rules whose condition the snapshot crosses, then records the snapshot as the
+        state of its products.
+
+        Arguments:
+            snapshot {pandas.DataFrame} -- one row per product of product_id, price_cents and stock
+            changed_only {bool} -- optional, evaluate only products whose price or stock changed, defaults to True
+
+        Returns:
+            {pandas.DataFrame} -- one row per alert, with the columns of ALERT_COLUMNS
+        """
+        ids = np.asarray(snapshot["product_id"], dtype=np.int64)
+        price = _price_column(snapshot["price_cents"])
+        stock = _stock_column(snapshot["stock"])
+
+        with self._lock:
+            prev_price, prev_stock, low = self._lookup_state(ids)
+            if changed_only:
+                changed = (price != prev_price) | (stock != prev_stock)
+                ids, price, stock = ids[changed], price[changed], stock[changed]
+                prev_price, prev_stock, low = prev_price[changed], prev_stock[changed], low[changed]
+
+            rule_index, product_index = self._join_rules(ids)
+            rules = self._sorted
+            kind = rules["kind"][rule_index]
+            threshold = rules["threshold"][rule_index]
+            now, before, lowest = price[product_index], prev_price[product_index], low[product_index]
+            in_stock, before_stock = stock[product_index], prev_stock[product_index]
+
+            priced, was_priced = now != MISSING_PRICE, before != MISSING_PRICE
+            fired = (kind == PRICE_BELOW) & priced & (now < threshold) & (~was_priced | (before >= threshold))
+            fired |= ((kind == DROP_PCT) & priced & was_priced & (before > 0) &
+                      (now <= before * (1.0 - threshold / 100.0)) & (now < before))
+            fired |= (kind == BACK_IN_STOCK) & (in_stock > 0) & (before_stock == 0)
+            fired |= (kind == ALL_TIME_LOW) & priced & (lowest != MISSING_PRICE) & (now < lowest)
+
+            self._merge_state(ids, price, stock)
+
+        rule_index, product_index = rule_index[fired], product_index[fired]
+        alerts = pd.DataFrame({"rule_id": rules["rule_id"][rule_index],
+                               "product_id": ids[product_index],
+                               "kind": pd.Categorical.from_codes(rules["kind"][rule_index], RULE_KINDS),
+                               "threshold": rules["threshold"][rule_index],
+                               "receiver_email": rules["receiver_email"][rule_index],
+                               "price_cents": price[product_index],
+                               "previous_cents": pd.arrays.IntegerArray(before[fired], ~was_priced[fired]),
+                               "low_cents": pd.arrays.IntegerArray(lowest[fired], lowest[fired] == MISSING_PRICE),
+                               "stock": stock[product_index],
+                               "previous_stock": prev_stock[product_index]})
+        logging.debug("Evaluated 'rules:%s' over 'products:%s', raising 'alerts:%s'.",
+                      len(fired), len(ids), len(alerts))
+        return alerts
+
+    @staticmethod
+    def _empty_rules() -> pd.DataFrame:
+        return pd.DataFrame({"rule_id": np.empty(0, dtype=np.int64), "product_id": np.empty(0, dtype=np.int64),
+                             "kind": np.empty(0, dtype=np.int8), "threshold": np.empty(0, dtype=np.float64),
+                             "receiver_email": np.empty(0, dtype=object)})
+
+    def _join_rules(self, ids: np.ndarray):
+        # Returns, for every rule of the given products, its position in the sorted
+        # rules and the position of its product in ids
+        if self._sorted is None:
+            ordered = self._rules.sort_values("product_id", kind="stable")
+            self._sorted = {name: ordered[name].to_numpy() for name in ordered.columns}
+        products = self._sorted["product_id"]
+        first = np.searchsorted(products, ids, side="left")
+        counts = np.searchsorted(products, ids, side="right") - first
+        product_index = np.repeat(np.arange(len(ids)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(first, counts) + offsets, product_index
+
+    def _lookup_state(self, ids: np.ndarray):
+        # Returns the last price, last stock and lowest price of each product, missing if unseen
+        count = len(self._state_ids)
+        if not count:
+            return (np.full(len(ids), MISSING_PRICE, dtype=np.int64), np.full(len(ids), UNKNOWN_STOCK, dtype=np.int32),
+                    np.full(len(ids), MISSING_PRICE, dtype=np.int64))
+        positions = np.minimum(np.searchsorted(self._state_ids, ids), count - 1)
+        known = self._state_ids[positions] == ids
+        return (np.where(known, self._state_price[positions], MISSING_PRICE),
+                np.where(known, self._state_stock[positions], UNKNOWN_STOCK).astype(np.int32),
+                np.where(known, self._state_low[positions], MISSING_PRICE))
+
+    def _merge_state(self, ids: np.ndarray, price: np.ndarray, stock: np.ndarray):
+        # Reduces the rows to the last price, last stock and lowest price of each product,
+        # ignoring missing values, then folds them into the sorted state arrays
+        if not len(ids):
+            return
+        order = np.argsort(ids, kind="stable")
+        ids, price, stock = ids[order], price[order], stock[order]
+        unique, starts = np.unique(ids, return_index=True)
+        last_price = self._last_known(price, starts, MISSING_PRICE)
+        last_stock = self._last_known(stock, starts, UNKNOWN_STOCK)
+        low = np.minimum.reduceat(np.where(price == MISSING_PRICE, np.iinfo(np.int64).max, price), starts)
+        low[low == np.iinfo(np.int64).max] = MISSING_PRICE
+
+        prev_price, prev_stock, prev_low = self._lookup_state(unique)
+        last_price = np.where(last_price == MISSING_PRICE, prev_price, last_price)
+        last_stock = np.where(last_stock == UNKNOWN_STOCK, prev_stock, last_stock).astype(np.int32)
+        low = np.where(prev_low == MISSING_PRICE, low,
+                       np.where(low == MISSING_PRICE, prev_low, np.minimum(low, prev_low)))
+
+        positions = np.minimum(np.searchsorted(self._state_ids, unique), max(len(self._state_ids) - 1, 0))
+        known = (self._state_ids[positions] == unique) if len(self._state_ids) else np.zeros(len(unique), dtype=bool)
+        self._state_price[positions[known]] = last_price[known]
+        self._state_stock[positions[known]] = last_stock[known]
+        self._state_low[positions[known]] = low[known]
+
+        if not known.all():
+            new = ~known
+            state_ids = np.concatenate([self._state_ids, unique[new]])
+            order = np.argsort(state_ids, kind="stable")
+            self._state_ids = state_ids[order]
+            self._state_price = np.concatenate([self._state_price, last_price[new]])[order]
+            self._state_stock = np.concatenate([self._state_stock, last_stock[new]])[order]
+            self._state_low = np.concatenate([self._state_low, low[new]])[order]
+
+    @staticmethod
+    def _last_known(values: np.ndarray, starts: np.ndarray, missing) -> np.ndarray:
+        # The last value of each run which is not missing, or missing if there is none
+        positions = np.where(values != missing, np.arange(len(values)), -1)
+        last = np.maximum.reduceat(positions, starts)
+        return np.where(last >= 0, values[np.maximum(last, 0)], missing)
+
+def notify_alerts(alerts: pd.DataFrame, dispatcher) -> int:
+    """Queues the alerts raised by a RuleEngine on a NotificationDispatcher, one alert per row,
+    presenting the product, its price and the rule which fired as a row of data.
+
+    Arguments:
+        alerts {pandas.DataFrame} -- the alerts returned by RuleEngine.evaluate()
+        dispatcher {NotificationDispatcher} -- the dispatcher to queue the alerts on
+
+    Returns:
+        {int} -- the number of alerts queued
+    """
+    queued = 0
+    for alert in alerts.itertuples(index=False):
+        price = f"${alert.price_cents / 100:,.2f}" if alert.price_cents != MISSING_PRICE else ""
+        previous = f"${alert.previous_cents / 100:,.2f}" if not pd.isna(alert.previous_cents) else ""
+        threshold_price = f"${alert.threshold / 100:,.2f}" if alert.kind == "price_below" else ""
+        subject = ALERT_SUBJECTS[alert.kind].format(product_id=alert.product_id, threshold=alert.threshold,
+                                                    threshold_price=threshold_price)
+        row = {"product": alert.product_id, "rule": alert.kind, "price": price, "previous": previous,
+               "stock": alert.stock}
+        queued += dispatcher.notify(alert.receiver_email, subject, row=row)
+    return queued
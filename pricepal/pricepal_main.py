@@ -4,7 +4,6 @@
 import os
 import sys
 import logging
-from logging.handlers import RotatingFileHandler
 
 # Third-party Libraries
 from PyQt5 import uic, QtWidgets
@@ -13,8 +12,11 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
 # Local Application Libraries
-import pricepal_utils as utils
-from common.status_logger import QTextEditLogger
+import pricepal.pricepal_utils as utils
+from pricepal.common.log_pipeline import DEFAULT_LOG_DIR, init_logging
+from pricepal.common.status_logger import QTextEditLogger
+from pricepal.gui.price_chart import PriceChart
+from pricepal.gui.workers import WorkerPool
 
 # =====================================================================
 
@@ -29,24 +31,21 @@ class PricePalMainWindow(QtWidgets.QMainWindow):
         self.plotwindow = MplWidget(self.groupBox_Graph)
 
         # Add the status logging textbox to the statusbar
-        logging.getLogger().setLevel(logging.DEBUG)
         self.log_status_box = QTextEditLogger(self.statusbar)
         self.log_status_box.setFormatter(
             logging.Formatter(
                 '%(asctime)s | %(levelname)s | %(module)s | %(message)s'
             )
         )
-        logging.getLogger().addHandler(self.log_status_box)
 
         # Add a rolling log file for storing more verbose logs
         # Will create a new file when near to the specified maximum, keeping up to backupCount number of copies
-        self.rotating_log_file = RotatingFileHandler('data/logs/pricepal-log.log', maxBytes=100000, backupCount=9)
-        self.rotating_log_file.setFormatter(
-            logging.Formatter(
-                '%(asctime)s | %(levelname)s | Module: %(module)s | Function: %(funcName)s | %(message)s'
-            )
-        )
-        logging.getLogger().addHandler(self.rotating_log_file)
+        # Both are written from the log pipeline's listener thread, so logging at DEBUG does no I/O on the caller
+        self.log_pipeline = init_logging(os.path.join(DEFAULT_LOG_DIR, 'pricepal-log.log'),
+                                         handlers=[self.log_status_box])
+
+        # Sweeps and email sends are run on the worker pool, off the GUI thread
+        self.workers = WorkerPool(parent=self)
 
         logging.info('')
         logging.info('Start to application session.')
@@ -56,6 +55,13 @@ class PricePalMainWindow(QtWidgets.QMainWindow):
 
         logging.info('Application main window launched.')
 
+    def closeEvent(self, event):
+        # Stop background work, then write any queued records while the status bar log box still exists
+        self.workers.cancel_all()
+        self.workers.wait(5)
+        self.log_pipeline.stop()
+        super(PricePalMainWindow, self).closeEvent(event)
+
 class MplWidget(QtWidgets.QWidget):
     def __init__(self, group_box: QtWidgets.QGroupBox, parent=None):
         QtWidgets.QWidget.__init__(self, parent)
@@ -72,6 +78,9 @@ class MplWidget(QtWidgets.QWidget):
         self.canvas.tight_layout = True
         group_box.setLayout(vertical_layout)
 
+        # Price histories are drawn through the chart, which downsamples them to the width of the axes
+        self.chart = PriceChart(self.canvas.axes)
+
 
 def main():
     autograph_app = QtWidgets.QApplication(sys.argv)
@@ -0,0 +1,328 @@
+"""
+Summary:
+
+This module contains local stand-ins for the external services that
+PricePal talks to. These are used by the unit tests and the benchmark
+scripts so that neither depends on the live internet.
+Each stand-in runs on the loopback interface in a background thread
+and is intended to be used as a context manager.
+
+Classes:
+    FixtureHTTPServer : serves fixture pages with configurable latency and status codes.
+    SMTPSink : accepts and records email over plain SMTP, with optional authentication.
+
+Functions:
+    make_product_page() : builds the html of a synthetic product page for use as a fixture.
+
+"""
+
+# Imports =============================================================
+
+# Standard Libraries
+import base64
+import hashlib
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =====================================================================
+
+def make_product_page(price: str = "$19.99", stock: str = "5+", padding_bytes: int = 0) -> bytes:
+    """Builds the html of a synthetic retailer product page. The price
+    and stock fields sit near the top of the body, followed by an optional
+    block of filler markup to reach a realistic page size.
+
+    Arguments:
+        price {str} -- optional, the raw price string to place in the page, defaults to "$19.99"
+        stock {str} -- optional, the raw stock string to place in the page, defaults to "5+"
+        padding_bytes {int} -- optional, approximate size of filler markup to append, defaults to 0
+
+    Returns:
+        {bytes} -- the encoded html of the page
+    """
+
+    filler_row = '<li class="related"><a href="/p/related">Related product</a><span>$9.99</span></li>\n'
+    filler = filler_row * (padding_bytes // len(filler_row))
+    page = ('<html><head><title>Product</title></head><body>\n'
+            '<div id="product"><h1 class="title">Product</h1>\n'
+            f'<span class="price" itemprop="price">{price}</span>\n'
+            f'<span class="stock" data-stock="{stock}">{stock}</span>\n'
+            '</div>\n'
+            f'<ul id="related">\n{filler}</ul>\n'
+            '</body></html>\n')
+    return page.encode("utf-8")
+
+class FixtureHTTPServer:
+    """A local HTTP/1.1 server which serves fixture pages from memory.
+    Each response can be delayed to emulate the round-trip latency of a
+    remote retailer, and individual paths can be forced to respond with
+    a given status code and headers.
+
+    The server records the number of accepted connections and the peak
+    number of concurrently handled requests so that tests can verify
+    connection reuse and concurrency limits.
+    """
+
+    def __init__(self, pages: dict = None, latency: float = 0.0, default_page: bytes = None, validators: bool = False):
+        """Initializes the server on an ephemeral loopback port, it is not started
+        until start() is called or the context manager is entered.
+
+        Arguments:
+            pages {dict} -- optional, mapping of path to page bytes, defaults to an empty mapping
+            latency {float} -- optional, delay in seconds applied before every response, defaults to 0.0
+            default_page {bytes} -- optional, page served for unknown paths, unknown paths return 404 if not supplied
+            validators {bool} -- optional, send ETag headers and honour If-None-Match with a 304, defaults to False
+        """
+        self.pages = dict(pages or {})
+        self.latency = latency
+        self.default_page = default_page
+        self.validators = validators
+        self.statuses = {}
+        self.requests = []
+        self.connections = 0
+        self.peak_concurrency = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """{str} -- the root url of the running server, without a trailing slash"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        """Returns the complete url for a path served by this server.
+
+        Arguments:
+            path {str} -- the path of the page, with or without a leading slash
+
+        Returns:
+            {str} -- the complete url of the page
+        """
+        return self.base_url + "/" + path.lstrip("/")
+
+    def set_status(self, path: str, status: int, headers: dict = None, times: int = None):
+        """Forces a path to respond with the given status code and headers.
+
+        Arguments:
+            path {str} -- the path to override, with a leading slash
+            status {int} -- the status code to respond with
+            headers {dict} -- optional, extra response headers, defaults to None
+            times {int} -- optional, number of responses to override before reverting, defaults to None for always
+        """
+        self.statuses[path] = [status, dict(headers or {}), times]
+
+    def start(self):
+        """Starts serving on a background daemon thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server and releases its socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_override(self, path: str):
+        with self._lock:
+            override = self.statuses.get(path)
+            if override is None:
+                return None
+            status, headers, times = override
+            if times is not None:
+                if times <= 0:
+                    return None
+                override[2] = times - 1
+            return status, headers
+
+    def _make_handler(self):
+        fixture = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body are separate writes, which Nagle's algorithm would hold for the
+            # client's delayed ACK, stalling every request on a reused connection by around 40ms
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fixture._lock:
+                    fixture.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                with fixture._lock:
+                    fixture.requests.append((path, dict(self.headers)))
+                    fixture._active += 1
+                    fixture.peak_concurrency = max(fixture.peak_concurrency, fixture._active)
+                try:
+                    if fixture.latency:
+                        time.sleep(fixture.latency)
+                    override = fixture._next_override(path)
+                    if override is not None:
+                        status, headers = override
+                        body = fixture.pages.get(path, b"") if 200 <= status < 300 else b""
+                    elif path in fixture.pages:
+                        status, headers, body = 200, {}, fixture.pages[path]
+                    elif fixture.default_page is not None:
+                        status, headers, body = 200, {}, fixture.default_page
+                    else:
+                        status, headers, body = 404, {}, b""
+                    if fixture.validators and status == 200:
+                        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                        headers = dict(headers, ETag=etag)
+                        if self.headers.get("If-None-Match") == etag:
+                            status, body = 304, b""
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    if status != 304:
+                        self.send_header("Content-Length", str(len(body)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    try:
+                        self.wfile.write(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client stopped reading early, as a streaming client may
+                        self.close_connection = True
+                finally:
+                    with fixture._lock:
+                        fixture._active -= 1
+
+        return _Handler
+
+class SMTPSink:
+    """A local SMTP server which accepts every message and records it in memory.
+    It speaks enough of the protocol for smtplib: EHLO/HELO, AUTH PLAIN and
+    LOGIN (any credentials are accepted), MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+    There is no TLS, so clients must connect without SSL or STARTTLS.
+
+    The sink records the number of connections and logins alongside each
+    message, and can be made to drop connections to exercise reconnection.
+    """
+
+    def __init__(self, latency: float = 0.0, drop_after: int = None):
+        """Initializes the sink on an ephemeral loopback port, it is not started
+        until start() is called or the context manager is entered.
+
+        Arguments:
+            latency {float} -- optional, delay in seconds applied before each reply, defaults to 0.0
+            drop_after {int} -- optional, close each connection after this many messages, defaults to None
+        """
+        self.latency = latency
+        self.drop_after = drop_after
+        self.messages = []
+        self.connections = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def host(self) -> str:
+        """{str} -- the address the sink listens on"""
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        """{int} -- the port the sink listens on"""
+        return self._server.server_address[1]
+
+    def credentials(self) -> dict:
+        """Returns a credentials mapping, in the format of the notification credentials file, for this sink."""
+        return {"email": "pricepal@localhost", "pw": "password", "server": self.host, "port": self.port,
+                "security": "none"}
+
+    def start(self):
+        """Starts serving on a background daemon thread."""
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stops the sink and releases its socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        sink = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+
+            def reply(self, line: str):
+                if sink.latency:
+                    time.sleep(sink.latency)
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                with sink._lock:
+                    sink.connections += 1
+                delivered = 0
+                mail_from, recipients = None, []
+                self.reply("220 localhost PricePal SMTP sink")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode("ascii", "replace").strip()
+                    verb = command.split(" ", 1)[0].upper()
+                    if verb == "EHLO":
+                        self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n")
+                        self.reply("250 8BITMIME")
+                    elif verb == "HELO":
+                        self.reply("250 localhost")
+                    elif verb == "AUTH":
+                        if command.upper().startswith("AUTH LOGIN"):
+                            self.reply("334 " + base64.b64encode(b"Username:").decode())
+                            self.rfile.readline()
+                            self.reply("334 " + base64.b64encode(b"Password:").decode())
+                            self.rfile.readline()
+                        with sink._lock:
+                            sink.logins += 1
+                        self.reply("235 Authentication successful")
+                    elif verb == "MAIL":
+                        mail_from, recipients = command.split(":", 1)[1].strip(), []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        recipients.append(command.split(":", 1)[1].strip())
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for data_line in iter(self.rfile.readline, b""):
+                            if data_line in (b".\r\n", b".\n"):
+                                break
+                            data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                        with sink._lock:
+                            sink.messages.append((mail_from, recipients, b"".join(data)))
+                        delivered += 1
+                        self.reply("250 OK queued")
+                        if sink.drop_after is not None and delivered >= sink.drop_after:
+                            return
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        return _Handler
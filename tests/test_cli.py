@@ -0,0 +1,81 @@
+# Unit Test ==========================================================
+#
+# Testing for the headless command line. These tests check the import
+# time of the entry points against their budgets with -X importtime,
+# that neither the cli nor the extract command import the heavy
+# libraries, and run the sweep and extract commands against a local
+# fixture server.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import json
+import subprocess
+import sys
+
+# Third-party Libraries
+import pytest
+
+# Local Application Libraries
+from pricepal.cli import HEAVY_MODULES, IMPORT_BUDGETS, main
+from pricepal.common.history_store import HistoryStore
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = {"name": "fixture-store",
+              "fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                         "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"}}}
+
+# =====================================================================
+
+def import_times(statement: str) -> dict:
+    # Returns the cumulative import time in seconds of each module imported by a statement
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative) / 1e6
+    return times
+
+def test_import_budgets():
+    for module, budget in IMPORT_BUDGETS.items():
+        # The best of a few runs, so that a busy machine does not fail the budget
+        best = min(import_times(f"import {module}")[module] for _ in range(3))
+        assert best <= budget, f"{module} took {best:.3f}s to import, over its budget of {budget}s"
+
+def test_cli_and_extract_avoid_heavy_modules():
+    imported = import_times("import pricepal.cli, pricepal.common.scrape_engine; "
+                            "pricepal.cli.build_parser().parse_args(['extract', 'url', '--spec', 'spec.json'])")
+    assert not [module for module in HEAVY_MODULES if module in imported]
+
+def test_extract_command(tmp_path, capsys):
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps(STORE_SPEC))
+    with FixtureHTTPServer({"/p/1": make_product_page(price="$5.00")}) as server:
+        assert main(["extract", server.url("/p/1"), "--spec", str(spec_file)]) == 0
+    assert json.loads(capsys.readouterr().out) == {"url": server.url("/p/1"), "result": {"price": "$5.00", "stock": "5+"}}
+
+def test_sweep_command(tmp_path, capsys):
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps(STORE_SPEC))
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(1, 4)}
+    with FixtureHTTPServer(pages) as server:
+        products = tmp_path / "products.csv"
+        products.write_text("product_id,url\n" + "".join(f"{i},{server.url(f'/p/{i}')}\n" for i in range(1, 4)))
+        arguments = ["sweep", str(products), "--spec", str(spec_file), "--history", str(tmp_path / "history"),
+                     "--cache", str(tmp_path / "cache.sqlite3")]
+        assert main(arguments) == 0
+        assert main(arguments) == 0
+
+    first, second = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert (first["changed"], second["changed"], second["unchanged"]) == (3, 0, 3)
+    assert HistoryStore(str(tmp_path / "history")).latest()["price_cents"].tolist() == [100, 200, 300]
+
+def test_notify_requires_rules(capsys):
+    with pytest.raises(SystemExit):
+        main(["sweep", "products.csv", "--spec", "spec.json", "--notify"])
+    assert "--notify requires --rules" in capsys.readouterr().err
@@ -0,0 +1,98 @@
+# Unit Test ==========================================================
+#
+# Testing for the notification dispatcher. These tests raise alerts
+# against a local SMTP sink, checking that alerts for a recipient are
+# coalesced into one digest, that notify() does not wait on a slow
+# server, and that collecting alerts are sent on shutdown.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import time
+
+# Third-party Libraries
+import pytest
+
+# Local Application Libraries
+from pricepal.notification.dispatcher import NotificationDispatcher
+from pricepal.notification.notification import Mailer
+from pricepal.testing.stand_ins import SMTPSink
+
+# =====================================================================
+
+def test_alerts_are_coalesced_per_recipient():
+    with SMTPSink() as sink, Mailer(sink.credentials()) as mailer:
+        with NotificationDispatcher(mailer, window=60) as dispatcher:
+            for index in range(30):
+                dispatcher.notify(f"user{index % 2}@localhost", f"Price drop {index}", row={"price": f"${index}.99"})
+
+    assert dispatcher.queued == 30
+    assert dispatcher.sent == 2
+    assert len(sink.messages) == 2
+    recipients = sorted(recipients for _, recipients, _ in sink.messages)
+    assert recipients == [["<user0@localhost>"], ["<user1@localhost>"]]
+    for _, _, data in sink.messages:
+        assert b"Subject: PricePal: 15 alerts" in data
+        assert data.count(b"Price drop") == 15
+
+def test_window_expiry_sends_without_close():
+    with SMTPSink() as sink, Mailer(sink.credentials()) as mailer:
+        with NotificationDispatcher(mailer, window=0.2) as dispatcher:
+            dispatcher.notify("user@localhost", "Back in stock", "The widget is back in stock.")
+            deadline = time.monotonic() + 5
+            while not sink.messages and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert len(sink.messages) == 1
+            assert b"The widget is back in stock." in sink.messages[0][2]
+
+def test_notify_does_not_wait_on_slow_server():
+    with SMTPSink(latency=0.2) as sink, Mailer(sink.credentials()) as mailer:
+        with NotificationDispatcher(mailer, window=0) as dispatcher:
+            started = time.perf_counter()
+            for index in range(5):
+                dispatcher.notify(f"user{index}@localhost", "Price drop")
+            assert time.perf_counter() - started < 0.1
+            assert dispatcher.flush(timeout=30)
+        assert len(sink.messages) == 5
+
+def test_full_queue_drops_without_blocking():
+    with SMTPSink(latency=0.2) as sink, Mailer(sink.credentials()) as mailer:
+        with NotificationDispatcher(mailer, window=0, max_queue=1) as dispatcher:
+            results = [dispatcher.notify("user@localhost", f"Alert {index}", block=False) for index in range(20)]
+        assert not all(results)
+        assert dispatcher.dropped == results.count(False)
+        assert dispatcher.queued == results.count(True)
+
+def test_failed_send_is_counted():
+    with SMTPSink() as sink:
+        credentials = sink.credentials()
+    with NotificationDispatcher(Mailer(credentials, timeout=1), window=0) as dispatcher:
+        dispatcher.notify("user@localhost", "Unsent")
+        dispatcher.flush(timeout=30)
+    assert dispatcher.failed == 1
+    assert dispatcher.sent == 0
+
+def test_unexpected_error_fails_alerts_not_worker():
+    class BrokenMailer:
+        sender_email = "pricepal@localhost"
+
+        def send(self, email_content, receiver_email):
+            raise KeyError("password")
+
+    with NotificationDispatcher(BrokenMailer(), window=0) as dispatcher:
+        dispatcher.notify("user@localhost", "First")
+        assert dispatcher.flush(timeout=30)
+        dispatcher.notify("user@localhost", "Second")
+        assert dispatcher.flush(timeout=30)
+    assert dispatcher.failed == 2
+    assert dispatcher.sent == 0
+
+def test_flush_after_close_returns():
+    with SMTPSink() as sink, Mailer(sink.credentials()) as mailer:
+        dispatcher = NotificationDispatcher(mailer, window=60)
+        dispatcher.notify("user@localhost", "Price drop")
+        dispatcher.close()
+        assert dispatcher.flush()
+        assert len(sink.messages) == 1
+    with pytest.raises(RuntimeError):
+        dispatcher.notify("user@localhost", "Too late")
@@ -0,0 +1,51 @@
+# Unit Test ==========================================================
+#
+# Testing for the extraction functionality. These tests will
+# exercise the extraction module, which pulls the fields described by
+# a declarative spec out of a page, and request_and_extract of the
+# scrape_engine module against a local fixture server.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import pickle
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec, FieldRule, available_parser, extract
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = {"name": "fixture-store",
+              "fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                         "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"},
+                         "missing": {"tag": "div", "attrs": {"id": "no-such-element"}}}}
+
+# =====================================================================
+
+def test_extract_with_each_parser():
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    page = make_product_page(price="$1,299.99", stock="5+", padding_bytes=20000)
+    for parser in ("html.parser", available_parser()):
+        assert extract(page, spec, parser) == {"price": "$1,299.99", "stock": "5+", "missing": None}
+
+def test_extract_with_css_selectors():
+    spec = ExtractionSpec({"price": FieldRule(select="#product span[itemprop=price]"),
+                           "title": FieldRule(tag="div", attrs={"id": "product"}, select="h1.title")})
+    assert spec.strainer() is None
+    assert extract(make_product_page(), spec) == {"price": "$19.99", "title": "Product"}
+
+def test_spec_round_trips():
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    assert ExtractionSpec.from_dict(spec.to_dict()).key == spec.key
+    assert pickle.loads(pickle.dumps(spec)).key == spec.key
+
+def test_request_and_extract_many():
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(6)}
+    with FixtureHTTPServer(pages) as server:
+        results = dict(scraper.request_and_extract_many([server.url(path) for path in pages], spec))
+
+    assert results[server.url("/p/3")]["price"] == "$3.00"
+    assert all(result["stock"] == "5+" for result in results.values())
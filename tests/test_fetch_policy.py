@@ -0,0 +1,121 @@
+# Unit Test ==========================================================
+#
+# Testing for the fetch policies. These tests will exercise the
+# fetch_policy module through request_and_parse of the scrape_engine
+# module, against a local fixture server which misbehaves on request:
+# answering 429 and 503, or failing outright.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import time
+
+# Third-party Libraries
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.fetch_policy import CircuitBreaker, CircuitOpenError, FetchPolicy, RetryPolicy
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# =====================================================================
+
+def fast_policy(**kwargs) -> FetchPolicy:
+    kwargs.setdefault("retry", RetryPolicy(max_retries=3, backoff_base=0.01))
+    return FetchPolicy(rate_per_host=1000, burst_per_host=1000, **kwargs)
+
+def test_non_success_codes_are_classified():
+    with FixtureHTTPServer({"/p": make_product_page()}) as server:
+        server.set_status("/gone", 410)
+        server.set_status("/moved", 301)
+        server.set_status("/empty", 204)
+        assert scraper.request_and_parse(server.url("/missing")) is None
+        assert scraper.request_and_parse(server.url("/gone")) is None
+        assert scraper.request_and_parse(server.url("/moved"), timeout=2) is None
+        assert scraper.request_and_parse(server.url("/empty")) is not None
+
+def test_transient_failures_are_retried():
+    policy = fast_policy()
+    with FixtureHTTPServer({"/p": make_product_page()}) as server:
+        server.set_status("/p", 503, times=2)
+        soup = scraper.request_and_parse(server.url("/p"), policy=policy)
+
+    assert soup.find("span", class_="price").text == "$19.99"
+    metrics = policy.metrics()[server.base_url.split("//")[1]]
+    assert metrics["requests"] == 3
+    assert metrics["retries"] == 2
+    assert metrics["successes"] == 1
+    assert metrics["breaker"] == CircuitBreaker.CLOSED
+
+def test_retry_after_is_honoured():
+    delays = []
+    policy = fast_policy(sleep=delays.append)
+    with FixtureHTTPServer({"/p": make_product_page()}) as server:
+        server.set_status("/p", 429, {"Retry-After": "7"}, times=1)
+        assert scraper.request_and_parse(server.url("/p"), policy=policy) is not None
+
+    assert delays == [7.0]
+
+def test_retries_are_bounded():
+    policy = fast_policy(retry=RetryPolicy(max_retries=2, backoff_base=0.01))
+    with FixtureHTTPServer() as server:
+        server.set_status("/p", 500)
+        assert scraper.request_and_parse(server.url("/p"), policy=policy) is None
+        assert len(server.requests) == 3
+
+def test_breaker_sheds_failing_host():
+    policy = fast_policy(retry=RetryPolicy(max_retries=0), breaker=CircuitBreaker(failure_threshold=2, cooldown=60))
+    with FixtureHTTPServer() as server:
+        server.set_status("/p", 503)
+        for _ in range(2):
+            scraper.request_and_parse(server.url("/p"), policy=policy)
+        with pytest.raises(CircuitOpenError):
+            scraper.request_and_parse(server.url("/p"), policy=policy)
+        assert len(server.requests) == 2
+
+    metrics = policy.metrics()[server.base_url.split("//")[1]]
+    assert metrics["breaker"] == CircuitBreaker.OPEN
+    assert metrics["breaker_opens"] == 1
+    assert metrics["shed"] == 1
+
+def test_breaker_probes_after_cooldown():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=lambda: now[0])
+    breaker.record_failure("shop")
+    assert not breaker.allow("shop")
+    now[0] = 11.0
+    assert breaker.allow("shop")
+    assert not breaker.allow("shop")
+    breaker.record_success("shop")
+    assert breaker.state("shop") == CircuitBreaker.CLOSED
+
+def test_probe_is_released_after_unexpected_error():
+    class BrokenSession:
+        def get(self, *args, **kwargs):
+            raise ValueError("broken session")
+
+    now = [0.0]
+    policy = fast_policy(breaker=CircuitBreaker(failure_threshold=1, cooldown=10, clock=lambda: now[0]))
+    policy.breaker.record_failure("shop.example")
+    now[0] = 11.0
+    with pytest.raises(ValueError):
+        scraper.request_and_parse("http://shop.example/p", session=BrokenSession(), policy=policy)
+    assert policy.breaker.allow("shop.example")
+
+def test_connection_errors_are_retried_then_raised():
+    policy = fast_policy(retry=RetryPolicy(max_retries=1, backoff_base=0.01))
+    with pytest.raises(RequestsConnectionError):
+        scraper.request_and_parse("http://127.0.0.1:1/p", policy=policy, timeout=1)
+    assert policy.metrics()["127.0.0.1:1"]["retries"] == 1
+
+def test_rate_limit_spaces_requests():
+    policy = FetchPolicy(rate_per_host=10, burst_per_host=1)
+    with FixtureHTTPServer({"/p": make_product_page()}) as server:
+        start = time.perf_counter()
+        results = list(scraper.request_and_parse_many([server.url("/p")] * 6, policy=policy))
+        elapsed = time.perf_counter() - start
+
+    assert len(results) == 6
+    assert elapsed >= 0.45
+    assert policy.metrics()[server.base_url.split("//")[1]]["throttled"] >= 4
@@ -0,0 +1,67 @@
+# Unit Test ==========================================================
+#
+# Testing for the price history store. These tests will exercise the
+# history_store module, which persists scraped prices as append-only
+# columnar segments indexed by product id and time.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore, HistoryWriter
+
+# =====================================================================
+
+def sweep(day: int, products: int = 50) -> pd.DataFrame:
+    return pd.DataFrame({"product_id": np.arange(products)[::-1],
+                         "ts": pd.Timestamp("2026-01-01", tz="UTC") + pd.Timedelta(days=day),
+                         "price_cents": 1000 + np.arange(products)[::-1] + day,
+                         "stock": day % 3})
+
+def test_history_range_query(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for day in range(10):
+        store.append(sweep(day))
+
+    rows = store.history(7, start="2026-01-03", end="2026-01-05")
+    assert list(rows["price_cents"]) == [1009, 1010, 1011]
+    assert rows["ts"].is_monotonic_increasing
+    assert len(store.history(7)) == 10
+    assert store.history(999).empty
+
+def test_latest_snapshot(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append(sweep(0))
+    store.append(sweep(1, products=10))
+
+    latest = store.latest()
+    assert len(latest) == 50
+    assert latest.set_index("product_id").loc[5, "price_cents"] == 1006
+    assert latest.set_index("product_id").loc[40, "price_cents"] == 1040
+    assert list(store.latest([3, 40, 12345])["product_id"]) == [3, 40]
+
+def test_store_reopens_and_compacts(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for day in range(6):
+        store.append(sweep(day))
+    expected = store.history(11)
+
+    reopened = HistoryStore(str(tmp_path))
+    assert len(reopened) == 300
+    assert reopened.compact() == 1
+    pd.testing.assert_frame_equal(HistoryStore(str(tmp_path)).history(11), expected)
+    assert len(reopened.between("2026-01-02", "2026-01-03")) == 100
+
+def test_writer_batches_rows(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    with HistoryWriter(store, batch_rows=4) as writer:
+        for i in range(10):
+            writer.add(i, pd.Timestamp("2026-02-01", tz="UTC"), price_cents=None if i == 3 else i * 100)
+
+    assert len(store.segments) == 3
+    latest = store.latest()
+    assert latest["price_cents"].isna().sum() == 1
+    assert (latest["stock"] == -1).all()
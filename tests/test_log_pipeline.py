@@ -0,0 +1,94 @@
+# Unit Test ==========================================================
+#
+# Testing for the asynchronous logging pipeline. These tests check that
+# records are written by the listener thread rather than the thread
+# which logs them, that a full queue drops and counts records without
+# blocking and reports the drops in the log, and that log files can be
+# written as JSON lines.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import json
+import logging
+import threading
+
+# Local Application Libraries
+from pricepal.common.log_pipeline import LogPipeline, rotating_file_handler
+
+# =====================================================================
+
+class Recorder(logging.Handler):
+    def __init__(self, gate: threading.Event = None):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+        self.gate = gate
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.records.append(record.getMessage())
+        self.threads.add(threading.current_thread().name)
+
+def make_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+def test_records_are_written_off_the_logging_thread():
+    recorder = Recorder()
+    logger = make_logger("pricepal.test.pipeline")
+    with LogPipeline([recorder]).start(logger) as pipeline:
+        for i in range(100):
+            logger.debug("Fetched 'url:%s'.", i)
+    assert recorder.records == [f"Fetched 'url:{i}'." for i in range(100)]
+    assert threading.current_thread().name not in recorder.threads
+    assert pipeline.dropped == 0 and not logger.handlers
+
+def test_full_queue_drops_and_reports():
+    release = threading.Event()
+    recorder = Recorder(release)
+    logger = make_logger("pricepal.test.dropping")
+    pipeline = LogPipeline([recorder], max_queue=10).start(logger)
+    # The handler is held, so at most one record is taken off the queue before it fills
+    for i in range(50):
+        logger.debug("Record %s", i)
+    assert pipeline.dropped >= 39
+    release.set()
+    pipeline.stop()
+
+    assert len(recorder.records) == 51 - pipeline.dropped
+    assert recorder.records[-1] == f"Dropped 'records:{pipeline.dropped}' as the log handlers fell behind."
+
+def test_json_lines_file(tmp_path):
+    filename = str(tmp_path / "logs" / "pricepal.jsonl")
+    logger = make_logger("pricepal.test.json")
+    with LogPipeline([rotating_file_handler(filename, json_lines=True)]).start(logger):
+        logger.info("Sent 'emails:%s'.", 3)
+        try:
+            raise ValueError("bad price")
+        except ValueError:
+            logger.exception("Failed to normalize.")
+
+    with open(filename, encoding="utf-8") as file:
+        entries = [json.loads(line) for line in file]
+    assert [entry["message"] for entry in entries][0] == "Sent 'emails:3'."
+    assert entries[0]["level"] == "INFO" and entries[0]["function"] == "test_json_lines_file"
+    assert "exc" not in entries[0]
+    assert entries[1]["message"] == "Failed to normalize."
+    assert entries[1]["exc"].startswith("Traceback") and entries[1]["exc"].endswith("ValueError: bad price")
+
+def test_text_file_writes_traceback_once(tmp_path):
+    filename = str(tmp_path / "logs" / "pricepal.log")
+    logger = make_logger("pricepal.test.text")
+    with LogPipeline([rotating_file_handler(filename)]).start(logger):
+        try:
+            raise ValueError("bad price")
+        except ValueError:
+            logger.exception("Failed to normalize 'row:%s'.", 4)
+
+    with open(filename, encoding="utf-8") as file:
+        text = file.read()
+    assert "Failed to normalize 'row:4'." in text and text.count("ValueError: bad price") == 1
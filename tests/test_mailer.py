@@ -0,0 +1,70 @@
+# Unit Test ==========================================================
+#
+# Testing for the Mailer of the notification module. These tests send
+# email to a local SMTP sink, checking that a batch of emails shares one
+# authenticated session, that sessions are replaced at their message
+# limit, and that a dropped session is reopened without losing email.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import json
+
+# Third-party Libraries
+import pandas as pd
+
+# Local Application Libraries
+import pricepal.notification.notification as notification
+from pricepal.testing.stand_ins import SMTPSink
+
+# =====================================================================
+
+def compose(mailer: notification.Mailer, count: int) -> list:
+    return [(notification.compose_unformatted_email(f"Alert {index}", "Price dropped.", "user@localhost",
+                                                    mailer.sender_email), None) for index in range(count)]
+
+def test_batch_shares_one_session():
+    with SMTPSink() as sink, notification.Mailer(sink.credentials()) as mailer:
+        assert mailer.send_many(compose(mailer, 25)) == 25
+
+    assert len(sink.messages) == 25
+    assert sink.connections == 1
+    assert sink.logins == 1
+    assert mailer.sessions == 1
+
+def test_session_is_replaced_at_message_limit():
+    with SMTPSink() as sink, notification.Mailer(sink.credentials(), max_messages_per_session=4) as mailer:
+        assert mailer.send_many(compose(mailer, 10)) == 10
+
+    assert len(sink.messages) == 10
+    assert sink.connections == 3
+    assert sink.logins == 3
+
+def test_dropped_session_is_reopened():
+    with SMTPSink(drop_after=3) as sink, notification.Mailer(sink.credentials()) as mailer:
+        for email_content, _ in compose(mailer, 7):
+            mailer.send(email_content)
+
+    assert len(sink.messages) == 7
+    assert sink.connections == 3
+    assert mailer.sent == 7
+
+def test_send_functions_use_supplied_mailer():
+    table = pd.DataFrame({"price": ["$19.99"], "stock": ["5+"]}, index=["widget"])
+    with SMTPSink() as sink, notification.Mailer(sink.credentials()) as mailer:
+        notification.send_unformatted_email("Plain", "Body text.", ["a@localhost", "b@localhost"], mailer=mailer)
+        notification.send_formatted_table_email("Table", "Body text.", "a@localhost", table, mailer=mailer)
+
+    assert sink.connections == 1
+    (_, recipients, plain), (_, _, formatted) = sink.messages
+    assert recipients == ["<a@localhost>", "<b@localhost>"]
+    assert b"To: a@localhost, b@localhost" in plain
+    assert b"text/html" in formatted and b"<td>$19.99</td>" in formatted
+
+def test_credentials_are_loaded_once(tmp_path, monkeypatch):
+    path = tmp_path / "email_credentials.json"
+    path.write_text(json.dumps({"email": "a@localhost", "pw": "pw", "server": "localhost", "port": 25}))
+    first = notification.load_credentials(str(path))
+
+    monkeypatch.setattr("builtins.open", None)
+    assert notification.load_credentials(str(path)) is first
@@ -0,0 +1,91 @@
+# Unit Test ==========================================================
+#
+# Testing for the sweep metrics. These tests check that nothing is
+# recorded while metrics are disabled, that the scrape engine times each
+# stage by host and outcome, that the Prometheus and JSON exports are
+# written, and that the profilers write their output.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import json
+import pstats
+import time
+
+# Local Application Libraries
+import pricepal.common.metrics as metrics
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = ExtractionSpec.from_dict({"name": "fixture-store",
+                                       "fields": {"price": {"tag": "span", "attrs": {"class": "price"}}}})
+
+# =====================================================================
+
+def test_disabled_metrics_record_nothing():
+    metrics.disable()
+    with metrics.timer("fetch", "http://example.com/") as timed:
+        timed.outcome = "not_modified"
+    metrics.count("fetched_bytes", "http://example.com/", value=10)
+    assert metrics.registry() is None
+    assert metrics.write_prometheus("unused.prom") is None
+
+def test_stages_are_timed_by_host_and_outcome():
+    registry = metrics.enable()
+    try:
+        with FixtureHTTPServer({"/p/1": make_product_page(price="$5.00")}) as server:
+            server.set_status("/p/2", 503)
+            host = metrics.host_of(server.url("/p/1"))
+            assert scraper.request_and_extract(server.url("/p/1"), STORE_SPEC) == {"price": "$5.00"}
+            assert scraper.request_and_extract(server.url("/p/2"), STORE_SPEC) is None
+    finally:
+        metrics.disable()
+
+    stages = {(stage["stage"], stage["host"], stage["outcome"]): stage["count"] for stage in registry.snapshot()["stages"]}
+    assert stages == {("fetch", host, "ok"): 1, ("fetch", host, "http_5xx"): 1, ("extract", host, "ok"): 1}
+    assert [counter["name"] for counter in registry.snapshot()["counters"]] == ["fetched_bytes"]
+
+def test_exports_are_written(tmp_path):
+    registry = metrics.enable()
+    try:
+        with metrics.timer("store"):
+            pass
+        try:
+            with metrics.timer("fetch", host="shop.example"):
+                raise ValueError
+        except ValueError:
+            pass
+        metrics.count("sweep_pages", outcome="changed", value=3)
+        metrics.count("fetched_bytes", "http://shop.example/p", value=12345678)
+        prometheus = metrics.write_prometheus(str(tmp_path / "pricepal.prom"))
+        snapshot = metrics.write_json(str(tmp_path / "pricepal.json"))
+    finally:
+        metrics.disable()
+
+    text = open(prometheus, encoding="utf-8").read()
+    assert 'pricepal_sweep_pages_total{host="",outcome="changed"} 3' in text
+    assert 'pricepal_fetched_bytes_total{host="shop.example",outcome=""} 12345678' in text
+    assert 'pricepal_stage_seconds_bucket{stage="fetch",host="shop.example",outcome="error",le="+Inf"} 1' in text
+    assert 'pricepal_stage_seconds_count{stage="store",host="",outcome="ok"} 1' in text
+    assert len(json.load(open(snapshot, encoding="utf-8"))["stages"]) == 2
+    assert sorted((stage, host, count) for stage, host, count, _ in registry.summary()) == [("fetch", "shop.example", 1),
+                                                                                            ("store", "", 1)]
+
+def test_profilers_write_their_output(tmp_path):
+    def busy():
+        ends = time.perf_counter() + 0.1
+        while time.perf_counter() < ends:
+            pass
+
+    with metrics.profile(str(tmp_path / "sweep.prof")):
+        busy()
+    assert any(name == "busy" for _, _, name in pstats.Stats(str(tmp_path / "sweep.prof")).stats)
+
+    with FixtureHTTPServer({"/p/1": make_product_page(price="$5.00")}) as server:
+        with metrics.sample(str(tmp_path / "sweep.collapsed"), interval=0.001) as sampler:
+            list(scraper.request_and_extract_many([server.url("/p/1")] * 20, STORE_SPEC))
+    assert sampler.samples > 0
+    assert (tmp_path / "sweep.collapsed").read_text() == sampler.collapsed()
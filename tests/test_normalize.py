@@ -0,0 +1,66 @@
+# Unit Test ==========================================================
+#
+# Testing for the normalization stage. These tests normalize columns
+# of messy price and stock strings, checking the typed columns which
+# result, and that malformed values are rejected rather than raising.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.normalize import normalize_prices, normalize_stock, normalize_sweep
+
+# =====================================================================
+
+def test_prices_with_locale_separators():
+    prices, rejects = normalize_prices(["$1,299.99", "1 299,99 €", "1.299,99 €", "1 299,99 €", "US$ 5",
+                                        "12,5 EUR", "CA$19.99", "£0.99", "1,299", "-3.00"])
+    assert prices["price_cents"].tolist() == [129999, 129999, 129999, 129999, 500, 1250, 1999, 99, 129900, -300]
+    assert prices["currency"].tolist() == ["USD", "EUR", "EUR", "EUR", "USD", "EUR", "CAD", "GBP", "USD", "USD"]
+    assert rejects.empty
+
+def test_default_currency_applies_to_bare_dollar():
+    prices, _ = normalize_prices(["$5", "5", "C$5"], default_currency="CAD")
+    assert prices["currency"].tolist() == ["CAD", "CAD", "CAD"]
+
+def test_lowercase_currency_codes():
+    prices, rejects = normalize_prices(["12.99 usd", "eur 5,00", "7 Gbp"])
+    assert prices["price_cents"].tolist() == [1299, 500, 700]
+    assert prices["currency"].tolist() == ["USD", "EUR", "GBP"]
+    assert rejects.empty
+
+def test_words_are_not_currency_codes():
+    # A word is left in the price, which is rejected rather than recorded in a currency named by the word
+    prices, rejects = normalize_prices(["Now $19.99", "19.99 per box", "Tax $4.00", "£4.00 gbp"])
+    assert prices["price_cents"].tolist()[3] == 400 and prices["currency"].tolist()[3] == "GBP"
+    assert prices["price_cents"][:3].isna().all() and prices["currency"][:3].isna().all()
+    assert rejects["value"].tolist() == ["Now $19.99", "19.99 per box", "Tax $4.00"]
+
+def test_malformed_prices_are_rejected():
+    prices, rejects = normalize_prices(pd.Series(["$5", "call for price", None, "", "-", "9" * 20], index=list("abcdef")))
+    assert prices["price_cents"].isna().tolist() == [False, True, True, True, True, True]
+    assert rejects["row"].tolist() == ["b", "e", "f"]
+    assert rejects["reason"].tolist() == ["unrecognized price", "unrecognized price", "price too large"]
+
+def test_stock_tokens():
+    stock, rejects = normalize_stock(["1", "5+", "-", "In Stock", "Only 3 left", "SOLD OUT", None, "ask"])
+    assert stock["stock"].tolist() == [1, 5, 0, 1, 3, 0, -1, -1]
+    assert stock["stock_status"].tolist() == ["in_stock", "in_stock", "out_of_stock", "in_stock", "in_stock",
+                                              "out_of_stock", "unknown", "unknown"]
+    assert rejects["value"].tolist() == ["ask"]
+
+def test_normalized_sweep_appends_to_history(tmp_path):
+    sweep = pd.DataFrame({"product_id": [1, 2, 3], "ts": pd.Timestamp("2026-01-01", tz="UTC"),
+                          "price": ["$19.99", "n/a", "$5"], "stock": ["5+", "1", "-"]})
+    normalized, rejects = normalize_sweep(sweep)
+    assert list(normalized.columns) == ["product_id", "ts", "price_cents", "currency", "stock", "stock_status"]
+    assert rejects[["row", "column"]].values.tolist() == [[1, "price"]]
+
+    store = HistoryStore(str(tmp_path))
+    store.append(normalized)
+    latest = store.latest()
+    assert latest["price_cents"].tolist()[::2] == [1999, 500]
+    assert latest["stock"].tolist() == [5, 1, 0]
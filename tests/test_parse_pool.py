@@ -0,0 +1,55 @@
+# Unit Test ==========================================================
+#
+# Testing for the process pool parse stage. These tests will exercise
+# the parse_pool module, which extracts fields from raw pages in worker
+# processes, both alone and behind the threaded fetch stage.
+#
+# Imports =============================================================
+
+# Local Application Libraries
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.common.parse_pool import ParsePool, fetch_and_extract_many
+from pricepal.common.response_cache import ResponseCache
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+SPEC = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                                            "stock": {"tag": "span", "attrs": {"class": "stock"}}}})
+
+# =====================================================================
+
+def test_extract_many_in_pool():
+    pages = [(f"page-{i}", make_product_page(price=f"${i}.00")) for i in range(20)]
+    with ParsePool(SPEC, workers=2, max_pending=3) as pool:
+        results = dict(pool.extract_many(pages + [("failed-fetch", None)]))
+
+    assert len(results) == 21
+    assert results["page-7"] == {"price": "$7.00", "stock": "5+"}
+    assert results["failed-fetch"] is None
+
+def test_early_exit_stops_feeding():
+    consumed = []
+
+    def pages():
+        for i in range(100):
+            consumed.append(i)
+            yield f"page-{i}", make_product_page()
+
+    with ParsePool(SPEC, workers=1, max_pending=2) as pool:
+        results = pool.extract_many(pages())
+        next(results)
+        results.close()
+
+    assert len(consumed) < 10
+
+def test_fetch_and_extract_many(tmp_path):
+    paths = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(8)}
+    with FixtureHTTPServer(paths, validators=True) as server, ParsePool(SPEC, workers=2) as pool, \
+            ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        urls = [server.url(path) for path in paths]
+        first = dict(fetch_and_extract_many(urls, pool, cache=cache))
+        second = dict(fetch_and_extract_many(urls, pool, cache=cache))
+
+    assert first == second
+    assert first[server.url("/p/5")]["price"] == "$5.00"
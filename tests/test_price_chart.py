@@ -0,0 +1,100 @@
+# Unit Test ==========================================================
+#
+# Testing for the price chart. These tests check that downsampling
+# keeps the extremes of every bucket, and draw a chart with the Agg
+# backend, checking that it draws no more than a few points per pixel
+# column, that appends within the view are blitted, that zooming
+# requeries the series, and that series can be loaded from a history
+# store.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore
+from pricepal.gui.price_chart import POINTS_PER_BUCKET, PriceChart, downsample_minmax, history_loader
+
+# =====================================================================
+
+def make_chart() -> PriceChart:
+    figure = Figure(figsize=(4, 2), dpi=100)
+    FigureCanvasAgg(figure)
+    return PriceChart(figure.add_subplot(111))
+
+def test_downsample_keeps_bucket_extremes():
+    rng = np.random.default_rng(0)
+    x = np.arange(100000, dtype=np.float64)
+    y = rng.normal(size=len(x))
+    kept_x, kept_y = downsample_minmax(x, y, buckets=100)
+    assert len(kept_x) <= POINTS_PER_BUCKET * 100 and np.all(np.diff(kept_x) > 0)
+    for bucket in range(100):
+        inside = (kept_x >= bucket * 1000) & (kept_x < (bucket + 1) * 1000)
+        assert kept_y[inside].min() == y[bucket * 1000:(bucket + 1) * 1000].min()
+        assert kept_y[inside].max() == y[bucket * 1000:(bucket + 1) * 1000].max()
+
+    # A short series, or a short visible range, is kept whole with a point either side
+    assert len(downsample_minmax(x[:50], y[:50])[0]) == 50
+    assert downsample_minmax(x, y, 10.5, 20.5)[0].tolist() == list(range(10, 22))
+
+def test_chart_draws_at_screen_resolution_and_blits_appends():
+    chart = make_chart()
+    x = np.arange(200000, dtype=np.float64)
+    chart.set_series("product", x, np.sin(x / 1000))
+    chart.canvas.draw()
+    assert len(chart.series["product"].line.get_xdata()) <= POINTS_PER_BUCKET * chart.buckets
+
+    redraws = chart.redraws
+    chart.append("product", [200000.0, 200001.0], [0.5, 0.25])
+    assert chart.blits == 1 and chart.redraws == redraws
+    assert chart.series["product"].line.get_xdata()[-1] == 200001.0
+
+    # A point beyond the y limits needs the axes redrawn
+    chart.append("product", [200002.0], [10.0])
+    assert chart.redraws == redraws + 1
+
+def test_zoom_requeries_visible_range():
+    chart = make_chart()
+    x = np.arange(200000, dtype=np.float64)
+    chart.set_series("product", x, np.sin(x / 1000))
+    chart.axes.set_xlim(1000, 1100)
+    assert chart.series["product"].line.get_xdata().tolist() == list(range(999, 1102))
+
+def test_series_from_history_store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    ts = pd.date_range("2026-01-01", periods=5000, freq="h", tz="UTC")
+    store.append(pd.DataFrame({"product_id": 7, "ts": ts, "price_cents": np.arange(5000) + 1000, "stock": 1}))
+    chart = make_chart()
+    chart.set_series("product 7", loader=history_loader(store, 7))
+    x, y = chart.series["product 7"].line.get_data()
+    assert y.min() == 10.0 and y.max() == 59.99
+    assert len(x) <= POINTS_PER_BUCKET * chart.buckets
+
+    # A day of the history is requeried at full resolution
+    chart.axes.set_xlim(x[0], x[0] + 1)
+    assert np.allclose(chart.series["product 7"].line.get_ydata(), 10.0 + np.arange(25) / 100)
+
+def test_loader_series_extent_and_appends(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    ts = pd.date_range("2026-01-01", periods=500, freq="h", tz="UTC")
+    store.append(pd.DataFrame({"product_id": 7, "ts": ts, "price_cents": np.arange(500) + 1000, "stock": 1}))
+    load = history_loader(store, 7)
+    queries = []
+    chart = make_chart()
+    chart.set_series("product 7", loader=lambda start, end: queries.append((start, end)) or load(start, end))
+
+    # The whole history is queried once for its extent, not on every fit
+    chart.fit()
+    chart.fit()
+    assert queries.count((None, None)) == 1
+
+    # Appended points are drawn, and kept when the view is requeried
+    x, _ = chart.series["product 7"].line.get_data()
+    chart.append("product 7", [x[-1] + 0.01], [12.5])
+    chart.axes.set_xlim(x[-1] - 1, x[-1] + 1)
+    assert chart.series["product 7"].line.get_ydata()[-1] == 12.5
+    assert chart.series["product 7"].limits()[1] == x[-1] + 0.01
@@ -0,0 +1,84 @@
+# Unit Test ==========================================================
+#
+# Testing for the conditional request cache. These tests will
+# exercise the response_cache module, both directly and through
+# request_and_parse of the scrape_engine module, against a local
+# fixture server.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import os
+
+# Local Application Libraries
+import pricepal.common.metrics as metrics
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.common.response_cache import DEFAULT_MAX_PARSED, ResponseCache
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# =====================================================================
+
+def test_not_modified_reuses_parse(tmp_path):
+    with FixtureHTTPServer({"/p": make_product_page()}, validators=True) as server, \
+            ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        first = scraper.request_and_parse(server.url("/p"), cache=cache)
+        second = scraper.request_and_parse(server.url("/p"), cache=cache)
+
+    assert second is first
+    assert "If-None-Match" not in server.requests[0][1]
+    assert "If-None-Match" in server.requests[1][1]
+
+def test_identical_body_reuses_parse_without_validators(tmp_path):
+    with FixtureHTTPServer({"/p": make_product_page()}) as server, \
+            ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        first = scraper.request_and_parse(server.url("/p"), cache=cache)
+        second = scraper.request_and_parse(server.url("/p"), cache=cache)
+        server.pages["/p"] = make_product_page(price="$5.00")
+        third = scraper.request_and_parse(server.url("/p"), cache=cache)
+
+    assert second is first
+    assert third.find("span", class_="price").text == "$5.00"
+
+def test_cache_persists_validators(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    with FixtureHTTPServer({"/p": make_product_page()}, validators=True) as server:
+        with ResponseCache(path) as cache:
+            scraper.request_and_parse(server.url("/p"), cache=cache)
+        with ResponseCache(path) as cache:
+            soup = scraper.request_and_parse(server.url("/p"), cache=cache)
+
+    assert server.requests[1][1]["If-None-Match"]
+    assert soup.find("span", class_="price").text == "$19.99"
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    with ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=1400) as cache:
+        for i in range(3):
+            cache.update(f"http://shop/{i}", os.urandom(400))
+        cache.not_modified("http://shop/0")
+        cache.update("http://shop/3", os.urandom(400))
+
+        assert cache.total_bytes <= 1400
+        assert "http://shop/0" in cache
+        assert "http://shop/1" not in cache
+        assert "http://shop/3" in cache
+
+def test_sweep_reuses_extracted_fields_across_restart(tmp_path):
+    # A sweep of more urls than the in-memory memo holds, in a new process, still extracts no unchanged body
+    spec = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}}}})
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(DEFAULT_MAX_PARSED * 2)}
+    path = str(tmp_path / "cache.sqlite3")
+    with FixtureHTTPServer(pages, validators=True) as server:
+        urls = [server.url(page) for page in pages]
+        with ResponseCache(path) as cache:
+            first = dict(scraper.request_and_extract_many(urls, spec, cache=cache))
+        registry = metrics.enable()
+        try:
+            with ResponseCache(path) as cache:
+                second = dict(scraper.request_and_extract_many(urls, spec, cache=cache))
+        finally:
+            metrics.disable()
+
+    assert second == first and first[urls[-1]]["price"] == f"${len(pages) - 1}.00"
+    reused = sum(counter["value"] for counter in registry.snapshot()["counters"] if counter["name"] == "parse_reused")
+    assert reused == len(pages)
@@ -0,0 +1,121 @@
+# Unit Test ==========================================================
+#
+# Testing for the alert rule engine. These tests evaluate small rule
+# tables against successive snapshots, checking that each kind of rule
+# fires on the sweep which crosses its condition, that evaluating only
+# changed products raises the same alerts as evaluating every product,
+# and that alerts reach a dispatcher.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local Application Libraries
+from pricepal.notification.rules import RULE_KINDS, RuleEngine, notify_alerts
+
+# =====================================================================
+
+def snapshot(rows: dict) -> pd.DataFrame:
+    return pd.DataFrame({"product_id": list(rows),
+                         "price_cents": pd.array([price for price, _ in rows.values()], dtype="Int64"),
+                         "stock": [stock for _, stock in rows.values()]})
+
+def make_engine() -> RuleEngine:
+    return RuleEngine(pd.DataFrame({"rule_id": [1, 2, 3, 4, 5],
+                                    "product_id": [10, 10, 20, 30, 40],
+                                    "kind": ["price_below", "all_time_low", "drop_pct", "back_in_stock", "price_below"],
+                                    "threshold": [1000, None, 20, None, 500],
+                                    "receiver_email": ["a@localhost", "a@localhost", "b@localhost", "b@localhost",
+                                                       "c@localhost"]}))
+
+def fired(alerts: pd.DataFrame) -> list:
+    return sorted(alerts["rule_id"].tolist())
+
+def test_each_rule_kind_fires_on_crossing():
+    engine = make_engine()
+    first = engine.evaluate(snapshot({10: (1200, 5), 20: (5000, 5), 30: (900, 0), 40: (600, 5)}))
+    assert fired(first) == []
+
+    second = engine.evaluate(snapshot({10: (999, 5), 20: (3999, 5), 30: (900, 3), 40: (600, 5)}))
+    assert fired(second) == [1, 2, 3, 4]
+    alert = second.set_index("rule_id").loc[3]
+    assert alert["previous_cents"] == 5000 and alert["price_cents"] == 3999
+
+    # The price below rule has already crossed, only the new low fires
+    third = engine.evaluate(snapshot({10: (950, 5), 20: (3500, 5), 30: (900, 3), 40: (600, 5)}))
+    assert fired(third) == [2]
+
+def test_first_sighting_below_threshold_fires():
+    engine = make_engine()
+    assert fired(engine.evaluate(snapshot({40: (400, 1)}))) == [5]
+
+def test_missing_price_does_not_fire_or_reset_state():
+    engine = make_engine()
+    engine.evaluate(snapshot({10: (1200, 5)}))
+    assert fired(engine.evaluate(snapshot({10: (pd.NA, 5)}))) == []
+    assert fired(engine.evaluate(snapshot({10: (1200, 5)}))) == []
+    assert fired(engine.evaluate(snapshot({10: (800, 5)}))) == [1, 2]
+
+def test_incremental_matches_full_evaluation():
+    rng = np.random.default_rng(0)
+    products = np.arange(200)
+    rules = pd.DataFrame({"rule_id": np.arange(1000), "product_id": rng.choice(products, 1000),
+                          "kind": rng.choice(RULE_KINDS, 1000), "threshold": rng.uniform(1, 60, 1000) * 100,
+                          "receiver_email": "a@localhost"})
+    incremental, full = RuleEngine(rules), RuleEngine(rules)
+    prices = rng.integers(1000, 6000, len(products))
+    stock = rng.integers(0, 3, len(products))
+    for _ in range(20):
+        # Only a few products change between sweeps
+        changed = rng.random(len(products)) < 0.1
+        prices = np.where(changed, rng.integers(1000, 6000, len(products)), prices)
+        stock = np.where(changed, rng.integers(0, 3, len(products)), stock)
+        sweep = pd.DataFrame({"product_id": products, "price_cents": prices, "stock": stock})
+        assert fired(incremental.evaluate(sweep)) == fired(full.evaluate(sweep, changed_only=False))
+
+def test_prime_sets_history_without_alerts():
+    engine = make_engine()
+    history = pd.DataFrame({"product_id": [10, 10, 10, 20],
+                            "price_cents": pd.array([700, 1500, pd.NA, 4000], dtype="Int64"),
+                            "stock": [5, 5, 5, 5]})
+    engine.prime(history)
+    # 900 is not below the all time low of 700, and 1500 to 900 crosses the price below rule
+    assert fired(engine.evaluate(snapshot({10: (900, 5), 20: (3000, 5)}))) == [1, 3]
+    assert fired(engine.evaluate(snapshot({10: (650, 5)}))) == [2]
+
+def test_rules_can_be_replaced_and_removed():
+    engine = make_engine()
+    engine.add_rules(pd.DataFrame({"rule_id": [5], "product_id": [40], "kind": ["price_below"], "threshold": [100],
+                                   "receiver_email": ["c@localhost"]}))
+    assert len(engine) == 5
+    assert fired(engine.evaluate(snapshot({40: (400, 1)}))) == []
+    engine.remove_rules([1, 2])
+    assert fired(engine.evaluate(snapshot({10: (1, 1)}))) == []
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        RuleEngine(pd.DataFrame({"rule_id": [1], "product_id": [1], "kind": ["price_above"], "threshold": [1],
+                                 "receiver_email": ["a@localhost"]}))
+    with pytest.raises(ValueError):
+        RuleEngine(pd.DataFrame({"rule_id": [1], "product_id": [1], "kind": ["drop_pct"], "threshold": [None],
+                                 "receiver_email": ["a@localhost"]}))
+
+def test_alerts_are_queued_on_dispatcher():
+    class Recorder:
+        def __init__(self):
+            self.alerts = []
+
+        def notify(self, receiver_email, subject, message="", row=None):
+            self.alerts.append((receiver_email, subject, row))
+            return True
+
+    engine = make_engine()
+    engine.evaluate(snapshot({10: (1200, 5)}))
+    recorder = Recorder()
+    assert notify_alerts(engine.evaluate(snapshot({10: (999, 5)})), recorder) == 2
+    subjects = sorted(subject for _, subject, _ in recorder.alerts)
+    assert subjects == ["Product 10 is at an all time low", "Product 10 is below $10.00"]
+    assert recorder.alerts[0][2]["price"] == "$9.99"
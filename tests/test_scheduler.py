@@ -0,0 +1,70 @@
+# Unit Test ==========================================================
+#
+# Testing for the adaptive polling scheduler. These tests will exercise
+# the scheduler module, and the token bucket of the rate_limit module,
+# driven by a fake clock.
+#
+# Imports =============================================================
+
+# Local Application Libraries
+from pricepal.common.rate_limit import TokenBucket
+from pricepal.common.scheduler import AdaptiveScheduler
+
+# =====================================================================
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(2.0, capacity=4, clock=clock)
+    assert bucket.acquire_up_to(10) == 4
+    assert not bucket.try_acquire()
+    assert bucket.delay() == 0.5
+    clock.now += 1.0
+    assert bucket.acquire_up_to(10) == 2
+
+def test_intervals_adapt_to_changes():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler(min_interval=60, max_interval=3600, default_interval=600, clock=clock)
+    scheduler.add("static")
+    scheduler.add("volatile")
+
+    for _ in range(6):
+        released = scheduler.release_due()
+        for product_id in released:
+            scheduler.record(product_id, changed=product_id == "volatile")
+        clock.now += 3600
+
+    assert scheduler.interval("volatile") == 60
+    assert scheduler.interval("static") == 3600
+
+def test_most_overdue_released_first_within_budget():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler(budget_per_minute=3, clock=clock)
+    for product_id in range(5):
+        scheduler.add(product_id, due=clock.now - product_id)
+
+    assert scheduler.release_due() == [4, 3, 2]
+    assert scheduler.release_due() == []
+    clock.now += 40
+    assert scheduler.release_due() == [1, 0]
+    assert scheduler.release_due() == []
+
+def test_sale_event_tightens_interval():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler(sale_interval=300, default_interval=7200, clock=clock)
+    scheduler.add("on-sale", due=clock.now + 7200)
+    scheduler.add("other", due=clock.now + 7200)
+    scheduler.add_sale_event(clock.now + 1800, clock.now + 5400, ["on-sale"], lead=600)
+
+    clock.now += 1200
+    assert scheduler.release_due() == ["on-sale"]
+    scheduler.record("on-sale", changed=False)
+    assert scheduler.interval("on-sale") == 300
+    assert scheduler.interval("other") == 7200
+    assert scheduler.time_until_due() == 300
@@ -0,0 +1,55 @@
+# Unit Test ==========================================================
+#
+# Testing for the batch scraping functionality. These tests will
+# exercise request_and_parse_many of the scrape_engine module against
+# a local fixture server, so no live internet access is required.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import time
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# =====================================================================
+
+def test_batch_yields_every_url():
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(12)}
+    with FixtureHTTPServer(pages) as server:
+        urls = [server.url(path) for path in pages]
+        results = dict(scraper.request_and_parse_many(urls, max_workers=4))
+
+    assert set(results) == set(urls)
+    for i in range(12):
+        assert results[server.url(f"/p/{i}")].find("span", class_="price").text == f"${i}.00"
+
+def test_batch_is_concurrent_and_capped_per_host():
+    pages = {f"/p/{i}": make_product_page() for i in range(8)}
+    with FixtureHTTPServer(pages, latency=0.2) as server:
+        start = time.perf_counter()
+        results = list(scraper.request_and_parse_many([server.url(path) for path in pages],
+                                                      max_workers=8, max_per_host=4))
+        elapsed = time.perf_counter() - start
+
+    assert len(results) == 8
+    assert server.peak_concurrency <= 4
+    # Serial requests would take 8 x 0.2s, two waves of four take ~0.4s
+    assert elapsed < 1.2
+
+def test_batch_reuses_connections():
+    pages = {f"/p/{i}": make_product_page() for i in range(20)}
+    with FixtureHTTPServer(pages) as server:
+        list(scraper.request_and_parse_many([server.url(path) for path in pages],
+                                            max_workers=2, max_per_host=2))
+
+    assert server.connections <= 2
+
+def test_batch_reports_errors_in_place():
+    with FixtureHTTPServer({"/ok": make_product_page()}) as server:
+        urls = [server.url("/ok"), "http://127.0.0.1:1/refused"]
+        results = dict(scraper.request_and_parse_many(urls, timeout=2))
+
+    assert results[urls[0]] is not None
+    assert isinstance(results[urls[1]], Exception)
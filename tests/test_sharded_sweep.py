@@ -0,0 +1,205 @@
+# Unit Test ==========================================================
+#
+# Testing for the sharded sweep and its durable work queue. These tests
+# check that the hash ring keeps hosts on their shard as shards are
+# added, that an expired lease passes its task to another worker, that
+# a worker stops a task whose lease it has lost, and run sharded sweeps
+# over worker processes against a local fixture server, including one
+# whose worker is killed part way, one whose worker hangs and one whose
+# merge is interrupted.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import os
+import signal
+import socket
+import threading
+import time
+
+# Third-party Libraries
+import pandas as pd
+import pytest
+
+# Local Application Libraries
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.sharded_sweep import HashRing, SweepCoordinator, run_worker
+from pricepal.common.work_queue import DONE, FAILED, LEASED, PENDING, WorkQueue
+from pricepal.notification.rules import RuleEngine
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = {"name": "fixture-store",
+              "fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                         "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"}}}
+
+# =====================================================================
+
+def hang_first_worker(queue_path: str, sweep: str, shard: int, spec: ExtractionSpec, cache_path: str = None, **options):
+    # The first worker started leases a task and then sleeps forever, later workers run as normal
+    marker = queue_path + ".hung"
+    if os.path.exists(marker):
+        return run_worker(queue_path, sweep, shard, spec, cache_path, **options)
+    with open(marker, "w", encoding="utf-8"):
+        pass
+    with WorkQueue(queue_path, options["lease_seconds"]) as queue:
+        queue.lease(f"{socket.gethostname()}:{os.getpid()}", sweep, shard)
+    while True:
+        time.sleep(60)
+
+def make_products(server, count: int) -> pd.DataFrame:
+    # The server is reached by two host names, which the ring may place on different shards
+    port = server.base_url.rsplit(":", 1)[1]
+    urls = [f"http://{'localhost' if i % 2 else '127.0.0.1'}:{port}/p/{i}" for i in range(count)]
+    return pd.DataFrame({"product_id": range(count), "url": urls})
+
+def test_hash_ring_moves_few_hosts():
+    hosts = [f"shop{i}.example.com" for i in range(2000)]
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+    placed = [before.shard_of(host) for host in hosts]
+    assert placed == [HashRing(range(4)).shard_of(host) for host in hosts]
+    assert min(placed.count(shard) for shard in range(4)) > 2000 / 4 * 0.6
+    moved = [host for host in hosts if before.shard_of(host) != after.shard_of(host)]
+    assert len(moved) < 2000 * 0.3 and all(after.shard_of(host) == 4 for host in moved)
+
+def test_expired_lease_passes_to_another_worker(tmp_path):
+    now = [1000.0]
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=10, max_attempts=2, clock=lambda: now[0])
+    queue.put_many("sweep", 0, [["a"], ["b"]])
+
+    first, = queue.lease("worker-1", "sweep", 0)
+    assert queue.lease("worker-2", "sweep", 0)[0].payload == ["b"]
+    assert queue.lease("worker-2", "sweep", 0) == []
+    now[0] += 11
+    retried, = queue.lease("worker-2", "sweep", 0)
+    assert (retried.id, retried.attempts) == (first.id, 2)
+    assert not queue.complete("worker-1", first.id, {"late": True})
+    assert queue.complete("worker-2", first.id, {"ok": True})
+    assert [result for _, _, result in queue.results("sweep")] == [{"ok": True}]
+
+    # A task whose lease expires on its last attempt fails, rather than running a third time
+    now[0] += 11
+    assert queue.lease("worker-3", "sweep", 0)[0].attempts == 2
+    now[0] += 11
+    assert queue.lease("worker-3", "sweep", 0) == []
+    assert queue.counts("sweep") == {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 1}
+    queue.close()
+
+def test_worker_stops_task_on_lost_lease(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(20)}
+    queue_path = str(tmp_path / "queue.sqlite3")
+    with FixtureHTTPServer(pages, latency=0.1) as server, WorkQueue(queue_path) as queue:
+        queue.put_many("sweep", 0, [[[server.url(path), [i]] for i, path in enumerate(pages)]])
+        completed = []
+        worker = threading.Thread(target=lambda: completed.append(run_worker(queue_path, "sweep", 0, spec,
+                                                                             lease_seconds=0.3, max_workers=1)))
+        worker.start()
+
+        # The task is taken from the worker, as by another worker once its lease expired
+        ends = time.monotonic() + 60
+        while len(server.requests) < 3 and time.monotonic() < ends:
+            time.sleep(0.01)
+        queue.abandon("sweep", 0, "taken")
+        worker.join(60)
+
+    assert completed == [0]
+    assert len(server.requests) < 10
+
+def test_sharded_sweep_merges_into_one_store(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(40)}
+    store = HistoryStore(str(tmp_path / "history"))
+    with FixtureHTTPServer(pages) as server, \
+         SweepCoordinator(spec, store, workers=2, queue_path=str(tmp_path / "queue.sqlite3"),
+                          cache_dir=str(tmp_path / "cache"), batch_size=7) as coordinator:
+        products = make_products(server, 40)
+        first = coordinator.run(products)
+        second = coordinator.run(products)
+        assert coordinator.queue.counts(first["sweep"]) == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+
+    assert (first["pages"], first["changed"], first["failed"]) == (40, 40, 0)
+    assert (second["changed"], second["unchanged"]) == (0, 40)
+    assert store.latest()["price_cents"].tolist() == [i * 100 for i in range(40)]
+
+def test_killed_worker_is_restarted(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(12)}
+    store = HistoryStore(str(tmp_path / "history"))
+    with FixtureHTTPServer(pages, latency=0.2) as server, \
+         SweepCoordinator(spec, store, workers=1, queue_path=str(tmp_path / "queue.sqlite3"), batch_size=4,
+                          cache_dir=str(tmp_path / "cache"), lease_seconds=1, max_workers=2) as coordinator:
+        sweep = coordinator.submit(make_products(server, 12))
+        reports = []
+        runner = threading.Thread(target=lambda: reports.append(coordinator.resume(sweep)))
+        runner.start()
+
+        # Kill the worker once a page of its first task is done, as a crash part way through a task.
+        # The retry requests the pages done again, and must not find them unchanged
+        ends = time.monotonic() + 60
+        while len(server.requests) < 3 and time.monotonic() < ends:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        _, _, owner = coordinator.queue.leases(sweep)[0]
+        os.kill(int(owner.rsplit(":", 1)[1]), signal.SIGKILL)
+        runner.join(120)
+
+    report, = reports
+    assert report["restarts"] == 1
+    assert (report["pages"], report["changed"], report["failed"]) == (12, 12, 0)
+    assert sorted(store.latest()["product_id"].tolist()) == list(range(12))
+
+def test_stopped_merge_is_not_repeated(tmp_path):
+    class Recorder:
+        def __init__(self):
+            self.alerts = []
+
+        def notify(self, receiver_email, subject, message="", row=None):
+            self.alerts.append((receiver_email, subject))
+            return True
+
+    def stop_before_purge(sweep):
+        raise KeyboardInterrupt
+
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(6)}
+    store = HistoryStore(str(tmp_path / "history"))
+    engine = RuleEngine(pd.DataFrame({"rule_id": [1], "product_id": [2], "kind": ["price_below"], "threshold": [1000],
+                                      "receiver_email": ["a@localhost"]}))
+    dispatcher = Recorder()
+    with FixtureHTTPServer(pages) as server, \
+         SweepCoordinator(spec, store, workers=2, queue_path=str(tmp_path / "queue.sqlite3"), engine=engine,
+                          dispatcher=dispatcher) as coordinator:
+        sweep = coordinator.submit(make_products(server, 6))
+        purge = coordinator.queue.purge
+        coordinator.queue.purge = stop_before_purge
+        with pytest.raises(KeyboardInterrupt):
+            coordinator.resume(sweep)
+        coordinator.queue.purge = purge
+
+        assert coordinator.unfinished() == [sweep]
+        report = coordinator.resume(sweep)
+        assert coordinator.unfinished() == []
+
+    assert report["changed"] == 6 and report["alerts"] == 0
+    assert len(store) == 6
+    assert [receiver for receiver, _ in dispatcher.alerts] == ["a@localhost"]
+
+def test_hung_worker_is_restarted(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(8)}
+    store = HistoryStore(str(tmp_path / "history"))
+    with FixtureHTTPServer(pages) as server, \
+         SweepCoordinator(spec, store, workers=1, queue_path=str(tmp_path / "queue.sqlite3"), batch_size=4,
+                          lease_seconds=1, worker=hang_first_worker) as coordinator:
+        sweep = coordinator.submit(make_products(server, 8))
+        submitted = coordinator.queue.submitted(sweep)
+        report = coordinator.resume(sweep)
+
+    assert report["restarts"] == 1
+    assert (report["pages"], report["changed"], report["failed"]) == (8, 8, 0)
+    # The sweep is recorded against the time it was submitted, not the time it was resumed
+    assert (store.latest()["ts"] == pd.Timestamp(submitted, unit="s", tz="UTC")).all()
@@ -0,0 +1,88 @@
+# Unit Test ==========================================================
+#
+# Testing for the snapshot archive. These tests archive pages fetched
+# from a local fixture server, checking that identical bodies are
+# stored once, that snapshots are recovered by url and time, and that
+# the archive is pruned to its size cap.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import os
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.snapshot_archive import SnapshotArchive
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# =====================================================================
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    with SnapshotArchive(str(tmp_path)) as archive:
+        for ts in range(5):
+            archive.add("http://shop/p", make_product_page("$19.99"), ts=ts)
+        archive.add("http://shop/q", make_product_page("$19.99"), ts=2)
+        archive.add("http://shop/p", make_product_page("$17.99"), ts=10)
+        archive.flush()
+
+        assert len(archive) == 7
+        assert archive.written == 2
+        assert archive.deduplicated == 5
+        assert [ts for ts, _ in archive.snapshots("http://shop/p")] == [0, 1, 2, 3, 4, 10]
+        assert archive.at("http://shop/p", 9) == make_product_page("$19.99")
+        assert archive.at("http://shop/p") == make_product_page("$17.99")
+        assert archive.at("http://shop/p", -1) is None
+
+    # Bodies are compressed, and the index survives reopening
+    with SnapshotArchive(str(tmp_path)) as archive:
+        assert len(archive) == 7
+        assert archive.total_bytes < len(make_product_page("$19.99")) + len(make_product_page("$17.99"))
+
+def test_archive_is_pruned_to_size_cap(tmp_path):
+    with SnapshotArchive(str(tmp_path), max_bytes=64 * 1024) as archive:
+        for ts in range(40):
+            archive.add("http://shop/p", os.urandom(4096), ts=ts)
+        archive.flush()
+
+        assert archive.total_bytes <= 64 * 1024
+        kept = archive.snapshots("http://shop/p")
+        assert 0 < len(kept) < 40
+        assert kept[-1][0] == 39
+        assert all(archive.read(digest) is not None for _, digest in kept)
+        assert len(list((tmp_path / "objects").glob("*/*.z"))) == len(kept)
+
+def test_full_queue_drops_snapshots(tmp_path):
+    archive = SnapshotArchive(str(tmp_path), max_pending=1)
+    results = [archive.add("http://shop/p", os.urandom(256 * 1024), ts=ts) for ts in range(50)]
+    archive.close()
+    assert archive.dropped == results.count(False)
+    assert archive.written == results.count(True)
+
+def test_failed_write_does_not_stop_writer(tmp_path):
+    with SnapshotArchive(str(tmp_path)) as archive:
+        archive.add("http://shop/broken", None, ts=0)
+        archive.add("http://shop/p", make_product_page("$19.99"), ts=1)
+        archive.flush()
+        assert archive.written == 1
+        assert archive.at("http://shop/p") == make_product_page("$19.99")
+
+def test_fetches_are_archived(tmp_path):
+    pages = {f"/p{index}": make_product_page(f"${index}.99") for index in range(6)}
+    with FixtureHTTPServer(pages, validators=True) as server, \
+            SnapshotArchive(str(tmp_path / "snapshots")) as archive, \
+            ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        urls = [server.url(path) for path in pages]
+        for _ in range(2):
+            assert len(list(scraper.request_content_many(urls, cache=cache, archive=archive))) == 6
+        archive.flush()
+
+        # The second sweep was answered 304, and recorded without storing a body again
+        assert len(archive) == 12
+        assert archive.written == 6
+        assert archive.at(urls[3]) == pages["/p3"]
+
+def test_output_filename_writes_raw_body(tmp_path):
+    with FixtureHTTPServer({"/p": make_product_page()}) as server:
+        scraper.request_and_parse(server.url("/p"), output_filename=str(tmp_path / "page"))
+    assert (tmp_path / "page.html").read_bytes() == make_product_page()
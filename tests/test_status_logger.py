@@ -0,0 +1,64 @@
+# Unit Test ==========================================================
+#
+# Testing for the status bar log box. These tests log at a high rate
+# from a worker thread, checking that records reach the widget only
+# when the buffer is flushed, that repeated records are coalesced and
+# that the widget and buffer stay within their bounds. The widget is
+# drawn on Qt's offscreen platform.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+import os
+import threading
+
+# Third-party Libraries
+from PyQt5 import QtWidgets
+
+# Local Application Libraries
+from pricepal.common.status_logger import QTextEditLogger
+
+# =====================================================================
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+def make_logger(name: str, **kwargs) -> tuple:
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = QtWidgets.QMainWindow()
+    handler = QTextEditLogger(window.statusBar(), **kwargs)
+    handler.setFormatter(logging.Formatter("%(levelname)s | %(message)s"))
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return app, window, handler, logger
+
+def test_records_are_flushed_in_batches():
+    app, window, handler, logger = make_logger("pricepal.test.logbox")
+    worker = threading.Thread(target=lambda: [logger.debug("Fetched 'url:%s'.", i) for i in range(1000)])
+    worker.start()
+    worker.join()
+    assert handler.widget.toPlainText() == ""
+
+    handler.flush_to_widget()
+    lines = handler.widget.toPlainText().splitlines()
+    assert lines[0] == "DEBUG | Fetched 'url:0'." and lines[-1] == "DEBUG | Fetched 'url:999'."
+    logger.removeHandler(handler)
+
+def test_repeats_are_coalesced_and_history_bounded():
+    app, window, handler, logger = make_logger("pricepal.test.bounded", max_buffered=100, max_blocks=50)
+    for _ in range(500):
+        logger.warning("Host is rate limited.")
+    logger.info("Sweep complete.")
+    handler.flush_to_widget()
+    assert handler.widget.toPlainText().splitlines() == ["WARNING | Host is rate limited. (repeated 500 times)",
+                                                         "INFO | Sweep complete."]
+
+    for i in range(1000):
+        logger.debug("Record %s", i)
+    assert handler.discarded == 900
+    handler.flush_to_widget()
+    lines = handler.widget.toPlainText().splitlines()
+    assert len(lines) <= 50 and lines[-1] == "DEBUG | Record 999"
+    logger.removeHandler(handler)
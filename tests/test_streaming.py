@@ -0,0 +1,77 @@
+# Unit Test ==========================================================
+#
+# Testing for the streaming fetch functionality. These tests will
+# exercise the StreamingExtractor of the extraction module, and
+# stream_and_extract of the scrape_engine module against a local
+# fixture server.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import logging
+
+# Third-party Libraries
+import pytest
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec, FieldRule, StreamingExtractor, extract
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+SPEC = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                                            "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"}}})
+
+# =====================================================================
+
+def test_streaming_matches_tree_extraction():
+    page = make_product_page(price="1&nbsp;299,99 &euro;", padding_bytes=5000)
+    extractor = StreamingExtractor(SPEC)
+    for start in range(0, len(page), 7):
+        extractor.feed(page[start:start + 7].decode("utf-8"))
+    assert extractor.done
+    assert extractor.values == extract(page, SPEC, "html.parser")
+
+def test_streaming_finishes_near_top_of_page():
+    page = make_product_page(padding_bytes=200000).decode("utf-8")
+    extractor = StreamingExtractor(SPEC)
+    fed = 0
+    while not extractor.done:
+        extractor.feed(page[fed:fed + 1024])
+        fed += 1024
+    assert fed <= 1024
+
+def test_streaming_ends_elements_without_end_tags():
+    spec = ExtractionSpec.from_dict({"fields": {"price": {"tag": "td", "attrs": {"class": "price"}},
+                                                "stock": {"tag": "li", "attrs": {"class": "stock"}},
+                                                "note": {"tag": "p", "attrs": {"class": "note"}}}})
+    page = ("<table><tr><td class=price>$5.<b>00</b><br/><td>other</table>"
+            "<ul><li class=stock>In stock<li>Ships today</ul><div><p class=note>Last one")
+    extractor = StreamingExtractor(spec)
+    extractor.feed(page)
+    assert extractor.values["price"] == "$5.00" and extractor.values["stock"] == "In stock"
+    assert not extractor.done
+    extractor.close()
+    assert extractor.done and extractor.values["note"] == "Last one"
+
+def test_streaming_rejects_css_selectors():
+    with pytest.raises(ValueError):
+        StreamingExtractor(ExtractionSpec({"price": FieldRule(select="span.price")}))
+
+def test_stream_and_extract_stops_at_size_limit(caplog):
+    spec = ExtractionSpec.from_dict({"fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                                                "absent": {"tag": "div", "attrs": {"id": "absent"}}}})
+    with FixtureHTTPServer({"/big": make_product_page(padding_bytes=4000000)}) as server:
+        with caplog.at_level(logging.WARNING):
+            values = scraper.stream_and_extract(server.url("/big"), spec, max_bytes=64 * 1024)
+
+    assert values == {"price": "$19.99", "absent": None}
+    assert "size limit" in caplog.text and f"bytes:{64 * 1024}'" in caplog.text
+
+def test_stream_and_extract_many():
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00", padding_bytes=100000) for i in range(6)}
+    with FixtureHTTPServer(pages) as server:
+        results = dict(scraper.stream_and_extract_many([server.url(path) for path in pages], SPEC))
+
+    assert results[server.url("/p/4")] == {"price": "$4.00", "stock": "5+"}
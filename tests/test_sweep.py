@@ -0,0 +1,119 @@
+# Unit Test ==========================================================
+#
+# Testing for region fingerprinting and the sweep pipeline. These tests
+# check that the fingerprint of a page ignores markup outside the field
+# regions, and run successive sweeps against a local fixture server,
+# checking that pages whose fields are unchanged are reported as such
+# and go no further, while changed pages reach the history store and
+# raise alerts.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import pandas as pd
+import pytest
+
+# Local Application Libraries
+import pricepal.common.scrape_engine as scraper
+from pricepal.common.extraction import ExtractionSpec, FieldRule, region_fingerprint
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.response_cache import ResponseCache
+from pricepal.common.sweep import run_sweep
+from pricepal.notification.rules import RuleEngine
+from pricepal.testing.stand_ins import FixtureHTTPServer, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = {"name": "fixture-store",
+              "fields": {"price": {"tag": "span", "attrs": {"class": "price"}},
+                         "stock": {"tag": "span", "attrs": {"class": "stock"}, "attribute": "data-stock"}}}
+
+# =====================================================================
+
+def test_fingerprint_covers_only_field_regions():
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    page = make_product_page(price="$19.99")
+    assert region_fingerprint(page, spec) is not None
+    assert region_fingerprint(page, spec) == region_fingerprint(make_product_page(price="$19.99", padding_bytes=5000), spec)
+    assert region_fingerprint(page, spec) != region_fingerprint(make_product_page(price="$18.99"), spec)
+    assert region_fingerprint(page, spec) != region_fingerprint(make_product_page(stock="4"), spec)
+
+def test_fingerprint_falls_back_when_unsure():
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    # A missing field, or a spec using css selectors, cannot be fingerprinted
+    assert region_fingerprint(b"<html><body></body></html>", spec) is None
+    assert region_fingerprint(make_product_page(), ExtractionSpec({"price": FieldRule(select="span.price")})) is None
+
+def test_unchanged_pages_are_skipped(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i + 10}.00") for i in range(4)}
+    with FixtureHTTPServer(pages) as server, ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        url = server.url("/p/0")
+        first = scraper.request_and_extract(url, spec, cache=cache, skip_unchanged=True)
+        assert first["price"] == "$10.00" and first.fingerprint is not None
+        server.pages["/p/0"] = make_product_page(price="$10.00", padding_bytes=2000)
+        # Until its fingerprint is recorded, as once its fields are stored, the page is not skipped
+        assert scraper.request_and_extract(url, spec, cache=cache, skip_unchanged=True) == first
+        cache.record_fingerprints(spec.key, {url: first.fingerprint})
+        assert scraper.request_and_extract(url, spec, cache=cache, skip_unchanged=True) == scraper.UNCHANGED
+        assert scraper.request_and_extract(url, spec, cache=cache)["price"] == "$10.00"
+
+def test_sweep_carries_only_changes_downstream(tmp_path):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i + 10}.00") for i in range(4)}
+    store = HistoryStore(str(tmp_path / "history"))
+    engine = RuleEngine(pd.DataFrame({"rule_id": [1], "product_id": [2], "kind": ["price_below"], "threshold": [1000],
+                                      "receiver_email": ["a@localhost"]}))
+    with FixtureHTTPServer(pages) as server, ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        products = pd.DataFrame({"product_id": range(4), "url": [server.url(path) for path in pages]})
+        first = run_sweep(products, spec, store, cache, engine, ts="2026-01-01")
+        assert (first["changed"], first["unchanged"], first["alerts"]) == (4, 0, 0)
+        assert len(store) == 4
+
+        # Only the padding of one page and the price of another change
+        server.pages["/p/1"] = make_product_page(price="$11.00", padding_bytes=2000)
+        server.pages["/p/2"] = make_product_page(price="$9.50")
+        second = run_sweep(products, spec, store, cache, engine, ts="2026-01-02")
+
+    assert (second["changed"], second["unchanged"], second["failed"], second["alerts"]) == (1, 3, 0, 1)
+    assert len(store) == 5
+    assert store.history(2)["price_cents"].tolist() == [1200, 950]
+
+def test_changes_survive_failed_store(tmp_path):
+    class FlakyStore(HistoryStore):
+        failures = 1
+
+        def append(self, rows):
+            if self.failures:
+                self.failures -= 1
+                raise OSError("disk full")
+            return super().append(rows)
+
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i + 10}.00") for i in range(3)}
+    store = FlakyStore(str(tmp_path / "history"))
+    with FixtureHTTPServer(pages) as server, ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        products = pd.DataFrame({"product_id": range(3), "url": [server.url(path) for path in pages]})
+        with pytest.raises(OSError):
+            run_sweep(products, spec, store, cache, ts="2026-01-01")
+        assert len(store) == 0
+        retried = run_sweep(products, spec, store, cache, ts="2026-01-02")
+
+    assert (retried["changed"], retried["unchanged"]) == (3, 0)
+    assert sorted(store.latest()["price_cents"].tolist()) == [1000, 1100, 1200]
+
+def test_pages_failing_extraction_are_not_skipped(tmp_path, monkeypatch):
+    spec = ExtractionSpec.from_dict(STORE_SPEC)
+    pages = {f"/p/{i}": make_product_page(price=f"${i + 10}.00") for i in range(3)}
+    store = HistoryStore(str(tmp_path / "history"))
+    with FixtureHTTPServer(pages) as server, ResponseCache(str(tmp_path / "cache.sqlite3")) as cache:
+        products = pd.DataFrame({"product_id": range(3), "url": [server.url(path) for path in pages]})
+        # Extraction raising after the page was fingerprinted must not leave the page to be skipped next sweep
+        with monkeypatch.context() as patched:
+            patched.setattr(scraper, "extract", lambda *args: 1 / 0)
+            failed = run_sweep(products, spec, store, cache, ts="2026-01-01")
+        retried = run_sweep(products, spec, store, cache, ts="2026-01-02")
+
+    assert (failed["changed"], failed["failed"]) == (0, 3)
+    assert (retried["changed"], retried["unchanged"]) == (3, 0)
+    assert sorted(store.latest()["price_cents"].tolist()) == [1000, 1100, 1200]
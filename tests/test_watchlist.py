@@ -0,0 +1,91 @@
+# Unit Test ==========================================================
+#
+# Testing for the watchlist. These tests check lookups, updates and
+# removal of products, loading from the history store and exporting to
+# pandas, and hold the memory per product to BYTES_PER_PRODUCT.
+#
+# Imports =============================================================
+
+# Third-party Libraries
+import numpy as np
+import pandas as pd
+
+# Local Application Libraries
+from pricepal.common.history_store import HistoryStore
+from pricepal.common.watchlist import BYTES_PER_PRODUCT, Watchlist
+
+# =====================================================================
+
+def make_products(count: int, first_id: int = 1000) -> pd.DataFrame:
+    ids = np.random.default_rng(0).permutation(np.arange(first_id, first_id + count))
+    return pd.DataFrame({"product_id": ids,
+                         "url": [f"https://shop{i % 50}.example.com/products/item-{i}" for i in ids]})
+
+def test_products_are_found_by_id():
+    watchlist = Watchlist()
+    for product_id in range(5000):
+        watchlist.add(product_id, f"https://shop{product_id % 3}.example.com/p/{product_id}")
+    watchlist.add(7, "https://other.example.com/p/7", next_due=5.0)
+
+    assert len(watchlist) == 5000 and len(watchlist.hosts) == 4
+    assert watchlist.url(4999) == "https://shop1.example.com/p/4999"
+    assert watchlist.get(7)["host"] == "https://other.example.com" and watchlist.get(7)["next_due"] == 5.0
+    assert watchlist.remove(7) and 7 not in watchlist and watchlist.get(7) is None and len(watchlist) == 4999
+    watchlist.add(7, "https://shop1.example.com/p/7")
+    assert watchlist.url(7) == "https://shop1.example.com/p/7" and len(watchlist) == 5000
+
+    watchlist.remove(3)
+    watchlist.compact()
+    assert len(watchlist) == watchlist.size == 4999 and 3 not in watchlist
+    assert watchlist.url(4998) == "https://shop0.example.com/p/4998"
+
+def test_record_and_due():
+    watchlist = Watchlist()
+    watchlist.add_many([1, 2, 3], ["https://a.example/1", "https://a.example/2", "https://b.example/3"],
+                       next_due=[30.0, 10.0, 20.0], last_price_cents=[500, None, 700])
+
+    changed = watchlist.record([1, 2, 3, 99], [500, 250, 650, 100], ts="2024-01-02",
+                               fingerprints=["ab" * 16, None, None, None])
+    assert changed.tolist() == [2, 3]
+    assert watchlist.get(1)["last_change"] is None and watchlist.get(1)["fingerprint"] == "ab" * 16
+    assert watchlist.get(3)["last_change"] == pd.Timestamp("2024-01-02", tz="UTC")
+    assert watchlist.due(now=25.0).tolist() == [2, 3]
+    assert watchlist.due(now=40.0, limit=1).tolist() == [2]
+
+    # Adding a product again replaces its url and schedule, but keeps its price unless one is given
+    watchlist.add(1, "https://c.example/1", next_due=50.0)
+    assert watchlist.get(1)["last_price_cents"] == 500 and watchlist.url(1) == "https://c.example/1"
+    assert watchlist.record([1], [500]).tolist() == [] and watchlist.get(1)["last_change"] is None
+    watchlist.add(1, "https://c.example/1", last_price_cents=450)
+    assert watchlist.get(1)["last_price_cents"] == 450
+
+    # A removed product is not recorded, and starts afresh when added again
+    watchlist.remove(3)
+    assert watchlist.record([3], [600], ts="2024-01-03").tolist() == []
+    watchlist.add(3, "https://b.example/3")
+    assert watchlist.get(3)["last_price_cents"] is None and watchlist.get(3)["last_change"] is None
+    watchlist.record([3], [600], ts="2024-01-04", fingerprints=["cd" * 16])
+    watchlist.remove(3)
+    watchlist.add_many([3], ["https://b.example/3"])
+    assert watchlist.get(3)["fingerprint"] is None and watchlist.get(3)["last_change"] is None
+
+def test_load_from_history_and_export(tmp_path):
+    products = make_products(1000)
+    store = HistoryStore(str(tmp_path / "history"))
+    store.append(pd.DataFrame({"product_id": products["product_id"][:10], "ts": pd.Timestamp("2024-01-01", tz="UTC"),
+                               "price_cents": np.arange(10) * 100, "stock": 1}))
+
+    watchlist = Watchlist.from_history(products, store)
+    frame = watchlist.to_frame()
+    assert frame["product_id"].tolist() == products["product_id"].tolist()
+    assert frame["url"].tolist() == products["url"].tolist()
+    assert frame["last_price_cents"][:10].tolist() == list(range(0, 1000, 100))
+    assert frame["last_price_cents"][10:].isna().all() and frame["last_change"][10:].isna().all()
+    assert (frame["host"].astype(str) == frame["url"].str.split("/").str[2].radd("https://")).all()
+
+def test_memory_per_product():
+    products = make_products(200000)
+    watchlist = Watchlist.from_frame(products)
+    url_bytes = len(watchlist._urls) # pylint: disable=protected-access
+    assert (watchlist.memory_bytes() - url_bytes) / len(watchlist) <= BYTES_PER_PRODUCT
+    assert url_bytes < products["url"].str.len().sum() * 0.75
@@ -0,0 +1,112 @@
+# Unit Test ==========================================================
+#
+# Testing for the GUI worker layer. These tests run workers on a Qt
+# thread pool under Qt's offscreen platform, checking that a sweep
+# streams its results and progress back through signals while the
+# event loop keeps running, that cancelling stops a sweep early, that
+# the pool caps the workers run at once, and that emails are sent in
+# the background.
+#
+# Imports =============================================================
+
+# Standard Libraries
+import os
+import threading
+import time
+
+# Third-party Libraries
+from PyQt5 import QtCore, QtWidgets
+
+# Local Application Libraries
+import pricepal.notification.notification as notification
+from pricepal.common.extraction import ExtractionSpec
+from pricepal.gui.workers import Worker, WorkerPool
+from pricepal.testing.stand_ins import FixtureHTTPServer, SMTPSink, make_product_page
+
+# Constants ===========================================================
+
+STORE_SPEC = {"name": "fixture-store", "fields": {"price": {"tag": "span", "attrs": {"class": "price"}}}}
+
+# =====================================================================
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+def run_until_done(worker: Worker, timeout: float = 20.0) -> dict:
+    # Runs the event loop until the worker ends, recording its signals and the ticks of a 60 fps timer
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    recorded = {"results": [], "progress": [], "ended": None, "ticks": 0}
+    loop = QtCore.QEventLoop()
+    timer = QtCore.QTimer()
+    timer.setInterval(16)
+    timer.timeout.connect(lambda: recorded.__setitem__("ticks", recorded["ticks"] + 1))
+    timer.start()
+    worker.signals.results.connect(recorded["results"].extend)
+    worker.signals.progress.connect(lambda done, total: recorded["progress"].append((done, total)))
+    for name in ("finished", "failed", "cancelled"):
+        signal = getattr(worker.signals, name)
+        signal.connect(lambda *value, name=name: (recorded.__setitem__("ended", (name, *value)), loop.quit()))
+    QtCore.QTimer.singleShot(int(timeout * 1000), loop.quit)
+    if not worker.is_done:
+        loop.exec_()
+    app.processEvents()
+    timer.stop()
+    return recorded
+
+def test_sweep_streams_results():
+    pages = {f"/p/{i}": make_product_page(price=f"${i}.00") for i in range(40)}
+    pool = WorkerPool()
+    with FixtureHTTPServer(pages, latency=0.02) as server:
+        worker = pool.sweep([server.url(path) for path in pages], ExtractionSpec.from_dict(STORE_SPEC), max_workers=4)
+        recorded = run_until_done(worker)
+
+    assert recorded["ended"] == ("finished", 40)
+    assert sorted(result["price"] for _, result in recorded["results"]) == sorted(f"${i}.00" for i in range(40))
+    assert recorded["progress"][-1] == (40, 40)
+    # The event loop kept running while the sweep waited on the server
+    assert recorded["ticks"] >= 5
+
+def test_cancelled_sweep_stops_early():
+    pages = {f"/p/{i}": make_product_page() for i in range(200)}
+    pool = WorkerPool()
+    with FixtureHTTPServer(pages, latency=0.05) as server:
+        worker = pool.sweep([server.url(path) for path in pages], ExtractionSpec.from_dict(STORE_SPEC), max_workers=2)
+        worker.signals.results.connect(lambda _: worker.cancel())
+        recorded = run_until_done(worker)
+
+    assert recorded["ended"] == ("cancelled",)
+    assert len(recorded["results"]) < 200
+
+def test_pool_caps_running_workers():
+    lock = threading.Lock()
+    running = {"now": 0, "most": 0}
+
+    def task():
+        with lock:
+            running["now"] += 1
+            running["most"] = max(running["most"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+        return "done"
+
+    pool = WorkerPool(max_threads=2)
+    workers = [pool.run(task) for _ in range(6)]
+    assert pool.wait(10)
+    assert running["most"] == 2
+    assert all(worker.is_done for worker in workers)
+
+def test_failure_is_reported():
+    pool = WorkerPool()
+    recorded = run_until_done(pool.run(lambda: 1 / 0))
+    assert recorded["ended"][0] == "failed" and isinstance(recorded["ended"][1], ZeroDivisionError)
+
+def test_emails_are_sent_in_background():
+    pool = WorkerPool()
+    with SMTPSink() as sink, notification.Mailer(sink.credentials()) as mailer:
+        emails = [(notification.compose_unformatted_email(f"Alert {index}", "Price dropped.", "user@localhost",
+                                                          mailer.sender_email), None) for index in range(5)]
+        recorded = run_until_done(pool.send_emails(emails, mailer))
+
+    assert recorded["ended"] == ("finished", 5)
+    assert recorded["results"] == [("user@localhost", None)] * 5
+    assert len(sink.messages) == 5